@@ -0,0 +1,200 @@
+import asyncio
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework.exceptions import Throttled
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from .auth import ClaimsJWTAuthentication, atoken_user
+from .cache import cache_entry, entry_response
+from .dashboard import (
+    ORDER_TOTALS, arun_dashboard_queries, buyer_summary, dashboard_cache_key, dashboard_params, dashboard_queries,
+    farmer_summary, recent_order_row, recent_orders_query, sales_trend_query, sales_trend_rows, trend_params,
+)
+from .fastpath import json_response, render_json
+from .models import FarmerStats, Order, Payment
+from .payments import apply_verification, payment_status_data
+from .paystack import PaystackError, PaystackUnavailable, averify_transaction
+from .sales import rebuild_farmer_stats
+from .throttling import throttle_wait
+
+# ==========================
+# Async views
+# ==========================
+# Async twins of the I/O-bound endpoints in api.views, mounted under
+# ``/api/async/``. They are plain Django async views (DRF's APIView is
+# synchronous), so authentication and rendering happen here: the JWT is
+# validated in process and the user built from its claims (api.auth). Served by
+# uvicorn, a request waiting on Paystack or on a long poll holds no thread;
+# under WSGI they still work but gain nothing.
+
+# Longest ``?wait=`` a payment status poll may hold, and its poll interval.
+MAX_WAIT = 25
+POLL_INTERVAL = 0.25
+
+_jwt = ClaimsJWTAuthentication()
+
+
+async def authenticate(request):
+    """The active user named by the request's bearer token, or None."""
+    header = _jwt.get_header(request)
+    raw = _jwt.get_raw_token(header) if header else None
+    if raw is None:
+        return None
+    try:
+        token = _jwt.get_validated_token(raw)
+    except InvalidToken:
+        return None
+    return await atoken_user(token)
+
+
+def async_api_view(methods):
+    """``@api_view`` + ``IsAuthenticated`` + the default throttles for async views."""
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return json_response({"detail": f'Method "{request.method}" not allowed.'}, status=405)
+            user = await authenticate(request)
+            if user is None:
+                return json_response({"detail": "Authentication credentials were not provided."}, status=401)
+            request.user = user
+            # Usually well under a millisecond, but BEGIN IMMEDIATE can wait up
+            # to LOCK_TIMEOUT for another process, so never on the event loop.
+            # Not thread-sensitive: it has its own connections and needn't
+            # queue behind the ORM's thread.
+            wait = await sync_to_async(throttle_wait, thread_sensitive=False)(request)
+            if wait is not None:
+                exc = Throttled(wait)
+                response = json_response({"detail": str(exc.detail)}, status=exc.status_code)
+                response["Retry-After"] = "%d" % exc.wait
+                return response
+            return await view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def get_farmer(user):
+    # Set by authenticate() either way, so this never queries.
+    return getattr(user, "farmer", None)
+
+
+# ==========================
+# Dashboard
+# ==========================
+
+@async_api_view(["GET"])
+async def dashboard(request):
+    try:
+        sections, days, bucket = dashboard_params(request.GET)
+    except ValueError as exc:
+        return json_response({"error": str(exc)}, status=400)
+
+    key = dashboard_cache_key(request.user, sections, days, bucket)
+    entry = await cache.aget(key)
+    if entry is None:
+        farmer = get_farmer(request.user)
+        queries = dashboard_queries(request.user, farmer, sections, days, bucket, timezone.localdate())
+        entry = cache_entry(render_json(await arun_dashboard_queries(queries)))
+        await cache.aset(key, entry, timeout=settings.DASHBOARD_CACHE_TIMEOUT)
+    response = entry_response(request, entry)
+    response["Cache-Control"] = "private, max-age=0"
+    return response
+
+
+@async_api_view(["GET"])
+async def recent_orders(request):
+    farmer = get_farmer(request.user)
+    return json_response([recent_order_row(order) async for order in recent_orders_query(request.user, farmer)])
+
+
+@async_api_view(["GET"])
+async def sales_trend(request):
+    farmer = get_farmer(request.user)
+    if farmer is None:
+        return json_response([])
+
+    try:
+        days, bucket = trend_params(request.GET)
+    except ValueError as exc:
+        return json_response({"error": str(exc)}, status=400)
+    today = timezone.localdate()
+    rows = [row async for row in sales_trend_query(farmer, today, days)]
+    return json_response(sales_trend_rows(rows, today, days, bucket))
+
+
+@async_api_view(["GET"])
+async def farmer_dashboard_summary(request):
+    farmer = get_farmer(request.user)
+    if farmer is None:
+        return json_response({"error": "Not a farmer"}, status=403)
+
+    stats = await FarmerStats.objects.filter(pk=farmer.pk).afirst()
+    if stats is None:
+        stats = await sync_to_async(rebuild_farmer_stats)(farmer.pk)
+    return json_response(farmer_summary(stats))
+
+
+@async_api_view(["GET"])
+async def buyer_dashboard_summary(request):
+    if get_farmer(request.user) is not None:
+        return json_response({"error": "Farmers not allowed"}, status=403)
+
+    return json_response(buyer_summary(await Order.objects.filter(user=request.user).aaggregate(**ORDER_TOTALS)))
+
+
+# ==========================
+# Payments
+# ==========================
+
+@async_api_view(["GET"])
+async def order_payment_status(request, order_id):
+    """
+    ``orders/<id>/payment/`` as a long poll: with ``?wait=N`` the answer is
+    held (up to MAX_WAIT seconds) until the payment leaves ``initializing``,
+    so the buyer's page needs one request instead of one per second.
+    """
+    try:
+        wait = min(max(float(request.GET.get("wait") or 0), 0), MAX_WAIT)
+    except ValueError:
+        wait = 0
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + wait
+    payments = Payment.objects.select_related("order", "outbox").filter(order_id=order_id, order__user=request.user)
+    while True:
+        payment = await payments.afirst()
+        if payment is None:
+            return json_response({"error": "Order not found"}, status=404)
+        data = payment_status_data(payment)
+        if data["status"] != "initializing" or loop.time() >= deadline:
+            break
+        await asyncio.sleep(POLL_INTERVAL)
+
+    response = json_response(data)
+    if data["status"] == "initializing":
+        response["Retry-After"] = "1"
+    return response
+
+
+@async_api_view(["GET"])
+async def verify_payment(request, reference):
+    payment = await Payment.objects.filter(reference=reference, order__user=request.user).afirst()
+    if payment is None:
+        return json_response({"error": "Payment not found"}, status=404)
+
+    if payment.status == "pending":
+        try:
+            data = await averify_transaction(reference)
+        except PaystackUnavailable:
+            response = json_response({"error": "Paystack is unavailable, try again shortly"}, status=503)
+            response["Retry-After"] = "5"
+            return response
+        except PaystackError:
+            data = {}
+        # Settling takes row locks in a transaction, which the async ORM
+        # can't run yet.
+        payment.status = await sync_to_async(apply_verification)(payment.pk, payment.amount, data)
+    return json_response({"payment_reference": payment.reference, "payment_status": payment.status})
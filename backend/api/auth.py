@@ -0,0 +1,231 @@
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import router
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import Farmer
+
+User = get_user_model()
+
+# ==========================
+# Token claims
+# ==========================
+# Access tokens carry what most requests need to know about their user:
+# username, role, is_staff, and the farmer id and verified flag (None and
+# False for buyers). ClaimsJWTAuthentication builds request.user from them
+# without a query, with ``user.farmer`` already in place, so
+# ``hasattr(request.user, "farmer")`` is free too. The rest of the user's
+# fields are deferred; views that need them use ``get_cached_user``.
+#
+# When a user or their farm changes (see signals.py) the time is stored in
+# ``User.claims_changed_at``. Tokens issued before it fall back to the
+# cached lookup until they expire, and refreshing reads the claims afresh.
+# Requests read that time through the cache, filled from the database on a
+# miss, so an evicted entry costs a query, never a revoked token trusted.
+# This needs a cache every worker process shares: a process-local one can't
+# tell one worker about a change made in another. So tokens are only trusted
+# with ``AUTH_TRUST_TOKEN_CLAIMS``; without it every request loads its user
+# from the database.
+
+CLAIMS = ("username", "role", "is_staff", "farmer", "verified")
+
+
+def user_claims(user):
+    farmer = getattr(user, "farmer", None)
+    return {
+        "username": user.username,
+        "role": user.role,
+        "is_staff": user.is_staff,
+        "farmer": farmer.pk if farmer is not None else None,
+        "verified": bool(farmer is not None and farmer.verified),
+    }
+
+
+def user_cache_key(user_id):
+    return f"auth:user:{user_id}"
+
+
+def changed_cache_key(user_id):
+    return f"auth:changed:{user_id}"
+
+
+def claims_trusted():
+    """Whether tokens' claims may stand in for the user; see AUTH_TRUST_TOKEN_CLAIMS."""
+    return settings.AUTH_TRUST_TOKEN_CLAIMS
+
+
+def mark_claims_changed(user_id):
+    """Stop trusting ``user_id``'s tokens issued until now, in the caller's transaction."""
+    User.objects.filter(pk=user_id).update(claims_changed_at=datetime.now(timezone.utc))
+
+
+def forget_user(user_id):
+    """
+    After a change commits: record it again at commit time (a token issued
+    while it was in flight may hold the old claims), put it in the cache and
+    drop the cached user.
+    """
+    changed_at = time.time()
+    User.objects.filter(pk=user_id).update(claims_changed_at=datetime.fromtimestamp(changed_at, timezone.utc))
+    cache.set(changed_cache_key(user_id), changed_at, timeout=settings.AUTH_USER_CACHE_TIMEOUT)
+    cache.delete(user_cache_key(user_id))
+
+
+def changed_at_from_row(row):
+    # 0 for "never changed" so it can be cached.
+    return row[0].timestamp() if row and row[0] is not None else 0
+
+
+def claims_changed_at(user_id):
+    key = changed_cache_key(user_id)
+    changed_at = cache.get(key)
+    if changed_at is None:
+        changed_at = changed_at_from_row(User.objects.filter(pk=user_id).values_list("claims_changed_at").first())
+        # add(), not set(): a reader that fetched before a change committed
+        # must not overwrite what forget_user() stored.
+        cache.add(key, changed_at, timeout=settings.AUTH_USER_CACHE_TIMEOUT)
+    return changed_at
+
+
+async def aclaims_changed_at(user_id):
+    key = changed_cache_key(user_id)
+    changed_at = await cache.aget(key)
+    if changed_at is None:
+        row = await User.objects.filter(pk=user_id).values_list("claims_changed_at").afirst()
+        changed_at = changed_at_from_row(row)
+        await cache.aadd(key, changed_at, timeout=settings.AUTH_USER_CACHE_TIMEOUT)
+    return changed_at
+
+
+def has_claims(token):
+    return all(claim in token for claim in CLAIMS)
+
+
+def claims_are_current(token, changed_at):
+    # iat is whole seconds, so a token from the second of the change is
+    # treated as older: a lookup too many, never a stale claim.
+    return token["iat"] > changed_at
+
+
+def user_from_claims(token):
+    """
+    A User with only the claimed fields loaded (the others are deferred)
+    and ``farmer`` set from the claims.
+    """
+    values = {
+        "id": token[jwt_settings.USER_ID_CLAIM],
+        "username": token["username"],
+        "role": token["role"],
+        "is_staff": token["is_staff"],
+        # Deactivating a user changes it, so its tokens stop being trusted.
+        "is_active": True,
+    }
+    db = router.db_for_read(User)
+    loaded = [field.attname for field in User._meta.concrete_fields if field.attname in values]
+    user = User.from_db(db, loaded, [values[name] for name in loaded])
+    farmer = None
+    if token["farmer"] is not None:
+        farmer = Farmer.from_db(db, ["user_id", "verified"], [token["farmer"], token["verified"]])
+        Farmer.user.field.set_cached_value(farmer, user)
+    User.farmer.related.set_cached_value(user, farmer)
+    return user
+
+
+def get_cached_user(user_id):
+    """The full user (and farmer), cached for AUTH_USER_CACHE_TIMEOUT seconds."""
+    key = user_cache_key(user_id)
+    user = cache.get(key)
+    if user is None:
+        user = User.objects.select_related("farmer").filter(pk=user_id).first()
+        if user is not None:
+            cache.set(key, user, timeout=settings.AUTH_USER_CACHE_TIMEOUT)
+    return user
+
+
+def full_user(user):
+    """``user`` with every field loaded: itself, unless it was built from claims."""
+    return get_cached_user(user.pk) if user.get_deferred_fields() else user
+
+
+async def aget_cached_user(user_id):
+    key = user_cache_key(user_id)
+    user = await cache.aget(key)
+    if user is None:
+        user = await User.objects.select_related("farmer").filter(pk=user_id).afirst()
+        if user is not None:
+            await cache.aset(key, user, timeout=settings.AUTH_USER_CACHE_TIMEOUT)
+    return user
+
+
+def token_user(token):
+    """The active user ``token`` names, from its claims when they're current."""
+    user_id = token.get(jwt_settings.USER_ID_CLAIM)
+    if user_id is None:
+        return None
+    if not claims_trusted():
+        user = User.objects.select_related("farmer").filter(pk=user_id).first()
+    elif has_claims(token) and claims_are_current(token, claims_changed_at(user_id)):
+        return user_from_claims(token)
+    else:
+        user = get_cached_user(user_id)
+    return user if user is not None and user.is_active else None
+
+
+async def atoken_user(token):
+    user_id = token.get(jwt_settings.USER_ID_CLAIM)
+    if user_id is None:
+        return None
+    if not claims_trusted():
+        user = await User.objects.select_related("farmer").filter(pk=user_id).afirst()
+    elif has_claims(token) and claims_are_current(token, await aclaims_changed_at(user_id)):
+        return user_from_claims(token)
+    else:
+        user = await aget_cached_user(user_id)
+    return user if user is not None and user.is_active else None
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication with request.user built from the token's claims."""
+
+    def get_user(self, validated_token):
+        if jwt_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken("Token contained no recognizable user identification")
+        user = token_user(validated_token)
+        if user is None:
+            raise AuthenticationFailed("User not found or inactive", code="user_not_found")
+        return user
+
+
+class ClaimsRefreshToken(RefreshToken):
+    """A refresh token whose access tokens carry current CLAIMS."""
+
+    def __init__(self, token=None, verify=True):
+        super().__init__(token, verify)
+        if token is not None:
+            # Decoded to be refreshed: it may predate a role or farm change,
+            # so take the claims from the user as they are now.
+            user = get_cached_user(self.payload.get(jwt_settings.USER_ID_CLAIM))
+            if user is not None:
+                self.payload.update(user_claims(user))
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token.payload.update(user_claims(user))
+        return token
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = ClaimsRefreshToken
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = ClaimsRefreshToken
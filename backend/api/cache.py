@@ -0,0 +1,122 @@
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+
+# ==========================
+# Catalog version counter
+# ==========================
+# Every cached catalog response is keyed on the current version. Product and
+# Farmer writes bump it (see signals.py), which orphans all older entries at
+# once instead of relying on a TTL to expire them.
+
+CATALOG_VERSION_KEY = "catalog:version"
+
+
+def _fresh_version():
+    # Seeded from the clock so an evicted counter never restarts at a value
+    # that older entries were stored under.
+    return int(time.time() * 1000)
+
+
+def get_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, _fresh_version(), timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    try:
+        return cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        version = _fresh_version()
+        cache.set(CATALOG_VERSION_KEY, version, timeout=None)
+        return version
+
+
+def catalog_cache_key(request, prefix):
+    query = urlencode(sorted(request.query_params.lists()), doseq=True)
+    renderer = getattr(request, "accepted_renderer", None)
+    raw = f"{request.path}?{query}|{getattr(renderer, 'format', '')}"
+    digest = hashlib.sha1(raw.encode()).hexdigest()
+    return f"catalog:{get_catalog_version()}:{prefix}:{digest}"
+
+
+def make_etag(content):
+    return '"%s"' % hashlib.sha256(content).hexdigest()[:32]
+
+
+def etag_matches(request, etag):
+    header = request.META.get("HTTP_IF_NONE_MATCH")
+    if not header:
+        return False
+    etags = parse_etags(header)
+    return "*" in etags or etag in etags
+
+
+def cache_entry(content, content_type="application/json"):
+    return {"etag": make_etag(content), "content": content, "content_type": content_type}
+
+
+def entry_response(request, entry):
+    """The cached ``entry``, or a 304 when the client already has it."""
+    if etag_matches(request, entry["etag"]):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(entry["content"], content_type=entry["content_type"])
+    response["ETag"] = entry["etag"]
+    return response
+
+
+def is_public_catalog_request(request):
+    user = request.user
+    return not (user.is_authenticated and hasattr(user, "farmer"))
+
+
+# ==========================
+# Cached catalog responses
+# ==========================
+
+class CatalogCacheMixin:
+    """
+    Serve ``list``/``retrieve`` for the public catalog from the cache, with a
+    strong ETag so a matching ``If-None-Match`` is answered with a 304 before
+    the queryset or serializer is touched.
+
+    Farmers see only their own products, so their requests bypass the cache.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if request.method != "GET" or not is_public_catalog_request(request):
+            return handler(request, *args, **kwargs)
+
+        key = catalog_cache_key(request, f"{self.basename}-{self.action}-{kwargs.get('pk', '')}")
+        entry = cache.get(key)
+        if entry is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            if hasattr(response, "render"):
+                # A DRF Response; the fast path returns rendered bytes already.
+                self.render_response(request, response)
+            entry = cache_entry(response.content, response["Content-Type"])
+            cache.set(key, entry, timeout=settings.CATALOG_CACHE_TIMEOUT)
+        return entry_response(request, entry)
+
+    def render_response(self, request, response):
+        response.accepted_renderer = request.accepted_renderer
+        response.accepted_media_type = request.accepted_media_type
+        response.renderer_context = self.get_renderer_context()
+        response.render()
@@ -0,0 +1,122 @@
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.utils import timezone
+from rest_framework import serializers
+
+from .models import Cart, CartSummary, Product
+
+# ==========================
+# Cart summary
+# ==========================
+# CartSummary holds each buyer's line count and total. Mutations adjust it
+# with F() deltas in the same transaction as the cart write, so reading it
+# is one primary-key lookup. A missing row is rebuilt from one aggregate;
+# product price changes drop the affected rows (see signals.py).
+
+LINE_TOTAL = ExpressionWrapper(F("quantity") * F("product__price"), output_field=DecimalField())
+
+
+def cart_totals(user_id):
+    """Line count and total for a cart in one aggregate query."""
+    totals = Cart.objects.filter(user_id=user_id).aggregate(item_count=Count("id"), total=Sum(LINE_TOTAL))
+    return totals["item_count"], totals["total"] or Decimal("0.00")
+
+
+def rebuild_cart_summary(user_id):
+    item_count, total = cart_totals(user_id)
+    summary, _ = CartSummary.objects.update_or_create(
+        user_id=user_id, defaults={"item_count": item_count, "total": total}
+    )
+    return summary
+
+
+def get_cart_summary(user_id):
+    try:
+        return CartSummary.objects.get(user_id=user_id)
+    except CartSummary.DoesNotExist:
+        return rebuild_cart_summary(user_id)
+
+
+def apply_cart_delta(user_id, lines=0, amount=Decimal("0.00")):
+    """
+    Adjust the summary after a cart write. Call inside the write's
+    transaction; falls back to a rebuild when the row doesn't exist yet.
+    """
+    updated = CartSummary.objects.filter(user_id=user_id).update(
+        item_count=F("item_count") + lines, total=F("total") + amount, updated_at=timezone.now()
+    )
+    if not updated:
+        rebuild_cart_summary(user_id)
+
+
+def clear_cart_summary(user_id):
+    CartSummary.objects.filter(user_id=user_id).update(
+        item_count=0, total=Decimal("0.00"), updated_at=timezone.now()
+    )
+
+
+def summary_data(summary):
+    return {"item_count": summary.item_count, "total": summary.total}
+
+
+def wants_minimal(request):
+    """``Prefer: return=minimal`` asks mutation endpoints for a delta response."""
+    prefer = request.META.get("HTTP_PREFER", "")
+    return "return=minimal" in [p.strip() for p in prefer.split(",")]
+
+
+# ==========================
+# Batched cart mutations
+# ==========================
+
+def apply_cart_operations(user_id, operations):
+    """
+    Apply validated ``CartBatchSerializer`` operations in order with one
+    upsert and one delete, whatever the number of lines. Call inside a
+    transaction; unknown products reject the whole batch.
+    """
+    product_ids = {op["product_id"] for op in operations}
+    found = set(Product.objects.filter(id__in=product_ids).values_list("id", flat=True))
+    missing = {
+        index: {"product_id": ["Product not found"]}
+        for index, op in enumerate(operations)
+        if op["product_id"] not in found
+    }
+    if missing:
+        raise serializers.ValidationError({"operations": missing})
+
+    existing = dict(
+        Cart.objects.select_for_update()
+        .filter(user_id=user_id, product_id__in=product_ids)
+        .values_list("product_id", "quantity")
+    )
+    # Fold the operations into a final quantity per product; None is removed.
+    final = dict(existing)
+    for op in operations:
+        product_id = op["product_id"]
+        if op["op"] == "remove":
+            final[product_id] = None
+        elif op["op"] == "set":
+            final[product_id] = op["quantity"]
+        else:
+            final[product_id] = (final.get(product_id) or 0) + op["quantity"]
+
+    upserts = [
+        Cart(user_id=user_id, product_id=product_id, quantity=quantity)
+        for product_id, quantity in final.items()
+        if quantity is not None and quantity != existing.get(product_id)
+    ]
+    removed = [product_id for product_id, quantity in final.items() if quantity is None and product_id in existing]
+
+    if upserts:
+        Cart.objects.bulk_create(
+            upserts,
+            update_conflicts=True,
+            unique_fields=["user", "product"],
+            update_fields=["quantity", "updated_at"],
+        )
+    if removed:
+        Cart.objects.filter(user_id=user_id, product_id__in=removed).delete()
+    if upserts or removed:
+        rebuild_cart_summary(user_id)
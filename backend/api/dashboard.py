@@ -0,0 +1,236 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.models import Count, Sum
+
+from .auth import full_user
+from .models import FarmerDailySales, Order, OrderItem
+from .sales import get_farmer_stats
+
+# ==========================
+# Dashboard queries
+# ==========================
+# Each dashboard endpoint is a queryset built here and a function shaping
+# its rows, so the sync views (api.views) and their async twins
+# (api.async_views) only differ in how they evaluate the query.
+
+ORDER_TOTALS = {"count": Count("id"), "total": Sum("total_amount")}
+
+
+def user_data(user):
+    return {
+        "id": user.id,
+        "username": user.username,
+        "email": user.email,
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "role": user.role,
+    }
+
+
+def farmer_order_ids(farmer):
+    # Orders containing at least one of the farmer's products, without the
+    # row fan-out of joining through items (which double counts totals).
+    return OrderItem.objects.filter(product__farmer=farmer).values("order_id")
+
+
+def recent_orders_query(user, farmer=None):
+    if farmer is not None:
+        orders = Order.objects.filter(pk__in=farmer_order_ids(farmer))
+    else:
+        orders = Order.objects.filter(user=user)
+    return orders.select_related("user").order_by("-created_at")[:5]
+
+
+def recent_order_row(order):
+    return {
+        "id": order.id,
+        "buyer": order.user.username if order.user else "N/A",
+        "total": order.total_amount,
+        "status": order.status,
+        "date": order.created_at.strftime("%Y-%m-%d"),
+    }
+
+
+def farmer_summary(stats):
+    """
+    From the farmer's FarmerStats counters (see api.sales): paid orders
+    with their products, units sold and ``sales``, their own lines' revenue.
+    """
+    return {"products": stats.products, "orders": stats.orders, "units": stats.units, "sales": stats.revenue}
+
+
+def buyer_summary(orders):
+    return {"orders": orders["count"], "spent": orders["total"] or 0}
+
+
+# ==========================
+# Sales trend
+# ==========================
+# Served from the FarmerDailySales rollup (see api.sales): one range scan
+# of at most MAX_TREND_DAYS rows, grouped into buckets here.
+
+TREND_DAYS = 7
+MAX_TREND_DAYS = 366
+TREND_BUCKETS = ("day", "week", "month")
+
+
+def trend_params(params):
+    """``(days, bucket)`` from the query string; ValueError when invalid."""
+    try:
+        days = int(params.get("days") or TREND_DAYS)
+    except ValueError:
+        raise ValueError("days must be a whole number")
+    if not 1 <= days <= MAX_TREND_DAYS:
+        raise ValueError(f"days must be between 1 and {MAX_TREND_DAYS}")
+    bucket = params.get("bucket") or "day"
+    if bucket not in TREND_BUCKETS:
+        raise ValueError(f"bucket must be one of {', '.join(TREND_BUCKETS)}")
+    return days, bucket
+
+
+def trend_start(today, days):
+    return today - timedelta(days=days - 1)
+
+
+def sales_trend_query(farmer, today, days=TREND_DAYS):
+    return (
+        FarmerDailySales.objects.filter(farmer=farmer, day__gte=trend_start(today, days), day__lte=today)
+        .values_list("day", "orders", "units", "revenue")
+    )
+
+
+def bucket_start(day, bucket):
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(start, bucket):
+    if bucket == "week":
+        return start + timedelta(days=7)
+    if bucket == "month":
+        return date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return start + timedelta(days=1)
+
+
+def sales_trend_rows(rows, today, days=TREND_DAYS, bucket="day"):
+    """
+    One entry per bucket from ``days`` ago to ``today``, empty buckets
+    included. Weeks start on Monday; the first week or month may be partial.
+    """
+    totals = {}
+    for day, orders, units, revenue in rows:
+        total = totals.setdefault(bucket_start(day, bucket), [0, 0, Decimal("0.00")])
+        total[0] += orders
+        total[1] += units
+        total[2] += revenue
+
+    label = "%b %Y" if bucket == "month" else "%b %d"
+    trend = []
+    start = bucket_start(trend_start(today, days), bucket)
+    while start <= today:
+        orders, units, revenue = totals.get(start, (0, 0, 0))
+        trend.append({
+            "date": start.strftime(label),
+            "start": start.isoformat(),
+            "orders": orders,
+            "units": units,
+            "sales": revenue,
+        })
+        start = next_bucket(start, bucket)
+    return trend
+
+
+# ==========================
+# Composite dashboard
+# ==========================
+# ``dashboard/`` answers with every section the dashboard page shows, so a
+# client authenticates once and makes one round trip. The sections don't
+# depend on each other: on PostgreSQL they run at the same time on a small
+# thread pool, each thread keeping its own connection (CONN_MAX_AGE).
+# SQLite serializes readers anyway, and inside a transaction the other
+# connections couldn't see its rows, so there they run one after another.
+# Responses are cached per user for DASHBOARD_CACHE_TIMEOUT seconds.
+
+DASHBOARD_SECTIONS = ("user", "summary", "recent_orders", "sales_trend")
+
+_pool = None
+
+
+def dashboard_params(params):
+    """``(sections, days, bucket)`` from the query string; ValueError when invalid."""
+    sections = [name for name in (params.get("sections") or "").split(",") if name] or list(DASHBOARD_SECTIONS)
+    unknown = set(sections) - set(DASHBOARD_SECTIONS)
+    if unknown:
+        raise ValueError(f"Unknown sections: {', '.join(sorted(unknown))}")
+    days, bucket = trend_params(params)
+    return [name for name in DASHBOARD_SECTIONS if name in sections], days, bucket
+
+
+def dashboard_cache_key(user, sections, days, bucket):
+    return f"dashboard:{user.pk}:{','.join(sections)}:{days}:{bucket}"
+
+
+def dashboard_queries(user, farmer, sections, days, bucket, today):
+    """Section name -> a callable returning its data."""
+    queries = {
+        # request.user may only have its token's claims loaded.
+        "user": lambda: user_data(full_user(user)),
+        "recent_orders": lambda: [recent_order_row(order) for order in recent_orders_query(user, farmer)],
+    }
+    if farmer is not None:
+        queries["summary"] = lambda: farmer_summary(get_farmer_stats(farmer.pk))
+        queries["sales_trend"] = lambda: sales_trend_rows(
+            sales_trend_query(farmer, today, days), today, days, bucket
+        )
+    else:
+        queries["summary"] = lambda: buyer_summary(Order.objects.filter(user=user).aggregate(**ORDER_TOTALS))
+        queries["sales_trend"] = lambda: []
+    return {name: queries[name] for name in sections}
+
+
+def parallel_queries(queries):
+    return (
+        len(queries) > 1
+        and settings.DASHBOARD_QUERY_THREADS > 1
+        and connection.vendor == "postgresql"
+        and not connection.in_atomic_block
+    )
+
+
+def get_query_pool():
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(settings.DASHBOARD_QUERY_THREADS, thread_name_prefix="dashboard")
+    return _pool
+
+
+def run_query(query):
+    # Pool threads outlive requests, so nothing else recycles their connections.
+    close_old_connections()
+    return query()
+
+
+def run_dashboard_queries(queries):
+    if not parallel_queries(queries):
+        return {name: query() for name, query in queries.items()}
+    futures = {name: get_query_pool().submit(run_query, query) for name, query in queries.items()}
+    return {name: future.result() for name, future in futures.items()}
+
+
+async def arun_dashboard_queries(queries):
+    if not parallel_queries(queries):
+        return await sync_to_async(run_dashboard_queries)(queries)
+    loop = asyncio.get_running_loop()
+    results = await asyncio.gather(
+        *(loop.run_in_executor(get_query_pool(), run_query, query) for query in queries.values())
+    )
+    return dict(zip(queries, results))
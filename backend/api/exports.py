@@ -0,0 +1,181 @@
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from django.db.models import F, Window
+from django.utils import timezone
+
+from .models import Order, OrderItem
+from .sales import LINE_REVENUE
+
+# ==========================
+# Order export
+# ==========================
+# Order history as CSV or NDJSON, one row per order line, for farmers'
+# accounting (their own lines) and admins (everything). The rows come from
+# one query read with ``.iterator()``, a server-side cursor on PostgreSQL,
+# and are encoded, optionally gzipped and yielded in pieces of about
+# FLUSH_BYTES. Memory stays flat however many rows there are, and the CSV
+# header and the first row go out on their own as soon as they exist.
+# Used by the ``orders/export/<format>/`` view as a StreamingHttpResponse
+# and by the ``export_orders`` command.
+#
+# A farmer's export has ``farmer_subtotal``, their own lines of the order,
+# in place of ``order_total``: other farmers' sales aren't theirs to see.
+# CSV cells a spreadsheet would read as a formula (=, +, -, @) are written
+# with a leading quote.
+
+EXPORT_FORMATS = ("csv", "ndjson")
+EXPORT_COLUMNS = (
+    "order_id", "order_date", "order_status", "buyer", "order_total",
+    "product_id", "product", "farmer_id", "quantity", "price", "line_total",
+)
+FARMER_EXPORT_COLUMNS = tuple("farmer_subtotal" if column == "order_total" else column for column in EXPORT_COLUMNS)
+CENTS = Decimal("0.01")
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+FETCH_SIZE = 2000
+FLUSH_BYTES = 64 * 1024
+CONTENT_TYPES = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+
+def parse_day(value, name):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a date (YYYY-MM-DD)")
+
+
+def export_options(params):
+    """OrderExport filters from the query string; ValueError when invalid."""
+    options = {"since": None, "until": None}
+    for name in ("since", "until"):
+        if params.get(name):
+            options[name] = parse_day(params[name], name)
+    options["status"] = params.get("status") or None
+    compress = params.get("compress") or ""
+    if compress not in ("", "gzip"):
+        raise ValueError("compress must be gzip")
+    options["compress"] = compress == "gzip"
+    return options
+
+
+def csv_safe(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def start_of(day):
+    # A range on created_at itself rather than created_at__date, which
+    # would wrap the column in a function no index can serve.
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+class OrderExport:
+    """
+    Order lines matching the filters, as ``chunks()`` of encoded bytes.
+    ``rows`` counts the lines written so far.
+    """
+
+    def __init__(self, fmt="csv", farmer_id=None, since=None, until=None, status=None, compress=False):
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+        statuses = dict(Order.STATUS_CHOICES)
+        if status is not None and status not in statuses:
+            raise ValueError(f"status must be one of {', '.join(statuses)}")
+        self.fmt = fmt
+        self.farmer_id = farmer_id
+        self.since = since
+        self.until = until
+        self.status = status
+        self.compress = compress
+        self.rows = 0
+
+    @property
+    def content_type(self):
+        return "application/gzip" if self.compress else CONTENT_TYPES[self.fmt]
+
+    @property
+    def filename(self):
+        parts = ["orders"]
+        if self.farmer_id is not None:
+            parts.append(f"farmer-{self.farmer_id}")
+        if self.since or self.until:
+            parts.append(f"{self.since or 'start'}-to-{self.until or timezone.localdate()}")
+        return "-".join(parts) + f".{self.fmt}" + (".gz" if self.compress else "")
+
+    @property
+    def columns(self):
+        return EXPORT_COLUMNS if self.farmer_id is None else FARMER_EXPORT_COLUMNS
+
+    def queryset(self):
+        items = OrderItem.objects.all()
+        total = "order__total_amount"
+        if self.farmer_id is not None:
+            # Summed over the lines the filters leave, i.e. this farmer's.
+            items = items.filter(product__farmer_id=self.farmer_id).annotate(
+                subtotal=Window(LINE_REVENUE, partition_by=[F("order_id")])
+            )
+            total = "subtotal"
+        if self.since:
+            items = items.filter(order__created_at__gte=start_of(self.since))
+        if self.until:
+            items = items.filter(order__created_at__lt=start_of(self.until + timedelta(days=1)))
+        if self.status:
+            items = items.filter(order__status=self.status)
+        return items.order_by("order_id", "id").values_list(
+            "order_id", "order__created_at", "order__status", "order__user__username", total,
+            "product_id", "product__name", "product__farmer_id", "quantity", "price",
+        )
+
+    def records(self):
+        rows = self.queryset().iterator(chunk_size=FETCH_SIZE)
+        for order_id, created_at, status, buyer, total, product_id, product, farmer_id, quantity, price in rows:
+            self.rows += 1
+            yield (
+                # Quantized: SQLite returns a computed subtotal as Decimal("100").
+                order_id, created_at.isoformat(), status, buyer, str(total.quantize(CENTS)),
+                product_id, product, farmer_id, quantity, str(price), str(price * quantity),
+            )
+
+    def text_chunks(self):
+        buffer = io.StringIO()
+
+        def take():
+            text = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            return text
+
+        if self.fmt == "csv":
+            writer = csv.writer(buffer)
+            writer.writerow(self.columns)
+            yield take()
+
+            def write(record):
+                writer.writerow([csv_safe(value) for value in record])
+        else:
+            def write(record):
+                buffer.write(json.dumps(dict(zip(self.columns, record)), ensure_ascii=False) + "\n")
+        for number, record in enumerate(self.records()):
+            write(record)
+            # The first row on its own, then FLUSH_BYTES at a time.
+            if number == 0 or buffer.tell() >= FLUSH_BYTES:
+                yield take()
+        if buffer.tell():
+            yield take()
+
+    def chunks(self):
+        if not self.compress:
+            for text in self.text_chunks():
+                yield text.encode()
+            return
+        # wbits=31: a gzip stream. Each piece is sync-flushed so it reaches
+        # the client now rather than when the compressor's window fills.
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        for text in self.text_chunks():
+            yield compressor.compress(text.encode()) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
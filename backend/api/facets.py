@@ -0,0 +1,64 @@
+from collections import Counter
+from decimal import Decimal
+
+from django.db.models import Case, Count, IntegerField, Value, When
+
+from .models import Product
+
+# ==========================
+# Catalog facets
+# ==========================
+
+# Lower bounds (KSH) of the price histogram buckets; the last is open ended.
+PRICE_BUCKETS = [Decimal(edge) for edge in (0, 50, 100, 250, 500, 1000, 5000)]
+TOP_FARMERS = 20
+
+
+def price_bucket():
+    whens = [
+        When(price__lt=upper, then=Value(index))
+        for index, upper in enumerate(PRICE_BUCKETS[1:])
+    ]
+    return Case(*whens, default=Value(len(PRICE_BUCKETS) - 1), output_field=IntegerField())
+
+
+def compute_facets(queryset):
+    """
+    Category counts, a price histogram and per-farmer counts for
+    ``queryset`` from a single ``GROUP BY category, bucket, farmer`` query,
+    folded into the three facets in Python.
+    """
+    rows = (
+        queryset.order_by()
+        .annotate(price_bucket=price_bucket())
+        .values("category", "price_bucket", "farmer_id", "farmer__farm_name")
+        .annotate(count=Count("id"))
+    )
+
+    categories, buckets, farmers, names = Counter(), Counter(), Counter(), {}
+    for row in rows:
+        categories[row["category"]] += row["count"]
+        buckets[row["price_bucket"]] += row["count"]
+        farmers[row["farmer_id"]] += row["count"]
+        names[row["farmer_id"]] = row["farmer__farm_name"]
+
+    return {
+        "total": sum(categories.values()),
+        "categories": [
+            {"value": value, "label": label, "count": categories[value]}
+            for value, label in Product.CATEGORY_CHOICES
+        ],
+        "price": [
+            {
+                "min": str(lower),
+                "max": str(PRICE_BUCKETS[index + 1]) if index + 1 < len(PRICE_BUCKETS) else None,
+                "count": buckets[index],
+            }
+            for index, lower in enumerate(PRICE_BUCKETS)
+        ],
+        "farmer_count": len(farmers),
+        "farmers": [
+            {"id": farmer_id, "farm_name": names[farmer_id], "count": count}
+            for farmer_id, count in farmers.most_common(TOP_FARMERS)
+        ],
+    }
@@ -0,0 +1,215 @@
+import json
+import multiprocessing
+import random
+import re
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ==========================
+# Fake Paystack server
+# ==========================
+# Enough of the Paystack API for tests and load runs: transaction
+# initialize and verify, with configurable latency and failure rates.
+# Point PAYSTACK_BASE_URL at it, e.g. via ``manage.py fake_paystack``.
+
+VERIFY_RE = re.compile(r"^/transaction/verify/(?P<reference>[^/?]+)/?$")
+
+
+class FakePaystackHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so clients exercise their connection pool.
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without TCP_NODELAY each
+    # keep-alive response stalls ~40ms on delayed ACKs.
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        fake = self.server.fake
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        if self.path.rstrip("/") != "/transaction/initialize":
+            return self.reply(404, {"status": False, "message": "Not found"})
+        if not self.authorized():
+            return
+        fake.simulate_latency()
+        failure = fake.pick_failure()
+        if failure:
+            return self.reply(*failure)
+        try:
+            body = json.loads(raw or b"{}")
+        except ValueError:
+            return self.reply(400, {"status": False, "message": "Invalid JSON"})
+        status, payload = fake.initialize(body, base_url=fake.base_url)
+        self.reply(status, payload)
+
+    def do_GET(self):
+        fake = self.server.fake
+        match = VERIFY_RE.match(self.path)
+        if not match:
+            return self.reply(404, {"status": False, "message": "Not found"})
+        if not self.authorized():
+            return
+        fake.simulate_latency()
+        failure = fake.pick_failure()
+        if failure:
+            return self.reply(*failure)
+        self.reply(*fake.verify(match["reference"]))
+
+    def authorized(self):
+        key = self.server.fake.secret_key
+        if key and self.headers.get("Authorization") != f"Bearer {key}":
+            self.reply(401, {"status": False, "message": "Invalid key"})
+            return False
+        return True
+
+    def reply(self, status, payload):
+        content = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        if self.server.fake.verbose:
+            super().log_message(format, *args)
+
+
+class FakePaystackServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops bursts of new connections into SYN
+    # retries, which shows up as seconds of latency under load.
+    request_queue_size = 256
+
+
+class FakePaystack:
+    """
+    Run the fake in a background thread::
+
+        with FakePaystack(secret_key="sk_test") as paystack:
+            with override_settings(PAYSTACK_BASE_URL=paystack.base_url):
+                ...
+
+    ``failure_rate`` answers that share of requests with a 503, and
+    ``decline_rate`` with a ``{"status": false}`` refusal.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, secret_key=None, latency=0.0,
+                 failure_rate=0.0, decline_rate=0.0, verbose=False):
+        self.host = host
+        self.port = port
+        self.secret_key = secret_key
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.decline_rate = decline_rate
+        self.verbose = verbose
+        self.transactions = {}
+        self.request_count = 0
+        self.lock = threading.Lock()
+        self.server = None
+        self.thread = None
+        self.process = None
+        self.address = None
+
+    @property
+    def base_url(self):
+        host, port = self.address
+        return f"http://{host}:{port}"
+
+    def start(self, process=False):
+        """
+        Serve from a background thread, or with ``process=True`` from a
+        forked child so load runs don't share the GIL with the client. The
+        child serves a snapshot: later changes to ``transactions`` and its
+        ``request_count`` aren't visible here.
+        """
+        self.server = FakePaystackServer((self.host, self.port), FakePaystackHandler)
+        self.server.fake = self
+        self.address = self.server.server_address[:2]
+        if process:
+            self.process = multiprocessing.get_context("fork").Process(target=self.server.serve_forever, daemon=True)
+            self.process.start()
+            self.server.server_close()
+            self.server = None
+        else:
+            self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        if self.process:
+            self.process.terminate()
+            self.process.join()
+            self.process = None
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def simulate_latency(self):
+        with self.lock:
+            self.request_count += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def pick_failure(self):
+        roll = random.random()
+        if roll < self.failure_rate:
+            return 503, {"status": False, "message": "Service unavailable"}
+        if roll < self.failure_rate + self.decline_rate:
+            return 400, {"status": False, "message": "Transaction declined"}
+        return None
+
+    def initialize(self, body, base_url):
+        reference = body.get("reference") or secrets.token_hex(8)
+        amount = body.get("amount")
+        if not body.get("email") or not isinstance(amount, int) or amount <= 0:
+            return 400, {"status": False, "message": "Invalid email or amount"}
+        with self.lock:
+            if reference in self.transactions:
+                return 400, {"status": False, "message": "Duplicate Transaction Reference"}
+            access_code = secrets.token_hex(6)
+            self.transactions[reference] = {
+                "reference": reference,
+                "amount": amount,
+                "email": body["email"],
+                "status": "abandoned",
+                "access_code": access_code,
+            }
+        return 200, {
+            "status": True,
+            "message": "Authorization URL created",
+            "data": {
+                "authorization_url": f"{base_url}/checkout/{access_code}",
+                "access_code": access_code,
+                "reference": reference,
+            },
+        }
+
+    def verify(self, reference):
+        with self.lock:
+            transaction = self.transactions.get(reference)
+            if transaction is None:
+                return 400, {"status": False, "message": "Transaction reference not found"}
+            data = dict(transaction)
+        return 200, {"status": True, "message": "Verification successful", "data": data}
+
+    def add_transaction(self, reference, amount, status="success", email="buyer@example.com"):
+        """Seed a transaction as if it had been initialized (and paid) earlier."""
+        with self.lock:
+            self.transactions[reference] = {
+                "reference": reference, "amount": amount, "email": email,
+                "status": status, "access_code": secrets.token_hex(6),
+            }
+
+    def settle(self, reference, status="success"):
+        """Mark a transaction as the buyer completing (or failing) payment."""
+        with self.lock:
+            self.transactions[reference]["status"] = status
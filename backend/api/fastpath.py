@@ -0,0 +1,172 @@
+import json
+from decimal import Decimal
+from functools import partial
+
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import ISO_8601, api_settings
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the stdlib encoder
+    orjson = None
+
+# ==========================
+# Serializer-free read path
+# ==========================
+# For read-only list endpoints, fetch ``.values()`` rows and convert them
+# with a spec compiled once from the serializer's own field definitions,
+# skipping model instantiation and the per-field ``to_representation`` walk.
+# The rendered bytes are identical to ``JSONRenderer`` output.
+
+# Fields whose representation of a ``.values()`` value is the value itself.
+PASSTHROUGH_FIELDS = (
+    serializers.CharField,
+    serializers.IntegerField,
+    serializers.BooleanField,
+    serializers.ChoiceField,
+    serializers.PrimaryKeyRelatedField,
+)
+
+
+def iso_datetime_converter(field):
+    """
+    ``DateTimeField.to_representation`` with the timezone resolved once per
+    batch instead of once per value (the per-value lookup dominates).
+    """
+    tz = field.timezone if hasattr(field, "timezone") else field.default_timezone()
+    if tz is None:
+        return field.to_representation
+
+    def convert(value):
+        value = value.astimezone(tz).isoformat()
+        return value[:-6] + "Z" if value.endswith("+00:00") else value
+    return convert
+
+
+def is_iso_datetime(field):
+    return (
+        isinstance(field, serializers.DateTimeField)
+        and getattr(field, "format", api_settings.DATETIME_FORMAT) == ISO_8601
+    )
+
+
+class ValuesSpec:
+    """
+    ``(output name, values() lookup, converter)`` for each readable field of
+    a serializer. ``converter`` is None when the raw value is already the
+    representation; converter factories (e.g. datetimes) are resolved per
+    ``to_dicts`` call.
+    """
+
+    def __init__(self, fields, factories=None):
+        self.fields = fields
+        self.factories = factories or {}
+        self.lookups = [lookup for _, lookup, _ in fields]
+
+    @classmethod
+    def from_serializer(cls, serializer_class, field_names=None):
+        fields, factories = [], {}
+        # A SparseFieldsMixin serializer builds just the selected fields,
+        # including any expandable ones left out by default.
+        kwargs = {"fields": field_names} if hasattr(serializer_class, "get_all_fields") else {}
+        for name, field in serializer_class(**kwargs).fields.items():
+            if field.write_only or (field_names is not None and name not in field_names):
+                continue
+            if isinstance(field, (serializers.BaseSerializer, serializers.SerializerMethodField)):
+                raise ValueError(f"{serializer_class.__name__}.{name} can't be read from values()")
+            if field.source == "*":
+                raise ValueError(f"{serializer_class.__name__}.{name} uses source='*'")
+            lookup = "__".join(field.source_attrs)
+            converter = None if isinstance(field, PASSTHROUGH_FIELDS) else field.to_representation
+            if is_iso_datetime(field):
+                factories[name] = partial(iso_datetime_converter, field)
+            fields.append((name, lookup, converter))
+        return cls(fields, factories)
+
+    def values(self, queryset, *extra):
+        return queryset.values(*self.lookups, *[e for e in extra if e not in self.lookups])
+
+    def to_dicts(self, rows):
+        fields = self.fields
+        if self.factories:
+            fields = [
+                (name, lookup, self.factories[name]() if name in self.factories else converter)
+                for name, lookup, converter in fields
+            ]
+        return [
+            {
+                name: value if converter is None or value is None else converter(value)
+                for name, lookup, converter in fields
+                for value in (row[lookup],)
+            }
+            for row in rows
+        ]
+
+
+_specs = {}
+
+
+def get_values_spec(serializer_class, field_names=None):
+    key = (serializer_class, tuple(field_names) if field_names is not None else None)
+    if key not in _specs:
+        _specs[key] = ValuesSpec.from_serializer(serializer_class, field_names)
+    return _specs[key]
+
+
+def _default(obj):
+    # Mirrors rest_framework.utils.encoders.JSONEncoder for what can reach
+    # the top level of a payload (e.g. a cart total).
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def render_json(data):
+    """Render ``data`` exactly as DRF's JSONRenderer does with default settings."""
+    if orjson is not None:
+        content = orjson.dumps(data, default=_default)
+    else:
+        content = json.dumps(
+            data, default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+        ).encode()
+    # JSONRenderer escapes these so the output is also valid JavaScript.
+    return content.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+
+
+def json_response(data, status=200):
+    return HttpResponse(render_json(data), status=status, content_type=JSONRenderer.media_type)
+
+
+def fast_path_enabled(request):
+    renderer = getattr(request, "accepted_renderer", None)
+    return (
+        settings.API_FAST_PATH
+        and request.method == "GET"
+        and type(renderer) is JSONRenderer
+    )
+
+
+class FastListMixin:
+    """
+    ``list()`` through ``ValuesSpec`` when the client negotiated plain JSON;
+    anything else (browsable API, other renderers) takes the normal path.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if not fast_path_enabled(request):
+            return super().list(request, *args, **kwargs)
+        spec = self.values_spec()
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = spec.values(queryset, *queryset.query.annotations)
+
+        page = self.paginate_queryset(rows)
+        if page is None:
+            return json_response(spec.to_dicts(rows))
+        response = self.get_paginated_response(spec.to_dicts(page))
+        return json_response(response.data)
+
+    def values_spec(self):
+        return get_values_spec(self.get_serializer_class())
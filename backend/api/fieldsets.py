@@ -0,0 +1,164 @@
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.exceptions import ParseError
+
+from .fastpath import get_values_spec
+
+# ==========================
+# Sparse fieldsets
+# ==========================
+# ``?fields=id,name,price`` limits a response to the named fields, and
+# ``?expand=farmer_name`` adds fields a serializer leaves out by default
+# (its ``Meta.expandable_fields``, usually the ones needing a join). The
+# selection also narrows the queryset: ``select_related`` follows only the
+# relations the remaining fields read and ``only()`` loads only their
+# columns, so a field nobody asked for costs neither a join nor a column.
+# The fast path reads the same selection through ``get_values_spec``.
+
+
+def parse_names(value):
+    return [name.strip() for name in (value or "").split(",") if name.strip()]
+
+
+class SparseFieldsMixin:
+    """
+    Serializer mixin: ``fields=[...]`` picks the fields to use, otherwise
+    every field but those in ``Meta.expandable_fields``.
+    """
+
+    def __init__(self, *args, fields=None, **kwargs):
+        self.selected_fields = fields
+        super().__init__(*args, **kwargs)
+
+    def get_all_fields(self):
+        return super().get_fields()
+
+    def get_fields(self):
+        fields = self.get_all_fields()
+        names = self.selected_fields
+        if names is None:
+            expandable = getattr(self.Meta, "expandable_fields", ())
+            names = [name for name in fields if name not in expandable]
+        return {name: field for name, field in fields.items() if name in names}
+
+
+def field_selection(serializer_class, params):
+    """
+    The field names ``?fields=`` and ``?expand=`` select from
+    ``serializer_class``, in declaration order, or None when neither is
+    given. ValueError for names it doesn't have.
+    """
+    fields, expand = parse_names(params.get("fields")), parse_names(params.get("expand"))
+    if not fields and not expand:
+        return None
+    available = list(serializer_class().get_all_fields())
+    expandable = getattr(serializer_class.Meta, "expandable_fields", ())
+    unknown = [name for name in fields if name not in available]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    unknown = [name for name in expand if name not in expandable]
+    if unknown:
+        raise ValueError(f"Can't expand: {', '.join(unknown)}. Expandable: {', '.join(expandable) or 'none'}")
+    chosen = set(fields or [name for name in available if name not in expandable]) | set(expand)
+    return tuple(name for name in available if name in chosen)
+
+
+def lookup_path(model, attrs):
+    """
+    The forward relations to join to read ``attrs`` off ``model``, and the
+    ``only()`` lookup of the value. FieldDoesNotExist for anything else
+    (properties, reverse relations...).
+    """
+    relations = []
+    for depth, attr in enumerate(attrs):
+        field = model._meta.get_field(attr)
+        if not field.concrete:
+            raise FieldDoesNotExist(f"{model.__name__}.{attr} is not a column")
+        if depth < len(attrs) - 1:
+            if not field.is_relation:
+                raise FieldDoesNotExist(f"{model.__name__}.{attr} is not a relation")
+            relations.append("__".join(attrs[:depth + 1]))
+            model = field.related_model
+    return relations, "__".join(attrs)
+
+
+def read_paths(serializer, model, annotations, prefix=()):
+    """``(relations, columns)`` the readable fields of ``serializer`` load."""
+    relations, columns = set(), set()
+    for field in serializer.fields.values():
+        if field.write_only or isinstance(field, serializers.ListSerializer):
+            # Nested lists are prefetched by the view, which only needs the pk.
+            continue
+        if field.source == "*" or isinstance(field, serializers.SerializerMethodField):
+            raise FieldDoesNotExist(f"{field.field_name} reads the whole instance")
+        attrs = prefix + tuple(field.source_attrs)
+        if not prefix and attrs[0] in annotations:
+            continue
+        joins, column = lookup_path(model, attrs)
+        relations.update(joins)
+        columns.add(column)
+        if isinstance(field, serializers.BaseSerializer):
+            relations.add(column)
+            nested_relations, nested_columns = read_paths(field, model, annotations, attrs)
+            relations |= nested_relations
+            columns |= nested_columns
+    return relations, columns
+
+
+def narrow_queryset(queryset, serializer_class, fields=None, extra=()):
+    """
+    ``queryset`` joining and loading only what ``serializer_class`` with
+    these ``fields`` reads, plus the ``extra`` lookups (e.g. the ordering).
+    Unchanged when a field reads something ``only()`` can't name.
+    """
+    annotations = queryset.query.annotations
+    try:
+        relations, columns = read_paths(serializer_class(fields=fields), queryset.model, annotations)
+        for lookup in extra:
+            if lookup not in annotations:
+                joins, column = lookup_path(queryset.model, tuple(lookup.split("__")))
+                relations.update(joins)
+                columns.add(column)
+    except FieldDoesNotExist:
+        return queryset
+    # A relation that is joined must be loaded too, or only() refuses it.
+    queryset = queryset.select_related(None)
+    if relations:
+        queryset = queryset.select_related(*sorted(relations))
+    return queryset.only(*sorted(columns | relations))
+
+
+class SparseFieldsViewMixin:
+    """
+    ``?fields=``/``?expand=`` for a GenericAPIView's GET requests: passed to
+    its serializer and to FastListMixin, and used to narrow the queryset of
+    ``list`` and ``retrieve``.
+    """
+
+    def get_field_selection(self):
+        if self.request.method != "GET":
+            return None
+        if not hasattr(self, "_field_selection"):
+            try:
+                self._field_selection = field_selection(self.get_serializer_class(), self.request.query_params)
+            except ValueError as exc:
+                raise ParseError(str(exc))
+        return self._field_selection
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault("fields", self.get_field_selection())
+        return super().get_serializer(*args, **kwargs)
+
+    def values_spec(self):
+        return get_values_spec(self.get_serializer_class(), self.get_field_selection())
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.request.method != "GET" or self.action not in ("list", "retrieve"):
+            return queryset
+        # The page's position is read off the last row, so its ordering
+        # field is loaded whether or not it is in the response.
+        extra = []
+        if hasattr(self.paginator, "get_ordering"):
+            extra.append(self.paginator.get_ordering(queryset, self).lstrip("-"))
+        return narrow_queryset(queryset, self.get_serializer_class(), self.get_field_selection(), extra)
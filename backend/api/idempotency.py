@@ -0,0 +1,94 @@
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+# ==========================
+# Idempotency keys
+# ==========================
+# A request carrying an ``Idempotency-Key`` header runs at most once per user
+# and key; repeats get the first response back. A repeat of a finished
+# request costs one indexed lookup. The key row is inserted in the same
+# transaction as the view's writes, so a concurrent duplicate blocks on the
+# unique constraint until the first commits and then replays its response,
+# and a failed request leaves no key behind to be retried with.
+
+HEADER = "Idempotency-Key"
+
+
+def request_fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    raw = f"{request.method} {request.path}\n{body}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def replay(record):
+    response = Response(record.response, status=record.status_code)
+    response["Idempotent-Replayed"] = "true"
+    if record.location:
+        response["Location"] = record.location
+    return response
+
+
+def mismatch():
+    return Response({"error": f"{HEADER} was already used for a different request"}, status=422)
+
+
+def idempotent(view):
+    """
+    Decorate a function view (under ``@api_view``) so ``Idempotency-Key``
+    retries replay the stored 2xx response instead of running it again.
+    Error responses aren't stored; the client may retry them with the same key.
+    """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key or not request.user.is_authenticated:
+            return view(request, *args, **kwargs)
+        if len(key) > 255:
+            return Response({"error": f"{HEADER} must be at most 255 characters"}, status=400)
+
+        now = timezone.now()
+        fingerprint = request_fingerprint(request)
+        record = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+        if record is not None and record.expires_at > now:
+            return replay(record) if record.fingerprint == fingerprint else mismatch()
+
+        with transaction.atomic():
+            if record is not None:
+                record.delete()
+            try:
+                with transaction.atomic():
+                    record = IdempotencyKey.objects.create(
+                        user=request.user, key=key, fingerprint=fingerprint,
+                        expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+                    )
+            except IntegrityError:
+                # A concurrent duplicate committed first.
+                record = IdempotencyKey.objects.get(user=request.user, key=key)
+                return replay(record) if record.fingerprint == fingerprint else mismatch()
+
+            response = view(request, *args, **kwargs)
+            if 200 <= response.status_code < 300:
+                record.status_code = response.status_code
+                record.response = response.data
+                record.location = response.get("Location", "")
+                record.save(update_fields=["status_code", "response", "location"])
+            else:
+                record.delete()
+        return response
+
+    return wrapper
+
+
+def purge_expired_keys(now=None):
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=now or timezone.now()).delete()
+    return deleted
@@ -0,0 +1,154 @@
+import csv
+import io
+import json
+
+from django.db import transaction
+from rest_framework import serializers
+
+from .cache import bump_catalog_version
+from .models import CartSummary, Product
+from .sales import apply_product_delta
+from .serializers import ProductSerializer
+
+# ==========================
+# Bulk product import
+# ==========================
+
+FORMATS = ("csv", "ndjson")
+
+
+def detect_format(filename, requested=None):
+    fmt = (requested or "").lower()
+    if not fmt and filename:
+        fmt = "ndjson" if filename.lower().endswith((".ndjson", ".jsonl")) else "csv"
+    if fmt not in FORMATS:
+        raise serializers.ValidationError({"format": f"Expected one of {', '.join(FORMATS)}"})
+    return fmt
+
+
+def iter_rows(binary_file, fmt):
+    """
+    Yield ``(row_number, row)`` pairs from a binary file object one line at
+    a time, so the upload is never held in memory as a whole. Rows that
+    can't be parsed are yielded as ``(row_number, ValueError)``.
+    """
+    text = io.TextIOWrapper(binary_file, encoding="utf-8-sig", newline="")
+    try:
+        if fmt == "csv":
+            for number, row in enumerate(csv.DictReader(text), start=1):
+                yield number, row
+        else:
+            number = 0
+            for line in text:
+                if not line.strip():
+                    continue
+                number += 1
+                try:
+                    row = json.loads(line)
+                    if not isinstance(row, dict):
+                        raise ValueError("Each line must be a JSON object")
+                except ValueError as exc:
+                    row = ValueError(str(exc))
+                yield number, row
+    finally:
+        # Don't let the wrapper close the caller's file.
+        text.detach()
+
+
+class ProductImporter:
+    """
+    Validate rows with ``ProductSerializer`` and write them in batches. Each
+    batch commits on its own, so memory stays flat however long the upload is.
+
+    A row named like one of the farmer's products updates it, so importing
+    a catalog again changes prices and stock instead of duplicating it.
+    Names aren't unique per farmer (nothing stops two "Kale" listings), so
+    this can't be ``bulk_create(update_conflicts=True)``: each batch looks
+    its names up, ``bulk_update``s the oldest match and ``bulk_create``s
+    the rest. The last of several rows with one name wins.
+
+    Bulk writes skip the post_save signals, so the catalog version is
+    bumped once at the end instead, and the farmer's product counter and
+    the cart summaries of updated products are handled per batch.
+    """
+
+    def __init__(self, farmer, batch_size=1000, max_errors=1000, dry_run=False):
+        self.farmer = farmer
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.dry_run = dry_run
+        # One serializer reused for every row: building the field map is the
+        # expensive part of a ModelSerializer, validating a row is cheap.
+        self.serializer = ProductSerializer()
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+
+    def run(self, rows):
+        batch = []
+        for number, row in rows:
+            data = self.validate(number, row)
+            if data is None:
+                continue
+            batch.append(data)
+            if len(batch) >= self.batch_size:
+                self.flush(batch)
+                batch = []
+        self.flush(batch)
+        if self.created or self.updated:
+            transaction.on_commit(bump_catalog_version)
+        return self.report()
+
+    def validate(self, number, row):
+        if isinstance(row, Exception):
+            self.add_error(number, {"non_field_errors": [str(row)]})
+            return None
+        try:
+            data = self.serializer.run_validation(row)
+        except serializers.ValidationError as exc:
+            self.add_error(number, exc.detail)
+            return None
+        return data
+
+    def flush(self, batch):
+        if not batch:
+            return
+        rows = {data.get("name", ""): data for data in batch}
+        existing = {}
+        for product in Product.objects.filter(farmer=self.farmer, name__in=rows).order_by("pk"):
+            existing.setdefault(product.name, product)
+
+        updates, fields = [], set()
+        for name, product in existing.items():
+            for field, value in rows.pop(name).items():
+                setattr(product, field, value)
+                fields.add(field)
+            updates.append(product)
+        creates = [Product(farmer=self.farmer, **data) for data in rows.values()]
+
+        if not self.dry_run:
+            with transaction.atomic():
+                if updates:
+                    Product.objects.bulk_update(updates, sorted(fields))
+                    CartSummary.objects.filter(user__cart__product__in=updates).delete()
+                if creates:
+                    Product.objects.bulk_create(creates)
+                    apply_product_delta(self.farmer.pk, len(creates))
+        self.created += len(creates)
+        self.updated += len(updates)
+
+    def add_error(self, number, detail):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"row": number, "errors": detail})
+
+    def report(self):
+        return {
+            "created": self.created,
+            "updated": self.updated,
+            "failed": self.failed,
+            "dry_run": self.dry_run,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
@@ -0,0 +1,139 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.utils import timezone
+
+from .cache import bump_catalog_version
+from .models import Order, Product, StockReservation
+
+# ==========================
+# Stock reservations
+# ==========================
+# Checkout takes stock with a conditional ``UPDATE ... SET stock = stock - n
+# WHERE stock >= n`` over the whole cart's id list, so there is no
+# read-then-write window. A multi-row UPDATE locks rows in whatever order
+# its plan visits them, so where the database has row locks the rows are
+# first locked ``FOR UPDATE`` in id order: two multi-item carts always lock
+# in the same order and can't deadlock on each other.
+#
+# Those locks are held until the caller's transaction commits. In checkout
+# that is the rest of the order: the order items, the cart delete, the
+# Payment and its outbox entry (Paystack itself is called after commit).
+# Concurrent checkouts of a popular product queue behind each other for
+# that long, so keep what runs after reserve_stock() in that transaction
+# short. SQLite has no row locks; its database write lock serializes
+# checkouts for the same span.
+#
+# A product whose ``stock`` is NULL doesn't track it (every product listed
+# before reservations existed, until its farmer sets a number): the
+# condition lets it through and ``NULL - n`` leaves it NULL. It is still
+# reserved, so releasing it is the same no-op.
+#
+# ``stock`` is part of the cached catalog responses, and update() sends no
+# signals, so taking or returning stock bumps the catalog version itself.
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_id, requested):
+        self.product_id = product_id
+        self.requested = requested
+        super().__init__(f"Not enough stock for product {product_id} (requested {requested})")
+
+
+def _short_line(stock, product_ids, wanted):
+    """The first product in ``stock`` (id -> stock) that can't cover its line, or None."""
+    for product_id in product_ids:
+        if product_id not in stock or (stock[product_id] is not None and stock[product_id] < wanted[product_id]):
+            return product_id
+    return None
+
+
+def reserve_stock(order, lines, ttl=None):
+    """
+    Hold stock for ``lines`` (``(product_id, quantity)`` pairs) against
+    ``order``. Either every line is reserved or ``InsufficientStock`` is
+    raised and nothing is.
+    """
+    wanted = Counter()
+    for product_id, quantity in lines:
+        wanted[product_id] += quantity
+
+    ttl = ttl if ttl is not None else timedelta(seconds=settings.STOCK_RESERVATION_TTL)
+    expires_at = timezone.now() + ttl
+    product_ids = sorted(wanted)
+    requested = Case(
+        *[When(pk=product_id, then=Value(wanted[product_id])) for product_id in product_ids],
+        output_field=IntegerField(),
+    )
+
+    try:
+        with transaction.atomic():
+            if connection.features.has_select_for_update:
+                locked = Product.objects.select_for_update().filter(pk__in=product_ids).order_by("pk")
+                short = _short_line(dict(locked.values_list("pk", "stock")), product_ids, wanted)
+                if short is not None:
+                    raise InsufficientStock(short, wanted[short])
+            # Without row locks (SQLite) the write lock, taken by this
+            # UPDATE, serializes checkouts, and the condition checks the stock.
+            available = Q(stock__isnull=True) | Q(stock__gte=requested)
+            taken = Product.objects.filter(available, pk__in=product_ids).update(stock=F("stock") - requested)
+            if taken != len(product_ids):
+                raise InsufficientStock(None, None)
+            transaction.on_commit(bump_catalog_version)
+            return StockReservation.objects.bulk_create([
+                StockReservation(order=order, product_id=product_id, quantity=wanted[product_id], expires_at=expires_at)
+                for product_id in product_ids
+            ])
+    except InsufficientStock as exc:
+        if exc.product_id is not None:
+            raise
+        # Rolled back; look up which line was short for the error.
+        stock = dict(Product.objects.filter(pk__in=product_ids).values_list("pk", "stock"))
+        short = _short_line(stock, product_ids, wanted) or product_ids[0]
+        raise InsufficientStock(short, wanted[short])
+
+
+def commit_reservations(order):
+    """The order is paid: the held stock is sold."""
+    return StockReservation.objects.filter(order=order, status="held").update(status="committed")
+
+
+def release_reservations(order):
+    """
+    Return held stock for ``order``. Safe to call more than once or from
+    several processes: each reservation is claimed with a conditional
+    update before its stock is given back.
+    """
+    released = 0
+    held = StockReservation.objects.filter(order=order, status="held").order_by("product_id")
+    with transaction.atomic():
+        for reservation in held.values("id", "product_id", "quantity"):
+            claimed = StockReservation.objects.filter(pk=reservation["id"], status="held").update(status="released")
+            if claimed:
+                Product.objects.filter(pk=reservation["product_id"]).update(stock=F("stock") + reservation["quantity"])
+                released += 1
+        if released:
+            transaction.on_commit(bump_catalog_version)
+    return released
+
+
+def release_expired_reservations(now=None):
+    """
+    Release reservations whose TTL has passed and cancel their orders if
+    they are still unpaid. Returns the number of orders released.
+    """
+    now = now or timezone.now()
+    order_ids = (
+        StockReservation.objects.filter(status="held", expires_at__lte=now)
+        .values_list("order_id", flat=True).distinct()
+    )
+    count = 0
+    for order_id in list(order_ids):
+        with transaction.atomic():
+            if release_reservations(order_id):
+                Order.objects.filter(pk=order_id, status="pending").update(status="cancelled")
+                count += 1
+    return count
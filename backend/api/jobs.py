@@ -0,0 +1,51 @@
+from django.core.mail import mail_admins
+from django.utils import timezone
+
+from .idempotency import purge_expired_keys
+from .inventory import release_expired_reservations
+from .models import PaymentOutbox
+from .outbox import dispatch, dispatch_due
+from .tasks import Retry, task
+from .webhooks import drain_webhook_events
+
+# ==========================
+# Task definitions
+# ==========================
+# Everything the workers run, registered by name. Code that queues these
+# refers to them by name through ``api.tasks.enqueue`` so it doesn't have to
+# import this module.
+
+
+@task("payments.initialize", priority=10, max_attempts=3)
+def initialize_payment(entry_id):
+    """Send one payment outbox entry to Paystack."""
+    if dispatch(entry_id) == "pending":
+        # Paystack was unavailable; the outbox has its own backoff and limit.
+        run_at = PaymentOutbox.objects.values_list("next_attempt_at", flat=True).get(pk=entry_id)
+        raise Retry(run_at=run_at, reason="Paystack unavailable")
+
+
+@task("payments.sweep_outbox", every=60)
+def sweep_payment_outbox():
+    """Pick up outbox entries whose initialization was missed or whose lease expired."""
+    dispatch_due(now=timezone.now())
+
+
+@task("webhooks.process", priority=5, every=60)
+def process_webhooks():
+    drain_webhook_events()
+
+
+@task("inventory.release_expired", every=60)
+def release_expired():
+    release_expired_reservations()
+
+
+@task("idempotency.purge", priority=-5, every=3600)
+def purge_idempotency_keys():
+    purge_expired_keys()
+
+
+@task("mail.admins", max_attempts=8)
+def send_admin_mail(subject, message, html_message=None):
+    mail_admins(subject, message, fail_silently=False, html_message=html_message)
@@ -0,0 +1,26 @@
+from django.db import DatabaseError, transaction
+from django.utils.log import AdminEmailHandler
+
+# ==========================
+# Logging handlers
+# ==========================
+
+
+class QueuedAdminEmailHandler(AdminEmailHandler):
+    """
+    AdminEmailHandler that queues the email as a background task instead of
+    talking SMTP inside the failing request. Falls back to sending inline
+    when the task can't be stored, e.g. the error broke the transaction.
+    """
+
+    def send_mail(self, subject, message, *args, **kwargs):
+        # Imported here: logging is configured before the app registry is ready.
+        from .tasks import enqueue
+
+        try:
+            with transaction.atomic():
+                enqueue("mail.admins", {
+                    "subject": subject, "message": message, "html_message": kwargs.get("html_message"),
+                })
+        except DatabaseError:
+            super().send_mail(subject, message, *args, **kwargs)
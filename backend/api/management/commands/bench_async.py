@@ -0,0 +1,169 @@
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from decimal import Decimal
+
+import aiohttp
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.auth import ClaimsRefreshToken
+from api.fakepaystack import FakePaystack
+from api.models import Farmer, Order, OrderItem, Payment, Product, User
+
+# (label, server, URL prefix): the same endpoints through the sync views on
+# gunicorn's threaded WSGI worker, and the sync and async views on uvicorn.
+RUNS = [
+    ("gunicorn gthread, sync views", "gunicorn", "/api/"),
+    ("uvicorn, sync views", "uvicorn", "/api/"),
+    ("uvicorn, async views", "uvicorn", "/api/async/"),
+]
+SECRET_KEY = "sk_bench_async"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = "Benchmark requests/sec per server process: gunicorn (WSGI) vs uvicorn (ASGI, sync and async views)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--endpoint", choices=["verify", "dashboard"], default="verify",
+                            help="verify waits on Paystack; dashboard only on the database")
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 50, 200])
+        parser.add_argument("--latency", type=float, default=0.2, help="Seconds the fake Paystack takes per call")
+        parser.add_argument("--threads", type=int, default=8, help="gunicorn threads per worker")
+
+    def handle(self, *args, **options):
+        if settings.DATABASES["default"]["ENGINE"].endswith("sqlite3") and not settings.DATABASES["default"]["NAME"]:
+            raise CommandError("Set DATABASE_URL to a database the server processes can share")
+        paystack = FakePaystack(secret_key=SECRET_KEY, latency=options["latency"])
+        buyer, farmer = self.seed(paystack, options["requests"])
+        try:
+            # Forked after seeding so the fake knows the transactions.
+            paystack.start(process=True)
+            token = str(ClaimsRefreshToken.for_user(buyer if options["endpoint"] == "verify" else farmer).access_token)
+            references = list(Payment.objects.filter(order__user=buyer).values_list("reference", flat=True))
+            self.stdout.write(
+                f"{options['endpoint']}: {options['requests']} requests per run, "
+                f"Paystack latency {options['latency'] * 1000:.0f}ms, one server process"
+            )
+            for label, server, prefix in RUNS:
+                with self.serve(server, paystack.base_url, options["threads"]) as base_url:
+                    for concurrency in options["concurrency"]:
+                        if options["endpoint"] == "verify":
+                            paths = [f"{prefix}payments/{reference}/verify/" for reference in references]
+                        else:
+                            paths = [f"{prefix}dashboard/farmer/"] * options["requests"]
+                        result = asyncio.run(self.load(base_url, token, paths, concurrency))
+                        self.report(label, concurrency, result)
+        finally:
+            paystack.stop()
+            User.objects.filter(pk__in=[buyer.pk, farmer.pk]).delete()
+
+    def seed(self, paystack, count):
+        suffix = os.getpid()
+        buyer = User.objects.create(username=f"bench-async-{suffix}", phone=f"bench-async-{suffix}")
+        farmer_user = User.objects.create(username=f"bench-async-farmer-{suffix}", phone=f"bench-af-{suffix}",
+                                          role="farmer")
+        farmer = Farmer.objects.create(user=farmer_user, farm_name="Bench", location="Nakuru")
+        product = Product.objects.create(farmer=farmer, name="Bench maize", price=Decimal("50.00"), stock=0)
+        orders = Order.objects.bulk_create(
+            [Order(user=buyer, total_amount=Decimal("50.00")) for _ in range(count)]
+        )
+        OrderItem.objects.bulk_create(
+            [OrderItem(order=order, product=product, quantity=1, price=product.price) for order in orders]
+        )
+        payments = Payment.objects.bulk_create([
+            Payment(order=order, reference=f"BENCH-ASYNC-{order.pk}", amount=order.total_amount) for order in orders
+        ])
+        for payment in payments:
+            # "ongoing" keeps them pending, so every verify calls Paystack.
+            paystack.add_transaction(payment.reference, 5000, status="ongoing")
+        return buyer, farmer_user
+
+    def serve(self, server, paystack_url, threads):
+        command = self
+
+        class Server:
+            def __enter__(self):
+                port = free_port()
+                env = {
+                    **os.environ,
+                    "PAYSTACK_BASE_URL": paystack_url,
+                    "PAYSTACK_SECRET_KEY": SECRET_KEY,
+                    "PAYSTACK_POOL_SIZE": str(max(threads, 10)),
+                    "DEBUG": "False",
+                    "QUERY_BUDGET_ENABLED": "False",
+                    "TASKS_RUN_IN_PROCESS": "False",
+                }
+                if server == "gunicorn":
+                    args = ["gunicorn", "backend.wsgi:application", "--workers", "1", "--worker-class", "gthread",
+                            "--threads", str(threads), "--bind", f"127.0.0.1:{port}", "--log-level", "warning"]
+                else:
+                    args = ["uvicorn", "backend.asgi:application", "--workers", "1", "--port", str(port),
+                            "--log-level", "warning", "--no-access-log"]
+                self.process = subprocess.Popen([sys.executable, "-m", *args], cwd=settings.BASE_DIR, env=env)
+                command.wait_for(port, self.process)
+                return f"http://127.0.0.1:{port}"
+
+            def __exit__(self, *exc_info):
+                self.process.terminate()
+                self.process.wait(timeout=10)
+
+        return Server()
+
+    def wait_for(self, port, process, timeout=15):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f"Server exited with {process.returncode}")
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+                return
+            except OSError:
+                time.sleep(0.1)
+        raise CommandError("Server didn't start")
+
+    async def load(self, base_url, token, paths, concurrency):
+        headers = {"Authorization": f"Bearer {token}"}
+        timings, errors = [], 0
+        queue = list(reversed(paths))
+        connector = aiohttp.TCPConnector(limit=concurrency)
+        timeout = aiohttp.ClientTimeout(total=60)
+
+        async with aiohttp.ClientSession(base_url, headers=headers, connector=connector, timeout=timeout) as client:
+            async def worker():
+                nonlocal errors
+                while queue:
+                    path = queue.pop()
+                    started = time.perf_counter()
+                    try:
+                        async with client.get(path) as response:
+                            await response.read()
+                            ok = response.status == 200
+                    except (aiohttp.ClientError, asyncio.TimeoutError):
+                        ok = False
+                    timings.append(time.perf_counter() - started)
+                    errors += not ok
+
+            started = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - started
+        return {"elapsed": elapsed, "timings": sorted(timings), "errors": errors}
+
+    def report(self, label, concurrency, result):
+        timings = result["timings"]
+        p95 = timings[int(len(timings) * 0.95) - 1] if timings else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"{label:<30} c={concurrency:<4} {len(timings) / result['elapsed']:8,.1f} req/s  "
+            f"p50 {statistics.median(timings) * 1000:7.0f}ms  p95 {p95 * 1000:7.0f}ms  errors {result['errors']}"
+        ))
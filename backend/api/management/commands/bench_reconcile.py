@@ -0,0 +1,86 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from api.fakepaystack import FakePaystack
+from api.models import Order, Payment, User
+from api.reconcile import PaymentReconciler
+
+# Share of payments in each Paystack state, roughly what a backlog of lost
+# callbacks looks like.
+MIX = [("success", 0.6), ("abandoned", 0.25), ("ongoing", 0.1), ("failed", 0.04), ("missing", 0.01)]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Benchmark reconcile_payments against the fake Paystack server."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--payments", type=int, default=20_000)
+        parser.add_argument("--workers", type=int, default=32)
+        parser.add_argument("--rate", type=float, default=0, help="Verify requests per second (0 = unlimited)")
+        parser.add_argument("--latency", type=float, default=0.0, help="Seconds the fake adds to each response")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--dry-run", action="store_true", help="Verify only, skip the status corrections")
+
+    def handle(self, *args, **options):
+        paystack = FakePaystack(secret_key="sk_bench", latency=options["latency"])
+        # Seeded and reconciled in one transaction that is rolled back, so
+        # the benchmark leaves no rows behind.
+        try:
+            with transaction.atomic():
+                self.seed(paystack, options["payments"])
+                # The fake runs in its own process, started after seeding
+                # so it inherits the transactions.
+                paystack.start(process=True)
+                try:
+                    with override_settings(PAYSTACK_BASE_URL=paystack.base_url, PAYSTACK_SECRET_KEY="sk_bench",
+                                           PAYSTACK_POOL_SIZE=options["workers"]):
+                        self.run(options)
+                finally:
+                    paystack.stop()
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, paystack, count):
+        rng = random.Random(7)
+        started = time.perf_counter()
+        buyer = User.objects.create(username="bench-reconcile", phone="bench-reconcile")
+        created = timezone.now() - timedelta(hours=2)
+        states = [state for state, _ in MIX]
+        weights = [weight for _, weight in MIX]
+        for offset in range(0, count, 5000):
+            size = min(5000, count - offset)
+            orders = Order.objects.bulk_create([Order(user=buyer, total_amount=Decimal("250.00")) for _ in range(size)])
+            payments = Payment.objects.bulk_create([
+                Payment(order=order, reference=f"BENCH-{order.pk}", amount=order.total_amount) for order in orders
+            ])
+            for payment in payments:
+                state = rng.choices(states, weights)[0]
+                if state != "missing":
+                    paystack.add_transaction(payment.reference, 25000, status=state)
+        # created_at is auto_now_add; backdate so every row counts as stale.
+        Payment.objects.filter(order__user=buyer).update(created_at=created)
+        self.stdout.write(f"Seeded {count} pending payments in {time.perf_counter() - started:.1f}s")
+
+    def run(self, options):
+        reconciler = PaymentReconciler(
+            workers=options["workers"], rate=options["rate"], batch_size=options["batch_size"],
+            dry_run=options["dry_run"],
+        )
+        report = reconciler.run()
+        self.stdout.write(
+            f"Checked {report['checked']} in {report['elapsed']:.1f}s ({report['per_second']:,.0f}/s) "
+            f"with {options['workers']} workers: {report['settled']} settled, {report['failed']} failed, "
+            f"{report['unchanged']} unchanged, {report['discrepancies']} discrepancies"
+        )
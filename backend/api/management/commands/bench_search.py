@@ -0,0 +1,94 @@
+import random
+import time
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from api.models import Farmer, Product, User
+from api.search import search_products
+
+WORDS = [
+    "tomato", "tomatoes", "sukuma", "wiki", "kale", "maize", "beans", "green", "grams",
+    "avocado", "hass", "mango", "apple", "banana", "cassava", "sweet", "potato", "arrow",
+    "roots", "sorghum", "millet", "cowpeas", "onion", "cabbage", "spinach", "fresh", "organic",
+    "dried", "kienyeji", "managu", "terere", "pawpaw", "passion", "fruit", "ndengu", "njahi",
+]
+# Synthetic filler vocabulary so descriptions look like prose rather than a
+# keyword list; otherwise nearly every row matches every query.
+FILLER = [f"{a}{b}{c}" for a in "bdfgklmnprstvw" for b in ("a", "e", "i", "o", "u", "ya", "wa")
+          for c in ("ka", "ni", "to", "la", "mu", "zi", "re", "po")]
+QUERIES = ["tomato", "toma", "green grams", "sweet pot", "organic avocado", "kienyeji managu", "zzz"]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Compare the full-text search index against the SearchFilter icontains scan."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=100_000)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--page-size", type=int, default=24)
+
+    def handle(self, *args, **options):
+        # Everything runs in one transaction that is rolled back at the end,
+        # so the benchmark never leaves rows behind.
+        try:
+            with transaction.atomic():
+                self.seed(options["products"])
+                self.run(options["repeat"], options["page_size"])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, count):
+        rng = random.Random(42)
+        user = User.objects.create(username="bench-search-farmer", phone="bench-search")
+        farmer = Farmer.objects.create(user=user, farm_name="Bench Farm")
+        categories = [c for c, _ in Product.CATEGORY_CHOICES]
+        started = time.perf_counter()
+        batch = []
+        for i in range(count):
+            batch.append(Product(
+                farmer=farmer,
+                name=" ".join(rng.sample(WORDS, 2)).title(),
+                description=" ".join(rng.choices(FILLER, k=rng.randint(10, 60)) + rng.sample(WORDS, 2)),
+                price=Decimal(rng.randint(10, 5000)),
+                category=rng.choice(categories),
+            ))
+            if len(batch) == 5000:
+                Product.objects.bulk_create(batch)
+                batch = []
+        Product.objects.bulk_create(batch)
+        self.stdout.write(f"Seeded {count} products in {time.perf_counter() - started:.1f}s")
+
+    def run(self, repeat, page_size):
+        self.stdout.write(f"{'query':<20}{'icontains ms':>14}{'fts ms':>10}{'hits':>8}")
+        for query in QUERIES:
+            like = self.time(lambda: self.icontains(query, page_size), repeat)
+            fts = self.time(lambda: list(search_products(Product.objects.all(), query)
+                                         .order_by("-search_rank", "id")[:page_size]), repeat)
+            hits = search_products(Product.objects.all(), query).count()
+            self.stdout.write(f"{query:<20}{like:>14.2f}{fts:>10.2f}{hits:>8}")
+
+    def icontains(self, query, page_size):
+        # Mirrors SearchFilter: every term must match one of the search fields.
+        queryset = Product.objects.all()
+        for term in query.split():
+            queryset = queryset.filter(reduce(or_, [
+                Q(name__icontains=term), Q(description__icontains=term), Q(category__icontains=term),
+            ]))
+        return list(queryset.order_by("name", "id")[:page_size])
+
+    def time(self, fn, repeat):
+        fn()
+        started = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        return (time.perf_counter() - started) * 1000 / repeat
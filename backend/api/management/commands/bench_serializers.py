@@ -0,0 +1,61 @@
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from api.fastpath import get_values_spec, orjson, render_json
+from api.models import Cart, Farmer, Product, User
+from api.serializers import CartSerializer, ProductSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Rows/sec of the serializer path vs the api.fastpath values() path."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=5000)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.seed(options["rows"])
+                self.stdout.write(f"JSON encoder: {'orjson' if orjson else 'json (stdlib)'}")
+                self.stdout.write(f"{'endpoint':<12}{'serializer rows/s':>20}{'fast path rows/s':>20}{'speedup':>10}")
+                self.compare("products", Product.objects.filter(farmer=self.farmer).select_related("farmer").order_by("name", "id"),
+                             ProductSerializer, options)
+                self.compare("cart", Cart.objects.filter(user=self.buyer).select_related("product__farmer").order_by("id"),
+                             CartSerializer, options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, count):
+        user = User.objects.create(username="bench-ser-farmer", phone="bench-ser-farmer", role="farmer")
+        self.farmer = farmer = Farmer.objects.create(user=user, farm_name="Bench Farm")
+        self.buyer = User.objects.create(username="bench-ser-buyer", phone="bench-ser-buyer")
+        products = Product.objects.bulk_create(
+            Product(farmer=farmer, name=f"Product {i}", description="Fresh from the farm " * 5,
+                    price=Decimal(i % 997) + Decimal("0.50"), category="vegetables")
+            for i in range(count)
+        )
+        Cart.objects.bulk_create(Cart(user=self.buyer, product=p, quantity=2) for p in products)
+
+    def compare(self, label, queryset, serializer_class, options):
+        renderer = JSONRenderer()
+        spec = get_values_spec(serializer_class)
+        slow = self.rate(lambda: renderer.render(serializer_class(list(queryset), many=True).data), options)
+        fast = self.rate(lambda: render_json(spec.to_dicts(spec.values(queryset))), options)
+        self.stdout.write(f"{label:<12}{slow:>20,.0f}{fast:>20,.0f}{fast / slow:>9.1f}x")
+
+    def rate(self, fn, options):
+        fn()
+        started = time.perf_counter()
+        for _ in range(options["repeat"]):
+            fn()
+        return options["rows"] * options["repeat"] / (time.perf_counter() - started)
@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from api.models import Task
+from api.tasks import run_worker_processes, task
+
+BENCH_TASK = "bench.noop"
+
+
+@task(BENCH_TASK)
+def noop(work=0.0):
+    if work:
+        time.sleep(work)
+
+
+class Command(BaseCommand):
+    help = "Benchmark task queue throughput (jobs/sec, per worker) for several worker counts."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--jobs", type=int, default=5000, help="Jobs queued for each run")
+        parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4], help="Worker process counts to try")
+        parser.add_argument("--batch-size", type=int, default=10)
+        parser.add_argument("--work", type=float, default=0.0, help="Seconds each job sleeps")
+
+    def handle(self, *args, **options):
+        # Workers run in other processes and must see the jobs, so they are
+        # committed rather than rolled back; only bench rows are touched.
+        self.stdout.write(f"{connection.vendor}, {options['jobs']} jobs, batch size {options['batch_size']}")
+        try:
+            for processes in options["processes"]:
+                self.run(processes, options)
+        finally:
+            Task.objects.filter(name=BENCH_TASK).delete()
+
+    def run(self, processes, options):
+        Task.objects.filter(name=BENCH_TASK).delete()
+        Task.objects.bulk_create(
+            [Task(name=BENCH_TASK, kwargs={"work": options["work"]}) for _ in range(options["jobs"])],
+            batch_size=1000,
+        )
+        started = time.perf_counter()
+        run_worker_processes(processes, batch_size=options["batch_size"], burst=True, names=[BENCH_TASK])
+        elapsed = time.perf_counter() - started
+        left = Task.objects.filter(name=BENCH_TASK).exclude(status="failed").count()
+        failed = Task.objects.filter(name=BENCH_TASK, status="failed").count()
+        done = options["jobs"] - left - failed
+        self.stdout.write(self.style.SUCCESS(
+            f"{processes} worker(s): {done} jobs in {elapsed:.2f}s = {done / elapsed:,.0f} jobs/s "
+            f"({done / elapsed / processes:,.0f} per worker), {failed} failed, {left} left"
+        ))
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.outbox import dispatch_due
+
+
+class Command(BaseCommand):
+    help = "Send pending Paystack initializations from the payment outbox."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true", help="Keep polling instead of exiting after one sweep")
+        parser.add_argument("--interval", type=float, default=1.0, help="Seconds between sweeps with --loop")
+        parser.add_argument("--limit", type=int, default=100, help="Entries per sweep")
+        parser.add_argument("--workers", type=int, default=4, help="Concurrent Paystack requests")
+
+    def handle(self, *args, **options):
+        while True:
+            outcomes = dispatch_due(limit=options["limit"], workers=options["workers"])
+            sent = outcomes.get("sent", 0)
+            failed = outcomes.get("failed", 0)
+            retrying = outcomes.get("pending", 0)
+            if outcomes or not options["loop"]:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Sent {sent}, failed {failed}, rescheduled {retrying}"
+                ))
+            if not options["loop"]:
+                return
+            if sum(outcomes.values()) < options["limit"]:
+                time.sleep(options["interval"])
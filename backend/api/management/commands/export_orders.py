@@ -0,0 +1,42 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.exports import EXPORT_FORMATS, OrderExport, parse_day
+
+
+class Command(BaseCommand):
+    help = "Stream order lines as CSV or NDJSON to a file or stdout, in constant memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+        parser.add_argument("--farmer", type=int, help="Only this farmer's lines (their user id)")
+        parser.add_argument("--since", help="First order date to include (YYYY-MM-DD)")
+        parser.add_argument("--until", help="Last order date to include (YYYY-MM-DD)")
+        parser.add_argument("--status", help="Only orders with this status")
+        parser.add_argument("--gzip", action="store_true", help="Compress the output")
+        parser.add_argument("--output", help="File to write (default: stdout)")
+
+    def handle(self, *args, **options):
+        try:
+            export = OrderExport(
+                options["format"],
+                farmer_id=options["farmer"],
+                since=options["since"] and parse_day(options["since"], "--since"),
+                until=options["until"] and parse_day(options["until"], "--until"),
+                status=options["status"],
+                compress=options["gzip"],
+            )
+        except ValueError as exc:
+            raise CommandError(exc)
+
+        output = open(options["output"], "wb") if options["output"] else sys.stdout.buffer
+        try:
+            for chunk in export.chunks():
+                output.write(chunk)
+        finally:
+            if options["output"]:
+                output.close()
+            else:
+                output.flush()
+        self.stderr.write(self.style.SUCCESS(f"Exported {export.rows} order lines"))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from api.fakepaystack import FakePaystack
+
+
+class Command(BaseCommand):
+    help = "Run a local fake Paystack API for development and load tests."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--secret-key", help="Reject requests not using this key")
+        parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+        parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of requests answered with 503")
+        parser.add_argument("--decline-rate", type=float, default=0.0, help="Share of requests refused")
+        parser.add_argument("--verbose", action="store_true", help="Log every request")
+
+    def handle(self, *args, **options):
+        fake = FakePaystack(
+            host=options["host"], port=options["port"], secret_key=options["secret_key"],
+            latency=options["latency"], failure_rate=options["failure_rate"],
+            decline_rate=options["decline_rate"], verbose=options["verbose"],
+        ).start()
+        self.stdout.write(self.style.SUCCESS(
+            f"Fake Paystack listening on {fake.base_url}; set PAYSTACK_BASE_URL={fake.base_url}"
+        ))
+        try:
+            fake.thread.join()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            fake.stop()
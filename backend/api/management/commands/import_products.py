@@ -0,0 +1,48 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from api.importers import ProductImporter, detect_format, iter_rows
+from api.models import Farmer
+
+
+class Command(BaseCommand):
+    help = "Bulk import a farmer's or cooperative's product catalog from CSV or NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV (with a header row) or NDJSON file")
+        parser.add_argument("--farmer", required=True, help="Username or id of the farmer the products belong to")
+        parser.add_argument("--format", choices=["csv", "ndjson"], help="Defaults to the file extension")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--dry-run", action="store_true", help="Validate only, write nothing")
+
+    def handle(self, *args, **options):
+        farmer = self.get_farmer(options["farmer"])
+        try:
+            fmt = detect_format(options["path"], options["format"])
+        except ValidationError as exc:
+            raise CommandError(exc.detail["format"])
+
+        importer = ProductImporter(farmer, batch_size=options["batch_size"], dry_run=options["dry_run"])
+        started = time.perf_counter()
+        with open(options["path"], "rb") as fileobj:
+            report = importer.run(iter_rows(fileobj, fmt))
+        elapsed = time.perf_counter() - started
+
+        for error in report["errors"]:
+            self.stderr.write(f"row {error['row']}: {json.dumps(error['errors'], default=str)}")
+        rows = report["created"] + report["updated"] + report["failed"]
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Validated' if report['dry_run'] else 'Imported'} {report['created']} new and "
+            f"{report['updated']} existing products, {report['failed']} failed, "
+            f"in {elapsed:.2f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s)"
+        ))
+
+    def get_farmer(self, value):
+        lookup = {"user_id": value} if value.isdigit() else {"user__username": value}
+        try:
+            return Farmer.objects.get(**lookup)
+        except Farmer.DoesNotExist:
+            raise CommandError(f"No farmer {value!r}")
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.webhooks import drain_webhook_events
+
+
+class Command(BaseCommand):
+    help = "Apply stored Paystack webhook events to payments, orders and deliveries."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true", help="Keep polling instead of exiting once drained")
+        parser.add_argument("--interval", type=float, default=1.0, help="Seconds between polls with --loop")
+
+    def handle(self, *args, **options):
+        while True:
+            outcomes = drain_webhook_events()
+            if outcomes or not options["loop"]:
+                summary = ", ".join(f"{count} {status}" for status, count in sorted(outcomes.items()))
+                self.stdout.write(self.style.SUCCESS(f"Webhook events: {summary or 'none pending'}"))
+            if not options["loop"]:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,24 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.sales import rebuild_sales_rollup
+
+
+class Command(BaseCommand):
+    help = "Backfill or rebuild the daily sales rollup behind the farmers' sales trend from paid orders."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--farmer", type=int, action="append", dest="farmers",
+                            help="Only this farmer's user id (repeatable)")
+        parser.add_argument("--since", help="Only days from this date on (YYYY-MM-DD)")
+
+    def handle(self, *args, **options):
+        since = None
+        if options["since"]:
+            try:
+                since = date.fromisoformat(options["since"])
+            except ValueError:
+                raise CommandError(f"Invalid --since date: {options['since']}")
+        count = rebuild_sales_rollup(farmer_ids=options["farmers"], since=since)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {count} daily sales rows"))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from api.search import drop_search_index, install_search_index, search_supported
+
+
+class Command(BaseCommand):
+    help = "(Re)create the full-text product search index and repopulate it."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--drop", action="store_true", help="Drop the index before recreating it.")
+
+    def handle(self, *args, **options):
+        if not search_supported():
+            self.stdout.write(self.style.WARNING(f"No full-text index for {connection.vendor}; nothing to do."))
+            return
+        with connection.schema_editor() as schema_editor:
+            if options["drop"]:
+                drop_search_index(schema_editor)
+            install_search_index(schema_editor)
+        self.stdout.write(self.style.SUCCESS("Product search index rebuilt."))
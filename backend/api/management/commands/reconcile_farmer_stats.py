@@ -0,0 +1,25 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from api.sales import reconcile_farmer_stats
+
+
+class Command(BaseCommand):
+    help = "Check the farmers' revenue ledger and dashboard counters against their products and paid orders."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fix", action="store_true", help="Rebuild the ledger and counters of farmers that are off")
+        parser.add_argument("--chunk-size", type=int, default=500, help="Farmers checked per round of queries")
+
+    def handle(self, *args, **options):
+        count = 0
+        for discrepancy in reconcile_farmer_stats(chunk_size=options["chunk_size"], fix=options["fix"]):
+            count += 1
+            self.stdout.write(json.dumps(discrepancy, default=str))
+        if not count:
+            self.stdout.write(self.style.SUCCESS("Farmer counters match the orders"))
+        elif options["fix"]:
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt counters for {count} farmers"))
+        else:
+            self.stdout.write(self.style.WARNING(f"{count} farmers are off; run with --fix to rebuild them"))
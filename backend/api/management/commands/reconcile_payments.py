@@ -0,0 +1,68 @@
+import json
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.reconcile import PaymentReconciler
+
+
+class Command(BaseCommand):
+    help = "Verify stale pending payments against Paystack and correct their status."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than", type=int, default=30, help="Minutes a payment must have been pending")
+        parser.add_argument("--workers", type=int, default=16, help="Concurrent verify requests")
+        parser.add_argument("--rate", type=float, default=100.0, help="Verify requests per second (0 = unlimited)")
+        parser.add_argument("--batch-size", type=int, default=500, help="Payments corrected per transaction")
+        parser.add_argument("--chunk-size", type=int, default=2000, help="Rows fetched per database round trip")
+        parser.add_argument("--limit", type=int, help="Stop after this many payments")
+        parser.add_argument("--checkpoint", help="File recording progress after every batch")
+        parser.add_argument("--resume", action="store_true", help="Continue from --checkpoint")
+        parser.add_argument("--report", help="Write discrepancies to this file as NDJSON")
+        parser.add_argument("--dry-run", action="store_true", help="Verify and report, change nothing")
+        parser.add_argument(
+            "--shard", help="INDEX/COUNT: handle only payments with id %% COUNT == INDEX, to split a "
+                            "backlog across processes (give each its own --checkpoint)",
+        )
+
+    def handle(self, *args, **options):
+        if options["resume"] and not options["checkpoint"]:
+            raise CommandError("--resume needs --checkpoint")
+
+        shard = None
+        if options["shard"]:
+            try:
+                index, count = (int(part) for part in options["shard"].split("/"))
+            except ValueError:
+                raise CommandError("--shard must look like 0/4")
+            if not 0 <= index < count:
+                raise CommandError("--shard index must be between 0 and COUNT - 1")
+            shard = (index, count)
+
+        reconciler = PaymentReconciler(
+            older_than=timedelta(minutes=options["older_than"]),
+            workers=options["workers"],
+            rate=options["rate"],
+            batch_size=options["batch_size"],
+            chunk_size=options["chunk_size"],
+            checkpoint=options["checkpoint"],
+            dry_run=options["dry_run"],
+            shard=shard,
+        )
+        report = reconciler.run(resume=options["resume"], limit=options["limit"])
+
+        if options["report"]:
+            with open(options["report"], "w") as fileobj:
+                for entry in reconciler.discrepancies:
+                    fileobj.write(json.dumps(entry) + "\n")
+        else:
+            for entry in reconciler.discrepancies[:20]:
+                self.stderr.write(f"{entry['kind']}: payment {entry['payment']} ({entry['reference']}): {entry['detail']}")
+
+        kinds = ", ".join(f"{count} {kind}" for kind, count in sorted(report["discrepancy_kinds"].items()))
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Checked' if not report['dry_run'] else 'Dry run checked'} {report['checked']} payments "
+            f"in {report['elapsed']:.1f}s ({report['per_second'] or 0:,.0f}/s): "
+            f"{report['settled']} settled, {report['failed']} failed, {report['unchanged']} unchanged, "
+            f"{report['discrepancies']} discrepancies{f' ({kinds})' if kinds else ''}; last id {report['last_id']}"
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.inventory import release_expired_reservations
+
+
+class Command(BaseCommand):
+    help = "Return stock held by unpaid orders whose reservation TTL has passed."
+
+    def handle(self, *args, **options):
+        count = release_expired_reservations()
+        self.stdout.write(self.style.SUCCESS(f"Released reservations for {count} orders"))
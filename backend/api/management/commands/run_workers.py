@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from api.tasks import run_worker_processes, serve
+
+
+class Command(BaseCommand):
+    help = "Run background task workers (api.tasks) until interrupted."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=1, help="Worker processes to fork")
+        parser.add_argument("--threads", type=int, default=1, help="Worker threads per process")
+        parser.add_argument("--batch-size", type=int, default=10, help="Jobs claimed at a time")
+        parser.add_argument("--idle-sleep", type=float, default=0.5, help="Seconds between polls when idle")
+        parser.add_argument("--burst", action="store_true", help="Exit once nothing is due")
+        parser.add_argument("--task", action="append", dest="names", help="Only run this task (repeatable)")
+
+    def handle(self, *args, **options):
+        worker_options = {
+            "threads": options["threads"],
+            "batch_size": options["batch_size"],
+            "idle_sleep": options["idle_sleep"],
+            "burst": options["burst"],
+            "names": options["names"],
+        }
+        if options["processes"] <= 1:
+            processed = serve(**worker_options)
+            self.stdout.write(self.style.SUCCESS(f"Worker stopped after {processed} tasks"))
+            return
+        exitcodes = run_worker_processes(options["processes"], **worker_options)
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(exitcodes)} worker processes stopped (exit codes {', '.join(map(str, exitcodes))})"
+        ))
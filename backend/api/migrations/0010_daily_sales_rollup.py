@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:39
+
+from decimal import Decimal
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_tasks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FarmerDailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('farmer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='api.farmer')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='farmerdailysales',
+            constraint=models.UniqueConstraint(fields=('farmer', 'day'), name='daily_sales_farmer_day_uniq'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:42
+
+from decimal import Decimal
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_daily_sales_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FarmerStats',
+            fields=[
+                ('farmer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='api.farmer')),
+                ('products', models.IntegerField(default=0)),
+                ('orders', models.IntegerField(default=0)),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FarmerLedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('units', models.PositiveIntegerField()),
+                ('revenue', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('farmer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger', to='api.farmer')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='api.order')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='farmerledgerentry',
+            constraint=models.UniqueConstraint(fields=('farmer', 'order'), name='ledger_farmer_order_uniq'),
+        ),
+    ]
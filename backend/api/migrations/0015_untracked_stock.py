@@ -0,0 +1,52 @@
+from django.db import migrations, models
+from django.db.migrations.recorder import MigrationRecorder
+
+from api.search import install_search_index
+
+
+def untrack_unset_stock(apps, schema_editor):
+    """
+    Products listed before 0004 never had a stock to set, so they all sit at
+    the old default of 0 and every checkout of them would be refused. Those
+    that are still at 0 and were never reserved are marked untracked.
+    """
+    recorder = MigrationRecorder(schema_editor.connection)
+    applied = (
+        recorder.migration_qs.filter(app="api", name="0004_stock_reservations")
+        .values_list("applied", flat=True).first()
+    )
+    if applied is None:
+        return
+    Product = apps.get_model("api", "Product")
+    StockReservation = apps.get_model("api", "StockReservation")
+    Product.objects.using(schema_editor.connection.alias).filter(created_at__lt=applied, stock=0).exclude(
+        pk__in=StockReservation.objects.values("product_id")
+    ).update(stock=None)
+
+
+def track_unset_stock(apps, schema_editor):
+    Product = apps.get_model("api", "Product")
+    Product.objects.using(schema_editor.connection.alias).filter(stock=None).update(stock=0)
+
+
+def reinstall_search_index(apps, schema_editor):
+    # Altering the column rebuilds api_product on SQLite, dropping the
+    # full-text triggers (see api.search).
+    install_search_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_user_claims_changed_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='stock',
+            field=models.PositiveIntegerField(blank=True, default=None, null=True),
+        ),
+        migrations.RunPython(untrack_unset_stock, track_unset_stock),
+        migrations.RunPython(reinstall_search_index, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,7 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from decimal import Decimal
 
 # ==========================
@@ -13,6 +14,10 @@ class User(AbstractUser):
     )
     role = models.CharField(max_length=10, choices=ROLE_CHOICES, default="buyer")
     phone = models.CharField(max_length=15, unique=True)
+    # When the user's token claims last changed; older access tokens are
+    # no longer trusted (api.auth). Set by signals.py, so a queryset
+    # update() of role, is_staff or is_active must set it too.
+    claims_changed_at = models.DateTimeField(null=True, blank=True, editable=False)
 
     groups = models.ManyToManyField(
         "auth.Group", related_name="custom_user_groups", blank=True
@@ -58,9 +63,23 @@ class Product(models.Model):
     description = models.TextField(blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal("0.00"))
     category = models.CharField(max_length=50, choices=CATEGORY_CHOICES, default="others")
-    stock = models.PositiveIntegerField(default=0)
+    # None until the farmer sets it: stock isn't tracked and checkout
+    # doesn't limit the quantity (see api.inventory).
+    stock = models.PositiveIntegerField(null=True, blank=True, default=None)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # Composite (field, id) indexes back the keyset pagination for each
+        # of ProductViewSet.ordering_fields; the last two for a farmer's own
+        # products, newest first, and ?category= by price.
+        indexes = [
+            models.Index(fields=["name", "id"], name="product_name_id_idx"),
+            models.Index(fields=["price", "id"], name="product_price_id_idx"),
+            models.Index(fields=["created_at", "id"], name="product_created_id_idx"),
+            models.Index(fields=["farmer", "created_at", "id"], name="product_farmer_created_idx"),
+            models.Index(fields=["category", "price", "id"], name="product_category_price_idx"),
+        ]
+
     def __str__(self):
         return f"{self.name} - {self.farmer.farm_name}"
 
@@ -84,6 +103,14 @@ class Order(models.Model):
     payment_reference = models.CharField(max_length=100, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # Backs the keyset pagination of a buyer's order history, and the
+        # status filters of the sales rebuilds and exports.
+        indexes = [
+            models.Index(fields=["user", "created_at", "id"], name="order_user_created_idx"),
+            models.Index(fields=["status"], name="order_status_idx"),
+        ]
+
     def __str__(self):
         return f"Order {self.id} - {self.user.username} - {self.status}"
 
@@ -98,6 +125,84 @@ class OrderItem(models.Model):
         return f"{self.product.name} x {self.quantity}"
 
 
+class FarmerDailySales(models.Model):
+    """
+    A farmer's paid orders, units and revenue for one day (of the order's
+    ``created_at``), kept up to date by api.sales as payments settle.
+    """
+    farmer = models.ForeignKey(Farmer, on_delete=models.CASCADE, related_name="daily_sales")
+    day = models.DateField()
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # Also the index a trend's (farmer, day range) scan runs on.
+        constraints = [
+            models.UniqueConstraint(fields=["farmer", "day"], name="daily_sales_farmer_day_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.farmer_id} on {self.day}: {self.orders} orders, {self.revenue}"
+
+
+class FarmerLedgerEntry(models.Model):
+    """A farmer's share of a paid order: their own lines' units and ``price * quantity``."""
+    farmer = models.ForeignKey(Farmer, on_delete=models.CASCADE, related_name="ledger")
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="ledger_entries")
+    units = models.PositiveIntegerField()
+    revenue = models.DecimalField(max_digits=12, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["farmer", "order"], name="ledger_farmer_order_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.farmer_id} for Order {self.order_id}: {self.revenue}"
+
+
+class FarmerStats(models.Model):
+    """Running counters behind the farmer dashboard summary (see api.sales)."""
+    farmer = models.OneToOneField(Farmer, on_delete=models.CASCADE, primary_key=True, related_name="stats")
+    products = models.IntegerField(default=0)
+    orders = models.IntegerField(default=0)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Stats for {self.farmer_id}: {self.orders} orders, {self.revenue}"
+
+
+# ==========================
+# Stock Reservations
+# ==========================
+class StockReservation(models.Model):
+    STATUS_CHOICES = [
+        ("held", "Held"),
+        ("committed", "Committed"),
+        ("released", "Released"),
+    ]
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="reservations")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="held")
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "expires_at"], name="reservation_expiry_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} for Order {self.order_id} ({self.status})"
+
+
 # ==========================
 # Payments
 # ==========================
@@ -106,12 +211,151 @@ class Payment(models.Model):
     reference = models.CharField(max_length=100, unique=True, default="")
     amount = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal("0.00"))
     status = models.CharField(max_length=20, default="pending")
+    authorization_url = models.URLField(max_length=500, blank=True, default="")
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # PaymentReconciler's sweep of payments still pending after a while.
+        indexes = [
+            models.Index(fields=["status", "created_at"], name="payment_status_created_idx"),
+        ]
+
     def __str__(self):
         return f"Payment {self.reference} - {self.status}"
 
 
+class PaymentOutbox(models.Model):
+    """
+    Paystack initialization waiting to be sent. Written in the checkout
+    transaction and delivered by api.outbox, so the request never waits on
+    Paystack and a crash can't lose an order's payment.
+    """
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("sent", "Sent"),
+        ("failed", "Failed"),
+    ]
+
+    payment = models.OneToOneField(Payment, on_delete=models.CASCADE, related_name="outbox")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"], name="outbox_due_idx"),
+        ]
+
+    def __str__(self):
+        return f"Outbox {self.payment_id} ({self.status}, {self.attempts} attempts)"
+
+
+class WebhookEvent(models.Model):
+    """
+    A Paystack webhook delivery, stored on receipt and applied later in
+    batches by api.webhooks. ``dedupe_key`` makes redeliveries no-ops.
+    """
+    STATUS_CHOICES = [
+        ("received", "Received"),
+        ("processed", "Processed"),
+        ("ignored", "Ignored"),
+        ("failed", "Failed"),
+    ]
+
+    dedupe_key = models.CharField(max_length=150, unique=True)
+    event = models.CharField(max_length=50)
+    reference = models.CharField(max_length=100)
+    payload = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="received")
+    error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "id"], name="webhook_queue_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.event} {self.reference} ({self.status})"
+
+
+# ==========================
+# Idempotency keys
+# ==========================
+class IdempotencyKey(models.Model):
+    """
+    The stored response for a client-supplied ``Idempotency-Key``, replayed
+    when the same request is retried until ``expires_at``.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.JSONField(null=True)
+    location = models.CharField(max_length=500, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "key"], name="idempotency_user_key_uniq"),
+        ]
+        indexes = [
+            models.Index(fields=["expires_at"], name="idempotency_expiry_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.key} for {self.user_id} ({self.status_code})"
+
+
+# ==========================
+# Background tasks
+# ==========================
+class Task(models.Model):
+    """
+    A queued call to a function registered with ``api.tasks.task``. Workers
+    claim due rows in ``-priority, run_at`` order (see api.tasks).
+    """
+    STATUS_CHOICES = [
+        ("queued", "Queued"),
+        ("running", "Running"),
+        ("failed", "Failed"),
+    ]
+
+    name = models.CharField(max_length=100)
+    kwargs = models.JSONField(default=dict)
+    priority = models.SmallIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="queued")
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    # Set for tasks that should be queued at most once at a time.
+    unique_key = models.CharField(max_length=100, null=True, blank=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "-priority", "run_at"], name="task_claim_idx"),
+            models.Index(fields=["locked_by"], name="task_locked_by_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["unique_key"], condition=models.Q(status="queued"), name="task_unique_queued",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.status}, attempt {self.attempts})"
+
+
 # ==========================
 # Delivery
 # ==========================
@@ -154,3 +398,16 @@ class Cart(models.Model):
 
     def __str__(self):
         return f"{self.user.username} - {self.product.name} x {self.quantity}"
+
+
+class CartSummary(models.Model):
+    """Per-user cart line count and total, updated with each cart mutation."""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name="cart_summary"
+    )
+    item_count = models.IntegerField(default=0)
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal("0.00"))
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Cart summary for {self.user_id}: {self.item_count} items, {self.total}"
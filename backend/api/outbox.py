@@ -0,0 +1,119 @@
+import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Payment, PaymentOutbox
+from .payments import fail_payments
+from .paystack import PaystackError, PaystackUnavailable, initialize_transaction
+from .tasks import enqueue
+
+logger = logging.getLogger(__name__)
+
+# ==========================
+# Payment outbox
+# ==========================
+# Checkout writes a PaymentOutbox row next to the order, queues a
+# ``payments.initialize`` task for it (api.jobs) and returns. A task worker
+# sends it to Paystack; the periodic outbox sweep and the
+# ``dispatch_payment_outbox`` command pick up anything that was missed, with
+# exponential backoff between attempts.
+#
+# A dispatcher claims a row by pushing ``next_attempt_at`` one lease into the
+# future with a conditional UPDATE, so two dispatchers never send the same
+# row and a dispatcher that dies mid-send is retried once the lease expires.
+
+LEASE = timedelta(seconds=60)
+
+
+def enqueue_initialization(payment):
+    """Queue ``payment`` for initialization. Call inside the checkout transaction."""
+    entry = PaymentOutbox.objects.create(payment=payment)
+    enqueue("payments.initialize", {"entry_id": entry.pk})
+    return entry
+
+
+def backoff(attempts):
+    seconds = settings.PAYMENT_OUTBOX_BACKOFF * 2 ** max(attempts - 1, 0)
+    return timedelta(seconds=min(seconds, 3600))
+
+
+def dispatch(entry_id, now=None):
+    """
+    Send one entry if it is due. Returns its new status, or None when it
+    isn't due or another dispatcher holds it.
+    """
+    now = now or timezone.now()
+    claimed = PaymentOutbox.objects.filter(
+        pk=entry_id, status="pending", next_attempt_at__lte=now
+    ).update(next_attempt_at=now + LEASE, attempts=F("attempts") + 1)
+    if not claimed:
+        return None
+
+    entry = PaymentOutbox.objects.select_related("payment__order__user").get(pk=entry_id)
+    payment = entry.payment
+    order = payment.order
+    if order.status != "pending":
+        # Cancelled meanwhile, e.g. its stock reservation expired.
+        PaymentOutbox.objects.filter(pk=entry.pk).update(status="failed", last_error=f"Order is {order.status}")
+        Payment.objects.filter(pk=payment.pk).update(status="failed")
+        return "failed"
+
+    try:
+        data = initialize_transaction(
+            order.user.email, payment.amount, payment.reference,
+            callback_url=f"{settings.FRONTEND_URL}/payment-callback/",
+        )
+    except PaystackUnavailable as exc:
+        if entry.attempts >= settings.PAYMENT_OUTBOX_MAX_ATTEMPTS:
+            fail(entry, str(exc))
+            return "failed"
+        PaymentOutbox.objects.filter(pk=entry.pk).update(
+            next_attempt_at=timezone.now() + backoff(entry.attempts), last_error=str(exc)
+        )
+        return "pending"
+    except PaystackError as exc:
+        fail(entry, str(exc))
+        return "failed"
+
+    with transaction.atomic():
+        Payment.objects.filter(pk=payment.pk).update(authorization_url=data["authorization_url"])
+        PaymentOutbox.objects.filter(pk=entry.pk).update(status="sent", sent_at=timezone.now(), last_error="")
+    return "sent"
+
+
+def fail(entry, error):
+    """
+    Give up on an initialization: cancel the order, return its stock and put
+    its items back in the buyer's cart.
+    """
+    with transaction.atomic():
+        PaymentOutbox.objects.filter(pk=entry.pk).update(status="failed", last_error=error)
+        fail_payments([entry.payment_id])
+    logger.warning("Payment initialization for order %s failed: %s", entry.payment.order_id, error)
+
+
+def dispatch_due(limit=100, workers=1, now=None):
+    """Send every due entry (up to ``limit``). Returns a Counter of outcomes."""
+    now = now or timezone.now()
+    ids = list(
+        PaymentOutbox.objects.filter(status="pending", next_attempt_at__lte=now)
+        .order_by("next_attempt_at")
+        .values_list("id", flat=True)[:limit]
+    )
+    if workers <= 1:
+        return Counter(dispatch(entry_id, now) for entry_id in ids)
+
+    def run(entry_id):
+        try:
+            return dispatch(entry_id, now)
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return Counter(pool.map(run, ids))
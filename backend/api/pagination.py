@@ -0,0 +1,183 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+# ==========================
+# Keyset (cursor) Pagination
+# ==========================
+
+def _encode_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+class KeysetPagination(BasePagination):
+    """
+    Seek-based pagination over ``(ordering field, id)``.
+
+    Unlike DRF's ``CursorPagination`` (which only seeks on the first ordering
+    field and falls back to an offset for ties) every page is a range scan
+    on a composite index, so page 500 costs the same as page 1.
+    """
+    page_size = 24
+    max_page_size = 100
+    page_size_query_param = "page_size"
+    cursor_query_param = "cursor"
+    tiebreaker = "id"
+    default_ordering = "-created_at"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset, view)
+        self.cursor = self.decode_cursor(request)
+
+        field, descending = self.ordering.lstrip("-"), self.ordering.startswith("-")
+        reverse = bool(self.cursor and self.cursor["r"])
+        if reverse:
+            descending = not descending
+        prefix = "-" if descending else ""
+        queryset = queryset.order_by(prefix + field, prefix + self.tiebreaker)
+
+        if self.cursor is not None:
+            self.cursor["v"] = self.clean_value(queryset, field, self.cursor["v"])
+            queryset = queryset.filter(self.seek_filter(field, descending, self.cursor))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor is not None
+
+        self.page = rows
+        return rows
+
+    def seek_filter(self, field, descending, cursor):
+        # field >= v AND (field > v OR id > pk) keeps the leading column a
+        # plain range predicate, so the planner can walk the composite index.
+        op = "lt" if descending else "gt"
+        value, pk = cursor["v"], cursor["id"]
+        return (
+            Q(**{f"{field}__{op}e": value})
+            & (Q(**{f"{field}__{op}": value}) | Q(**{f"{self.tiebreaker}__{op}": pk}))
+        )
+
+    def clean_value(self, queryset, field, value):
+        # A hand-edited cursor may carry anything; a value the field can't
+        # hold is a bad cursor, not a database error.
+        if not isinstance(value, (str, int, float)) or isinstance(value, bool):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            return queryset.model._meta.get_field(field).to_python(value)
+        except FieldDoesNotExist:
+            return value
+        except ValidationError:
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_ordering(self, queryset, view):
+        allowed = set(getattr(view, "ordering_fields", None) or [])
+        allowed.update(getattr(view, "cursor_extra_fields", None) or [])
+        order_by = [o for o in queryset.query.order_by if isinstance(o, str)]
+        if not order_by:
+            order_by = list(getattr(view, "ordering", None) or [self.default_ordering])
+        ordering = order_by[0]
+        if allowed and ordering.lstrip("-") not in allowed:
+            ordering = self.default_ordering
+        return ordering
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                size = int(request.query_params[self.page_size_query_param])
+                if size > 0:
+                    return min(size, self.max_page_size)
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def get_position(self, row):
+        field = self.ordering.lstrip("-")
+        if isinstance(row, dict):
+            return row[field], row[self.tiebreaker]
+        return getattr(row, field), getattr(row, self.tiebreaker)
+
+    # --------------------
+    # Cursor encoding
+    # --------------------
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode("ascii")))
+            if cursor["o"] != self.ordering:
+                raise ValueError("cursor was issued for a different ordering")
+            return {"v": cursor["v"], "id": int(cursor["id"]), "r": bool(cursor.get("r"))}
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, row, reverse):
+        value, pk = self.get_position(row)
+        payload = {"o": self.ordering, "v": _encode_value(value), "id": pk}
+        if reverse:
+            payload["r"] = 1
+        encoded = urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "results": data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+
+class ProductCursorPagination(KeysetPagination):
+    default_ordering = "name"
+
+
+class OrderHistoryPagination(KeysetPagination):
+    """Newest first, seeking on the ``(user, created_at, id)`` index."""
+    page_size = 20
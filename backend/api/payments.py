@@ -0,0 +1,157 @@
+import logging
+from collections import defaultdict
+
+from django.db import transaction
+
+from .carts import apply_cart_operations
+from .inventory import release_reservations
+from .models import Delivery, Order, OrderItem, Payment, StockReservation
+from .sales import record_paid_orders
+
+logger = logging.getLogger(__name__)
+
+# ==========================
+# Payment transitions
+# ==========================
+# Every change of a payment's outcome goes through these two functions,
+# whether it comes from a webhook, reconciliation or the outbox giving up.
+# They take many payments at once and only move rows that are still
+# ``pending``, so replays and concurrent callers are harmless.
+#
+# A declined card is not a failed payment: Paystack lets the buyer try the
+# same reference again, so ``charge.failed`` events and a declined verify
+# leave the payment pending and the stock held. A payment fails only once
+# it is given up on: the outbox couldn't initialize it, or reconciliation
+# finds it still unpaid long after its reservation expired (which cancels
+# the order by itself). A charge confirmed after that is still money taken,
+# so the payment is marked successful and its cancelled order is reported
+# for a refund or a manual fix.
+
+
+# Paystack statuses that won't change any more without a new attempt.
+# "abandoned" only means the buyer hasn't finished yet; for a stale payment
+# (reconciliation) nobody is coming back to it either.
+FAILED_STATUSES = ("failed", "reversed", "abandoned")
+
+
+def verification_outcome(amount, data):
+    """
+    What Paystack's verify ``data`` means for a payment of ``amount``:
+    ``("settle", "")``, ``("fail", "")``, ``("amount", detail)`` when it was
+    charged a different amount, or ``(None, "")`` while it is still open.
+    """
+    status = data.get("status")
+    if status == "success":
+        expected = int(amount * 100)
+        if data.get("amount") != expected:
+            return "amount", f"charged {data.get('amount')}, expected {expected}"
+        return "settle", ""
+    if status in FAILED_STATUSES:
+        return "fail", ""
+    return None, ""
+
+
+def settle_payments(payment_ids):
+    """
+    Paystack charged these payments: mark them successful, their orders
+    paid, commit the held stock, open a delivery and record the farmers'
+    sales (see api.sales). Returns the number of payments settled.
+    """
+    with transaction.atomic():
+        rows = list(
+            Payment.objects.select_for_update()
+            .filter(pk__in=payment_ids, status__in=("pending", "failed"))
+            .values_list("pk", "order_id")
+        )
+        if not rows:
+            return 0
+        Payment.objects.filter(pk__in=[pk for pk, _ in rows]).update(status="success")
+
+        order_ids = [order_id for _, order_id in rows]
+        pending = list(Order.objects.filter(pk__in=order_ids, status="pending").values_list("pk", "delivery_address"))
+        Order.objects.filter(pk__in=[pk for pk, _ in pending]).update(status="paid")
+        StockReservation.objects.filter(order_id__in=[pk for pk, _ in pending], status="held").update(status="committed")
+        Delivery.objects.bulk_create(
+            [Delivery(order_id=pk, address=address) for pk, address in pending],
+            ignore_conflicts=True,
+        )
+        record_paid_orders([pk for pk, _ in pending])
+
+    late = set(order_ids) - {pk for pk, _ in pending}
+    if late:
+        # Charged after the order was cancelled (its reservation expired or
+        # the payment was given up on): the stock is gone, so these need a
+        # refund or a manual fix. An error, so admins are emailed.
+        logger.error("Payments charged for orders no longer pending, refund or fix by hand: %s", sorted(late))
+    return len(rows)
+
+
+def fail_payments(payment_ids):
+    """
+    These payments are given up on: cancel their orders, return the stock
+    and put the items back in each buyer's cart. Not for a declined attempt,
+    which the buyer may retry. Returns the number of payments failed.
+    """
+    with transaction.atomic():
+        rows = list(
+            Payment.objects.select_for_update()
+            .filter(pk__in=payment_ids, status="pending")
+            .values_list("pk", "order_id")
+        )
+        if not rows:
+            return 0
+        Payment.objects.filter(pk__in=[pk for pk, _ in rows]).update(status="failed")
+
+        order_ids = list(
+            Order.objects.filter(pk__in=[order_id for _, order_id in rows], status="pending")
+            .values_list("pk", flat=True)
+        )
+        Order.objects.filter(pk__in=order_ids).update(status="cancelled")
+        for order_id in order_ids:
+            release_reservations(order_id)
+
+        carts = defaultdict(list)
+        items = OrderItem.objects.filter(order_id__in=order_ids).values_list("order__user_id", "product_id", "quantity")
+        for user_id, product_id, quantity in items:
+            carts[user_id].append({"op": "add", "product_id": product_id, "quantity": quantity})
+        for user_id, lines in carts.items():
+            apply_cart_operations(user_id, lines)
+    return len(rows)
+
+
+def apply_verification(payment_id, amount, data):
+    """
+    Apply Paystack's verify ``data`` to a payment the buyer just came back
+    from and return its status afterwards. Only a charge changes it: after
+    a declined attempt the buyer can try again, and an amount mismatch is
+    logged and leaves it pending.
+    """
+    outcome, detail = verification_outcome(amount, data)
+    if outcome == "settle":
+        settle_payments([payment_id])
+    elif outcome == "amount":
+        logger.warning("Payment %s verified with the wrong amount: %s", payment_id, detail)
+    return Payment.objects.values_list("status", flat=True).get(pk=payment_id)
+
+
+def payment_status_data(payment):
+    """
+    Checkout progress for the buyer: ``status`` is ``initializing`` until
+    Paystack returned an ``authorization_url`` (``ready``), or ``failed``.
+    ``payment`` needs its ``order`` and ``outbox`` loaded.
+    """
+    outbox = getattr(payment, "outbox", None)
+    if payment.status == "failed" or (outbox and outbox.status == "failed"):
+        state = "failed"
+    elif payment.authorization_url:
+        state = "ready"
+    else:
+        state = "initializing"
+    return {
+        "order_id": payment.order_id,
+        "order_status": payment.order.status,
+        "payment_reference": payment.reference,
+        "payment_status": payment.status,
+        "status": state,
+        "authorization_url": payment.authorization_url or None,
+    }
@@ -0,0 +1,226 @@
+import asyncio
+import json
+import threading
+import weakref
+from urllib.parse import quote, urlsplit
+
+import aiohttp
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from requests.utils import get_environ_proxies
+from urllib3.util.retry import Retry
+
+# ==========================
+# Paystack client
+# ==========================
+# Keep-alive sessions, one per thread: connections to Paystack are pooled and
+# reused instead of paying a TCP + TLS handshake per checkout. urllib3 retries
+# connection errors, and 429/502/503/504 responses to GETs, with exponential
+# backoff; anything still failing surfaces as PaystackUnavailable so the
+# caller can reschedule. A POST that got an answer isn't sent again: the
+# first may have created the transaction. If a later attempt finds its
+# reference taken, initialize_transaction looks the transaction up instead.
+
+
+class PaystackError(Exception):
+    """Paystack answered and refused the request."""
+
+
+class PaystackUnavailable(Exception):
+    """Paystack couldn't be reached or kept failing; safe to retry later."""
+
+
+_local = threading.local()
+
+
+def build_session():
+    retry = Retry(
+        total=settings.PAYSTACK_MAX_RETRIES,
+        connect=settings.PAYSTACK_MAX_RETRIES,
+        # A read timeout may mean Paystack already created the transaction,
+        # and it rejects a reused reference; leave that to the outbox.
+        read=0,
+        backoff_factor=0.5,
+        status_forcelist=(429, 502, 503, 504),
+        raise_on_status=False,
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=settings.PAYSTACK_POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    # requests re-reads proxy settings from the environment on every call,
+    # which costs more than the request itself on a fast network; resolve
+    # them once here instead.
+    session.proxies = get_environ_proxies(settings.PAYSTACK_BASE_URL)
+    session.trust_env = False
+    return session
+
+
+def get_session():
+    # requests.Session isn't documented as thread-safe, so each dispatcher
+    # thread keeps its own (still pooled and reused across calls). Keyed on
+    # the settings it was built from so overriding them takes effect.
+    key = (settings.PAYSTACK_BASE_URL, settings.PAYSTACK_MAX_RETRIES, settings.PAYSTACK_POOL_SIZE)
+    if getattr(_local, "key", None) != key:
+        _local.session = build_session()
+        _local.key = key
+    return _local.session
+
+
+def paystack_request(method, path, **kwargs):
+    url = f"{settings.PAYSTACK_BASE_URL.rstrip('/')}/{path.lstrip('/')}"
+    headers = {"Authorization": f"Bearer {settings.PAYSTACK_SECRET_KEY}"}
+    try:
+        response = get_session().request(
+            method, url, headers=headers,
+            timeout=(settings.PAYSTACK_CONNECT_TIMEOUT, settings.PAYSTACK_READ_TIMEOUT), **kwargs
+        )
+    except requests.RequestException as exc:
+        raise PaystackUnavailable(str(exc)) from exc
+    return parse_response(response.status_code, response.json)
+
+
+def parse_response(status_code, load_json):
+    if status_code == 429 or status_code >= 500:
+        raise PaystackUnavailable(f"Paystack returned {status_code}")
+    try:
+        data = load_json()
+    except ValueError as exc:
+        raise PaystackUnavailable("Paystack returned a non-JSON response") from exc
+    if not data.get("status"):
+        raise PaystackError(data.get("message") or f"Paystack returned {status_code}")
+    return data["data"]
+
+
+def initialize_payload(email, amount, reference, callback_url):
+    return {"email": email, "amount": int(amount * 100), "reference": reference, "callback_url": callback_url}
+
+
+def verify_path(reference):
+    return f"/transaction/verify/{quote(reference, safe='')}"
+
+
+def is_duplicate_reference(exc):
+    return "duplicate transaction reference" in str(exc).lower()
+
+
+def existing_transaction(reference, amount, data):
+    """
+    What initialize would have returned for ``reference``, from verify's
+    ``data``, when an earlier attempt created it but its answer was lost.
+    """
+    if data.get("amount") != int(amount * 100):
+        raise PaystackError(f"Reference {reference} exists for {data.get('amount')}, expected {int(amount * 100)}")
+    url = data.get("authorization_url")
+    if not url and data.get("access_code"):
+        url = f"{settings.PAYSTACK_CHECKOUT_URL.rstrip('/')}/{data['access_code']}"
+    if not url:
+        raise PaystackError(f"Reference {reference} exists without a checkout page")
+    return {**data, "authorization_url": url}
+
+
+def initialize_transaction(email, amount, reference, callback_url):
+    """Start a transaction for ``amount`` (in the main currency unit)."""
+    try:
+        return paystack_request(
+            "POST", "/transaction/initialize", json=initialize_payload(email, amount, reference, callback_url)
+        )
+    except PaystackError as exc:
+        if not is_duplicate_reference(exc):
+            raise
+    return existing_transaction(reference, amount, verify_transaction(reference))
+
+
+def verify_transaction(reference):
+    """Paystack's view of a transaction; ``status`` is e.g. success, failed, abandoned."""
+    return paystack_request("GET", verify_path(reference))
+
+
+# ==========================
+# Async client
+# ==========================
+# The same calls for async views (api.async_views), on an aiohttp session
+# per event loop, so a request waiting on Paystack holds no thread. Failed
+# connects, and 429/502/503/504 answers to GETs, are retried with the same
+# backoff as the sync session; read timeouts aren't, for the same reason as
+# there.
+
+RETRY_STATUSES = (429, 502, 503, 504)
+
+_async_sessions = weakref.WeakKeyDictionary()
+
+
+async def get_async_session():
+    """``(session, proxy)`` for the running event loop."""
+    loop = asyncio.get_running_loop()
+    key = (
+        settings.PAYSTACK_BASE_URL, settings.PAYSTACK_ASYNC_MAX_CONNECTIONS,
+        settings.PAYSTACK_CONNECT_TIMEOUT, settings.PAYSTACK_READ_TIMEOUT,
+    )
+    cached = _async_sessions.get(loop)
+    if cached is None or cached[0] != key:
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=settings.PAYSTACK_ASYNC_MAX_CONNECTIONS),
+            timeout=aiohttp.ClientTimeout(
+                sock_connect=settings.PAYSTACK_CONNECT_TIMEOUT, sock_read=settings.PAYSTACK_READ_TIMEOUT
+            ),
+        )
+        lifetime = _session_lifetime(session)
+        await lifetime.__anext__()
+        # Resolved once, as for the sync session.
+        proxy = get_environ_proxies(settings.PAYSTACK_BASE_URL).get(urlsplit(settings.PAYSTACK_BASE_URL).scheme)
+        cached = _async_sessions[loop] = (key, session, proxy, lifetime)
+    return cached[1], cached[2]
+
+
+async def _session_lifetime(session):
+    # Loops run per request (async views under WSGI, the test client) close
+    # with ``shutdown_asyncgens()``, which lands here and closes the session
+    # before its sockets are orphaned.
+    try:
+        yield
+    finally:
+        await session.close()
+
+
+def retry_delay(attempt):
+    # urllib3's schedule for backoff_factor=0.5: 0, 1, 2, 4... seconds.
+    return 0.5 * 2 ** (attempt - 1) if attempt > 1 else 0
+
+
+async def apaystack_request(method, path, **kwargs):
+    url = f"{settings.PAYSTACK_BASE_URL.rstrip('/')}/{path.lstrip('/')}"
+    headers = {"Authorization": f"Bearer {settings.PAYSTACK_SECRET_KEY}"}
+    session, proxy = await get_async_session()
+    for attempt in range(settings.PAYSTACK_MAX_RETRIES + 1):
+        if attempt:
+            await asyncio.sleep(retry_delay(attempt))
+        try:
+            async with session.request(method, url, headers=headers, proxy=proxy, **kwargs) as response:
+                status, body = response.status, await response.read()
+        except aiohttp.ClientConnectorError as exc:
+            if attempt == settings.PAYSTACK_MAX_RETRIES:
+                raise PaystackUnavailable(str(exc)) from exc
+            continue
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            raise PaystackUnavailable(str(exc) or "Paystack timed out") from exc
+        if status not in RETRY_STATUSES or method != "GET":
+            break
+    return parse_response(status, lambda: json.loads(body))
+
+
+async def ainitialize_transaction(email, amount, reference, callback_url):
+    try:
+        return await apaystack_request(
+            "POST", "/transaction/initialize", json=initialize_payload(email, amount, reference, callback_url)
+        )
+    except PaystackError as exc:
+        if not is_duplicate_reference(exc):
+            raise
+    return existing_transaction(reference, amount, await averify_transaction(reference))
+
+
+async def averify_transaction(reference):
+    return await apaystack_request("GET", verify_path(reference))
@@ -0,0 +1,178 @@
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# ==========================
+# Query recording
+# ==========================
+
+IN_LIST_RE = re.compile(r"IN \((?:%s, )*%s\)")
+# Savepoints depend on how deeply the caller is nested in atomic() (tests
+# wrap everything in one), so they are recorded but not budgeted.
+TRANSACTION_CONTROL = ("SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK TO SAVEPOINT")
+
+
+def query_shape(sql):
+    """Collapse variable-length IN lists so batched lookups share one shape."""
+    return IN_LIST_RE.sub("IN (...)", sql)
+
+
+class QueryRecorder:
+    """``connection.execute_wrapper`` that records each query and its duration."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - started))
+
+    @property
+    def count(self):
+        return sum(1 for sql, _ in self.queries if not sql.startswith(TRANSACTION_CONTROL))
+
+    @property
+    def total_time(self):
+        return sum(duration for _, duration in self.queries)
+
+    def repeated_shapes(self, threshold=None):
+        """
+        SELECT shapes issued ``threshold`` or more times: likely N+1 loops.
+        Repeated writes are left out; batched inserts are meant to repeat.
+        """
+        threshold = threshold or settings.QUERY_REPEAT_THRESHOLD
+        shapes = Counter(query_shape(sql) for sql, _ in self.queries if sql.lstrip().upper().startswith("SELECT"))
+        return {shape: n for shape, n in shapes.items() if n >= threshold}
+
+
+@contextmanager
+def record_queries(using="default"):
+    recorder = QueryRecorder()
+    with connections[using].execute_wrapper(recorder):
+        yield recorder
+
+
+def get_query_budget(url_name, method="GET", cold=False):
+    """
+    The budget for ``method`` requests to ``url_name``, or None. A ``cold``
+    budget adds what the view may spend rebuilding rows it normally finds
+    ready (``api.urls.COLD_PATH_QUERIES``).
+    """
+    from .urls import COLD_AUTH_QUERIES, COLD_PATH_QUERIES, QUERY_BUDGETS
+    budget = QUERY_BUDGETS.get(url_name)
+    if isinstance(budget, dict):
+        budget = budget.get(method)
+    if budget is None or not cold:
+        return budget
+    return budget + COLD_AUTH_QUERIES + COLD_PATH_QUERIES.get(url_name, 0)
+
+
+# ==========================
+# Middleware
+# ==========================
+
+class QueryCountMiddleware:
+    """
+    Record the queries each view runs and report them as ``X-Query-Count`` /
+    ``X-Query-Time-Ms`` headers. Views that exceed the budget declared in
+    ``api.urls.QUERY_BUDGETS`` or repeat a query shape are logged. A request
+    can't tell whether it took a cold path, so it is held to the cold budget.
+
+    Enabled by ``QUERY_BUDGET_ENABLED`` (defaults to DEBUG).
+    """
+
+    sync_capable = True
+    # Async too: one sync-only middleware makes Django run async views
+    # through a thread, which is what they exist to avoid.
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not settings.QUERY_BUDGET_ENABLED:
+            return self.get_response(request)
+
+        with record_queries() as recorder:
+            response = self.get_response(request)
+        return self.report(request, response, recorder)
+
+    async def __acall__(self, request):
+        if not settings.QUERY_BUDGET_ENABLED:
+            return await self.get_response(request)
+
+        # The async ORM runs queries on the request's thread-sensitive
+        # executor thread, so the wrapper goes on that thread's connection.
+        recorder = QueryRecorder()
+        await sync_to_async(lambda: connections["default"].execute_wrappers.append(recorder))()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(lambda: connections["default"].execute_wrappers.remove(recorder))()
+        return self.report(request, response, recorder)
+
+    def report(self, request, response, recorder):
+        response["X-Query-Count"] = str(recorder.count)
+        response["X-Query-Time-Ms"] = f"{recorder.total_time * 1000:.2f}"
+
+        match = getattr(request, "resolver_match", None)
+        url_name = match.url_name if match else None
+        budget = get_query_budget(url_name, request.method, cold=True)
+        if budget is not None and recorder.count > budget:
+            logger.warning(
+                "%s %s (%s) ran %d queries, budget is %d",
+                request.method, request.path, url_name, recorder.count, budget,
+            )
+        for shape, n in recorder.repeated_shapes().items():
+            logger.warning("Possible N+1 in %s (%s): %dx %.300s", request.path, url_name, n, shape)
+        return response
+
+
+# ==========================
+# Test helper
+# ==========================
+
+class QueryBudgetTestMixin:
+    """
+    ``TestCase`` mixin enforcing the budgets declared in ``api.urls``::
+
+        self.assertWithinQueryBudget("cart_items", self.client.get, "/api/cart/")
+
+    The budget is the one for the request's method; pass ``cold=True`` when
+    the test has emptied what the view would otherwise find ready.
+    """
+
+    def assertWithinQueryBudget(self, url_name, request, *args, cold=False, **kwargs):
+        with record_queries() as recorder:
+            response = request(*args, **kwargs)
+
+        method = getattr(response, "request", {}).get("REQUEST_METHOD", "GET")
+        budget = get_query_budget(url_name, method, cold=cold)
+        self.assertIsNotNone(budget, f"No query budget declared for {method} {url_name!r}")
+        self.assertLess(response.status_code, 400, f"{url_name} returned {response.status_code}")
+        executed = "\n".join(sql for sql, _ in recorder.queries)
+        self.assertLessEqual(
+            recorder.count, budget,
+            f"{url_name} ran {recorder.count} queries, budget is {budget}:\n{executed}",
+        )
+        self.assertEqual(
+            recorder.repeated_shapes(), {},
+            f"{url_name} repeats a query shape (N+1):\n{executed}",
+        )
+        return response
@@ -0,0 +1,102 @@
+import re
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.db import connections
+
+# ==========================
+# Query plans
+# ==========================
+# EXPLAIN for the queries a request runs, to catch a hot query that stops
+# using an index: a dropped index, a filter wrapped in a function, an
+# ordering nothing covers. SQLite's ``EXPLAIN QUERY PLAN`` shows a table
+# read without an index as ``SCAN <table>``, PostgreSQL's ``EXPLAIN`` as
+# ``Seq Scan on <table>``. Reading a whole index in order (``SCAN ...
+# USING INDEX``, ``Index Scan``) isn't counted: that is how a LIMITed page
+# is meant to be served. On PostgreSQL plans are taken with enable_seqscan
+# off, so a sequential scan of a small test table means no index could
+# serve the query, not that scanning was cheaper.
+
+EXPLAINED = ("SELECT", "UPDATE", "DELETE", "WITH")
+# Django aliases tables in subqueries and repeated joins: "api_order" U0.
+ALIAS_RE = re.compile(r'"(\w+)" ([A-Z]\d+)\b')
+SQLITE_SCAN_RE = re.compile(r"^SCAN (?:TABLE )?(\w+)$")
+POSTGRES_SCAN_RE = re.compile(r"Seq Scan on (\w+)")
+
+
+class PlanRecorder:
+    """``connection.execute_wrapper`` that keeps each statement and its parameters."""
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many and sql.lstrip().upper().startswith(EXPLAINED):
+            self.statements.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def record_statements(using="default"):
+    recorder = PlanRecorder()
+    with connections[using].execute_wrapper(recorder):
+        yield recorder
+
+
+def explain(sql, params, using="default"):
+    """The plan of ``sql`` as lines of text."""
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            return [row[-1] for row in cursor.fetchall()]
+        if connection.vendor == "postgresql":
+            cursor.execute("SET enable_seqscan = off")
+            try:
+                cursor.execute("EXPLAIN " + sql, params)
+                return [row[0] for row in cursor.fetchall()]
+            finally:
+                cursor.execute("RESET enable_seqscan")
+    raise NotImplementedError(f"No EXPLAIN support for {connection.vendor}")
+
+
+def full_scans(sql, plan, vendor):
+    """Tables ``plan`` reads in full, by name (aliases resolved)."""
+    tables = {model._meta.db_table for model in apps.get_models()}
+    aliases = {alias: table for table, alias in ALIAS_RE.findall(sql)}
+    if vendor == "sqlite":
+        names = [match.group(1) for match in map(SQLITE_SCAN_RE.match, plan) if match]
+    else:
+        names = [name for line in plan for name in POSTGRES_SCAN_RE.findall(line)]
+    # Anything else is a subquery or CTE, whose own tables are listed too.
+    return {aliases.get(name, name) for name in names} & tables
+
+
+# ==========================
+# Test helper
+# ==========================
+
+class QueryPlanTestMixin:
+    """
+    ``TestCase`` mixin failing when a request's queries scan a table::
+
+        self.assertNoFullScans("product-list", self.client.get, "/api/products/?category=fruits")
+
+    ``allow`` names tables the caller may read in full (e.g. a catalog-wide
+    aggregate).
+    """
+
+    def assertNoFullScans(self, label, request, *args, allow=(), **kwargs):
+        with record_statements() as recorder:
+            response = request(*args, **kwargs)
+        if hasattr(response, "status_code"):
+            self.assertLess(response.status_code, 400, f"{label} returned {response.status_code}")
+        vendor = connections["default"].vendor
+        for sql, params in recorder.statements:
+            plan = explain(sql, params)
+            scanned = full_scans(sql, plan, vendor) - set(allow)
+            self.assertFalse(
+                scanned,
+                f"{label} scans {', '.join(sorted(scanned))}:\n{sql}\n" + "\n".join(plan),
+            )
+        return response
@@ -0,0 +1,193 @@
+import json
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from itertools import islice
+
+from django.db.models.functions import Mod
+from django.utils import timezone
+
+from .models import Payment
+from .payments import fail_payments, settle_payments, verification_outcome
+from .paystack import PaystackError, PaystackUnavailable, verify_transaction
+
+# ==========================
+# Payment reconciliation
+# ==========================
+# Pending payments older than a cutoff are streamed in id order, verified
+# against Paystack on a bounded thread pool behind a token bucket, and
+# corrected a batch at a time through api.payments. After each batch the
+# last id is written to a checkpoint file, so an interrupted run resumes
+# where it stopped instead of re-verifying everything.
+
+class TokenBucket:
+    """Allow ``rate`` acquisitions per second on average, bursting to ``burst``."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def read_checkpoint(path):
+    try:
+        with open(path) as fileobj:
+            return json.load(fileobj)
+    except FileNotFoundError:
+        return None
+
+
+def write_checkpoint(path, state):
+    # Write-then-rename so a crash never leaves a half-written checkpoint.
+    temp = f"{path}.tmp"
+    with open(temp, "w") as fileobj:
+        json.dump(state, fileobj)
+    os.replace(temp, path)
+
+
+class PaymentReconciler:
+    """
+    Verify stale pending payments and apply what Paystack reports:
+    ``success`` settles, ``failed``/``abandoned`` fails, anything else is
+    left for a later run. Discrepancies (amount mismatches, references
+    Paystack doesn't know, errors) are collected, not corrected.
+    """
+
+    def __init__(self, older_than=timedelta(minutes=30), workers=16, rate=100.0, batch_size=500,
+                 chunk_size=2000, checkpoint=None, dry_run=False, max_discrepancies=1000, shard=None):
+        self.older_than = older_than
+        self.workers = workers
+        self.bucket = TokenBucket(rate) if rate else None
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.checkpoint = checkpoint
+        self.dry_run = dry_run
+        self.max_discrepancies = max_discrepancies
+        self.shard = shard
+        self.counts = Counter()
+        self.discrepancies = []
+        self.last_id = 0
+        self.elapsed = 0.0
+        self.run_checked = 0
+
+    def stale_payments(self, cutoff):
+        payments = Payment.objects.filter(status="pending", created_at__lte=cutoff, pk__gt=self.last_id)
+        if self.shard:
+            # ``(index, count)``: one of several processes splitting the
+            # backlog, each with its own checkpoint.
+            index, count = self.shard
+            payments = payments.alias(shard=Mod("pk", count)).filter(shard=index)
+        return (
+            payments.order_by("pk")
+            .values_list("pk", "reference", "amount")
+            .iterator(chunk_size=self.chunk_size)
+        )
+
+    def run(self, resume=False, limit=None):
+        state = read_checkpoint(self.checkpoint) if resume and self.checkpoint else None
+        if state:
+            self.last_id = state["last_id"]
+            self.counts.update(state["counts"])
+            cutoff = datetime.fromisoformat(state["cutoff"])
+        else:
+            cutoff = timezone.now() - self.older_than
+
+        already_checked = self.counts["checked"]
+        started = time.perf_counter()
+        rows = self.stale_payments(cutoff)
+        if limit is not None:
+            rows = islice(rows, limit)
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="reconcile") as pool:
+            # The next batch is verified while the previous one is written,
+            # so the pool never idles on the database; at most two batches
+            # are in flight.
+            previous = None
+            while True:
+                batch = list(islice(rows, self.batch_size))
+                futures = [pool.submit(self.verify, row) for row in batch]
+                if previous:
+                    self.finish(*previous, cutoff)
+                if not batch:
+                    break
+                previous = (batch, futures)
+        self.elapsed = time.perf_counter() - started
+        self.run_checked = self.counts["checked"] - already_checked
+        return self.report()
+
+    def finish(self, batch, futures, cutoff):
+        self.apply(batch, [future.result() for future in futures])
+        self.last_id = batch[-1][0]
+        if self.checkpoint:
+            write_checkpoint(self.checkpoint, {
+                "last_id": self.last_id, "cutoff": cutoff.isoformat(), "counts": dict(self.counts),
+            })
+
+    def verify(self, row):
+        if self.bucket:
+            self.bucket.acquire()
+        try:
+            return verify_transaction(row[1])
+        except PaystackError as exc:
+            return {"error": str(exc), "missing": True}
+        except PaystackUnavailable as exc:
+            return {"error": str(exc)}
+
+    def apply(self, batch, results):
+        settle, fail = [], []
+        for (pk, reference, amount), data in zip(batch, results):
+            self.counts["checked"] += 1
+            if "error" in data:
+                kind = "missing" if data.get("missing") else "error"
+                self.discrepancy(pk, reference, kind, data["error"])
+                continue
+            outcome, detail = verification_outcome(amount, data)
+            if outcome == "amount":
+                self.discrepancy(pk, reference, "amount", detail)
+            elif outcome == "settle":
+                settle.append(pk)
+            elif outcome == "fail":
+                fail.append(pk)
+            else:
+                self.counts["unchanged"] += 1
+
+        if self.dry_run:
+            self.counts["settled"] += len(settle)
+            self.counts["failed"] += len(fail)
+        else:
+            self.counts["settled"] += settle_payments(settle) if settle else 0
+            self.counts["failed"] += fail_payments(fail) if fail else 0
+
+    def discrepancy(self, pk, reference, kind, detail):
+        self.counts["discrepancies"] += 1
+        self.counts[f"discrepancies_{kind}"] += 1
+        if len(self.discrepancies) < self.max_discrepancies:
+            self.discrepancies.append({"payment": pk, "reference": reference, "kind": kind, "detail": detail})
+
+    def report(self):
+        return {
+            **{key: self.counts[key] for key in ("checked", "settled", "failed", "unchanged", "discrepancies")},
+            "discrepancy_kinds": {
+                key.split("_", 1)[1]: value for key, value in self.counts.items() if key.startswith("discrepancies_")
+            },
+            "last_id": self.last_id,
+            "elapsed": round(self.elapsed, 3),
+            "per_second": round(self.run_checked / self.elapsed, 1) if self.elapsed else None,
+            "dry_run": self.dry_run,
+        }
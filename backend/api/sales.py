@@ -0,0 +1,243 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, Exists, F, IntegerField, OuterRef, Q, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Farmer, FarmerDailySales, FarmerLedgerEntry, FarmerStats, OrderItem, Product
+
+# ==========================
+# Sales records
+# ==========================
+# When settle_payments marks orders paid it calls ``record_paid_orders`` in
+# the same transaction, which writes each farmer's share of those orders
+# three ways:
+#
+# - FarmerLedgerEntry, one row per farmer and order: their lines' units and
+#   ``price * quantity``. A mixed-farmer order counts for each farmer with
+#   their own lines only, never with the order total.
+# - FarmerDailySales, one row per farmer and day of the order, so the sales
+#   trend is a single range scan over the (farmer, day) unique index
+#   however long the window.
+# - FarmerStats, one row per farmer of running counters, so the dashboard
+#   summary is a primary-key lookup. Product creates and deletes adjust
+#   ``products`` (see signals.py).
+#
+# Counters move by F() deltas and a missing FarmerStats row is rebuilt on
+# read. ``rebuild_sales_rollup`` and ``reconcile_farmer_stats`` check or
+# recompute them from the orders.
+
+LINE_REVENUE = Sum(F("price") * F("quantity"), output_field=DecimalField())
+ZERO_TOTALS = {"orders": 0, "units": 0, "revenue": Decimal("0.00")}
+
+
+def sales_by_farmer_day(items):
+    """``(farmer_id, day, orders, units, revenue)`` for an OrderItem queryset."""
+    return (
+        items.annotate(day=TruncDate("order__created_at"))
+        .values_list("product__farmer_id", "day")
+        .annotate(orders=Count("order_id", distinct=True), units=Sum("quantity"), revenue=LINE_REVENUE)
+        .order_by()
+    )
+
+
+def add_deltas(queryset, key_fields, deltas):
+    """
+    One UPDATE adding ``deltas`` (``{key: {field: amount}}``) to the rows of
+    ``queryset`` matching each key, every row getting its own amounts.
+    """
+    keys = Q()
+    cases = defaultdict(list)
+    for key, amounts in deltas.items():
+        match = Q(**dict(zip(key_fields, key)))
+        keys |= match
+        for field, amount in amounts.items():
+            cases[field].append(When(match, then=Value(amount)))
+    return queryset.filter(keys).update(
+        updated_at=timezone.now(),
+        **{
+            field: F(field) + Case(*whens, output_field=DecimalField() if field == "revenue" else IntegerField())
+            for field, whens in cases.items()
+        },
+    )
+
+
+def record_paid_orders(order_ids):
+    """
+    Add orders that just became paid to the ledger, the daily rollup and
+    the farmer counters. Call inside the transaction that marked them paid.
+    Shares already in the ledger are skipped, so the counters only move
+    once per farmer and order however often an order is recorded.
+    """
+    if not order_ids:
+        return
+    # Only the transaction that moved an order to paid gets here with it
+    # (settle_payments' conditional update), so nothing else can insert
+    # these shares between this read and the insert below.
+    recorded = FarmerLedgerEntry.objects.filter(farmer_id=OuterRef("product__farmer_id"), order_id=OuterRef("order_id"))
+    shares = list(
+        OrderItem.objects.filter(order_id__in=order_ids)
+        .exclude(Exists(recorded))
+        .annotate(day=TruncDate("order__created_at"))
+        .values_list("product__farmer_id", "order_id", "day")
+        .annotate(units=Sum("quantity"), revenue=LINE_REVENUE)
+        .order_by()
+    )
+    if not shares:
+        return
+
+    daily = defaultdict(lambda: dict(ZERO_TOTALS))
+    stats = defaultdict(lambda: dict(ZERO_TOTALS))
+    for farmer_id, order_id, day, units, revenue in shares:
+        for totals in (daily[farmer_id, day], stats[farmer_id,]):
+            totals["orders"] += 1
+            totals["units"] += units
+            totals["revenue"] += revenue
+
+    FarmerLedgerEntry.objects.bulk_create(
+        [
+            FarmerLedgerEntry(farmer_id=farmer_id, order_id=order_id, units=units, revenue=revenue)
+            for farmer_id, order_id, day, units, revenue in shares
+        ],
+        ignore_conflicts=True,
+    )
+    FarmerDailySales.objects.bulk_create(
+        [FarmerDailySales(farmer_id=farmer_id, day=day) for farmer_id, day in daily],
+        ignore_conflicts=True,
+    )
+    add_deltas(FarmerDailySales.objects.all(), ("farmer_id", "day"), daily)
+    # Existing rows only: a missing one is rebuilt from the ledger on read.
+    add_deltas(FarmerStats.objects.all(), ("farmer_id",), stats)
+
+
+def rebuild_sales_rollup(farmer_ids=None, since=None):
+    """
+    Recompute the rollup from paid orders, for every farmer or only
+    ``farmer_ids``, from day ``since`` on. Returns the number of rows written.
+    """
+    items = OrderItem.objects.filter(order__status="paid")
+    existing = FarmerDailySales.objects.all()
+    if farmer_ids is not None:
+        items = items.filter(product__farmer_id__in=farmer_ids)
+        existing = existing.filter(farmer_id__in=farmer_ids)
+    if since is not None:
+        items = items.filter(order__created_at__date__gte=since)
+        existing = existing.filter(day__gte=since)
+    with transaction.atomic():
+        existing.delete()
+        rows = FarmerDailySales.objects.bulk_create([
+            FarmerDailySales(farmer_id=farmer_id, day=day, orders=orders, units=units, revenue=revenue)
+            for farmer_id, day, orders, units, revenue in sales_by_farmer_day(items).iterator()
+        ], batch_size=500)
+    return len(rows)
+
+
+# ==========================
+# Farmer counters
+# ==========================
+
+COUNTERS = ("products", "orders", "units", "revenue")
+
+
+def rebuild_farmer_stats(farmer_id):
+    """Recompute a farmer's counters from their products and ledger."""
+    ledger = FarmerLedgerEntry.objects.filter(farmer_id=farmer_id).aggregate(
+        orders=Count("id"), units=Sum("units"), revenue=Sum("revenue")
+    )
+    stats, _ = FarmerStats.objects.update_or_create(farmer_id=farmer_id, defaults={
+        "products": Product.objects.filter(farmer_id=farmer_id).count(),
+        "orders": ledger["orders"],
+        "units": ledger["units"] or 0,
+        "revenue": ledger["revenue"] or Decimal("0.00"),
+    })
+    return stats
+
+
+def get_farmer_stats(farmer_id):
+    try:
+        return FarmerStats.objects.get(farmer_id=farmer_id)
+    except FarmerStats.DoesNotExist:
+        return rebuild_farmer_stats(farmer_id)
+
+
+def apply_product_delta(farmer_id, products):
+    FarmerStats.objects.filter(farmer_id=farmer_id).update(
+        products=F("products") + products, updated_at=timezone.now()
+    )
+
+
+def rebuild_farmer_ledger(farmer_ids):
+    """Rewrite these farmers' ledger entries from their paid order lines."""
+    shares = (
+        OrderItem.objects.filter(order__status="paid", product__farmer_id__in=farmer_ids)
+        .values_list("product__farmer_id", "order_id")
+        .annotate(units=Sum("quantity"), revenue=LINE_REVENUE)
+        .order_by()
+    )
+    with transaction.atomic():
+        FarmerLedgerEntry.objects.filter(farmer_id__in=farmer_ids).delete()
+        FarmerLedgerEntry.objects.bulk_create([
+            FarmerLedgerEntry(farmer_id=farmer_id, order_id=order_id, units=units, revenue=revenue)
+            for farmer_id, order_id, units, revenue in shares.iterator()
+        ], batch_size=500)
+
+
+def reconcile_farmer_stats(chunk_size=500, fix=False):
+    """
+    Check every farmer's counters and ledger against totals computed from
+    their products and paid order lines, ``chunk_size`` farmers per round of
+    queries. Yields a dict for each farmer that is off; with ``fix`` their
+    ledger and counters are rebuilt.
+    """
+    farmers = Farmer.objects.order_by("pk").values_list("pk", flat=True)
+    last = None
+    while True:
+        chunk = list((farmers.filter(pk__gt=last) if last is not None else farmers)[:chunk_size])
+        if not chunk:
+            return
+        last = chunk[-1]
+
+        products = dict(
+            Product.objects.filter(farmer_id__in=chunk).values_list("farmer_id").annotate(count=Count("id")).order_by()
+        )
+        paid = {
+            farmer_id: {"orders": orders, "units": units, "revenue": revenue}
+            for farmer_id, orders, units, revenue in
+            OrderItem.objects.filter(order__status="paid", product__farmer_id__in=chunk)
+            .values_list("product__farmer_id")
+            .annotate(orders=Count("order_id", distinct=True), units=Sum("quantity"), revenue=LINE_REVENUE)
+            .order_by()
+        }
+        ledger = {
+            farmer_id: {"orders": orders, "units": units, "revenue": revenue}
+            for farmer_id, orders, units, revenue in
+            FarmerLedgerEntry.objects.filter(farmer_id__in=chunk)
+            .values_list("farmer_id")
+            .annotate(orders=Count("id"), total_units=Sum("units"), total_revenue=Sum("revenue"))
+            .order_by()
+        }
+        stats = {row["farmer_id"]: row for row in FarmerStats.objects.filter(farmer_id__in=chunk).values()}
+
+        off = []
+        for farmer_id in chunk:
+            expected = {"products": products.get(farmer_id, 0), **paid.get(farmer_id, ZERO_TOTALS)}
+            booked = ledger.get(farmer_id, ZERO_TOTALS)
+            counters = stats.get(farmer_id)
+            discrepancy = {
+                "ledger": {field: booked[field] for field in ZERO_TOTALS if booked[field] != expected[field]},
+                # No row yet is fine: it is built from the ledger on first read.
+                "stats": {
+                    field: counters[field] for field in COUNTERS
+                    if counters is not None and counters[field] != expected[field]
+                },
+            }
+            if discrepancy["ledger"] or discrepancy["stats"]:
+                off.append(farmer_id)
+                yield {"farmer_id": farmer_id, "expected": expected, **discrepancy}
+
+        if fix and off:
+            rebuild_farmer_ledger(off)
+            for farmer_id in off:
+                rebuild_farmer_stats(farmer_id)
@@ -0,0 +1,163 @@
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+
+
+# ==========================
+# Full-text product search
+# ==========================
+# Postgres keeps a generated ``search_vector`` tsvector column on api_product
+# with a GIN index; SQLite keeps an external-content FTS5 table maintained by
+# triggers. Neither column/table is known to the ORM, so the DDL lives here
+# and is applied by migration 0003 (and ``manage.py rebuild_search_index``).
+
+FTS_TABLE = "api_product_fts"
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+POSTGRES_DDL = [
+    """
+    ALTER TABLE api_product ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(category, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'C')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS api_product_search_gin ON api_product USING GIN (search_vector)",
+]
+
+POSTGRES_DROP = [
+    "DROP INDEX IF EXISTS api_product_search_gin",
+    "ALTER TABLE api_product DROP COLUMN IF EXISTS search_vector",
+]
+
+# Note: Django rebuilds SQLite tables for some AlterField/AddField operations,
+# which drops these triggers. Run ``manage.py rebuild_search_index`` after any
+# such migration on api_product.
+SQLITE_DDL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, category, description,
+        content='api_product', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON api_product BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, category, description)
+        VALUES (new.id, new.name, new.category, new.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON api_product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, category, description)
+        VALUES ('delete', old.id, old.name, old.category, old.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name, category, description ON api_product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, category, description)
+        VALUES ('delete', old.id, old.name, old.category, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, name, category, description)
+        VALUES (new.id, new.name, new.category, new.description);
+    END
+    """,
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) VALUES ('rank', 'bm25(10.0, 4.0, 1.0)')",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+SQLITE_DROP = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def search_supported(conn=None):
+    return (conn or connection).vendor in ("postgresql", "sqlite")
+
+
+def install_search_index(schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {"postgresql": POSTGRES_DDL, "sqlite": SQLITE_DDL}.get(vendor, [])
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def drop_search_index(schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {"postgresql": POSTGRES_DROP, "sqlite": SQLITE_DROP}.get(vendor, [])
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def tokenize(query):
+    return TOKEN_RE.findall(query.lower())[:16]
+
+
+def build_match(tokens, vendor):
+    """
+    Every token must match; the last one is a prefix so as-you-type queries
+    ("toma" -> "tomatoes") hit without waiting for a full word.
+    """
+    if vendor == "postgresql":
+        terms = [t for t in tokens[:-1]] + [f"{tokens[-1]}:*"]
+        return " & ".join(terms)
+    terms = [f'"{t}"' for t in tokens[:-1]] + [f'"{tokens[-1]}"*']
+    return " ".join(terms)
+
+
+def search_products(queryset, query):
+    """
+    Restrict ``queryset`` to products matching ``query`` and annotate a
+    ``search_rank`` where higher is better on every backend.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return queryset
+    vendor = connection.vendor
+    match = build_match(tokens, vendor)
+
+    if vendor == "postgresql":
+        tsquery = "to_tsquery('simple', %s)"
+        matches = RawSQL(f"api_product.search_vector @@ {tsquery}", [match], output_field=BooleanField())
+        rank = RawSQL(
+            f"ts_rank(api_product.search_vector, {tsquery})::float8", [match], output_field=FloatField()
+        )
+        return queryset.filter(matches).annotate(search_rank=rank)
+
+    # Join the FTS table directly: a correlated rank subquery would re-run the
+    # MATCH for every hit. FTS5's ``rank`` is bm25() with the column weights
+    # configured at install time and is "lower is better", so negate it.
+    queryset = queryset.extra(
+        tables=[FTS_TABLE],
+        where=[f"{FTS_TABLE}.rowid = api_product.id", f"{FTS_TABLE} MATCH %s"],
+        params=[match],
+    )
+    return queryset.annotate(search_rank=RawSQL(f"-{FTS_TABLE}.rank", [], output_field=FloatField()))
+
+
+class ProductSearchFilter(filters.SearchFilter):
+    """
+    Drop-in replacement for ``SearchFilter`` backed by the full-text index.
+
+    Results are ranked best-first unless the client asked for an explicit
+    ``?ordering=``, so it must run after ``OrderingFilter``.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        if not search_supported():
+            return super().filter_queryset(request, queryset, view)
+
+        query = request.query_params.get(self.search_param, "")
+        if not tokenize(query):
+            return queryset
+
+        queryset = search_products(queryset, query)
+        if not request.query_params.get(filters.OrderingFilter.ordering_param):
+            queryset = queryset.order_by("-search_rank")
+        return queryset
@@ -1,10 +1,11 @@
 from rest_framework import serializers
+from .fieldsets import SparseFieldsMixin
 from .models import User, Farmer, Product, Order, OrderItem, Payment, Delivery, Review, Cart
 
 # =======================
 # User Serializer
 # =======================
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
 
     class Meta:
@@ -22,17 +23,19 @@ class UserSerializer(serializers.ModelSerializer):
 # =======================
 # Farmer Serializer
 # =======================
-class FarmerSerializer(serializers.ModelSerializer):
+class FarmerSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user_detail = UserSerializer(source="user", read_only=True)
 
     class Meta:
         model = Farmer
         fields = ["user", "user_detail", "farm_name", "location", "verified"]
+        # Left out unless asked for with ?expand=, so the user isn't joined.
+        expandable_fields = ["user_detail"]
 
 # =======================
 # Product Serializer
 # =======================
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     # Display the farmer's name (read-only)
     farmer_name = serializers.CharField(source="farmer.farm_name", read_only=True)
 
@@ -46,41 +49,57 @@ class ProductSerializer(serializers.ModelSerializer):
             "description",
             "price",
             "category",
+            "stock",
             "created_at"
         ]
         read_only_fields = ["farmer", "farmer_name", "created_at"]
+        # The column is only checked by the database; a negative stock
+        # would be an IntegrityError instead of a field error.
+        extra_kwargs = {"stock": {"min_value": 0}}
 
 # =======================
 # Order and OrderItem Serializers
 # =======================
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    # ``price`` is what the buyer paid per unit; the product's may have
+    # changed since. Load ``product`` with the items (see OrderViewSet).
     product_name = serializers.CharField(source="product.name", read_only=True)
-    product_price = serializers.DecimalField(source="product.price", max_digits=10, decimal_places=2, read_only=True)
 
     class Meta:
         model = OrderItem
-        fields = ["id", "order", "product", "product_name", "product_price", "quantity"]
+        fields = ["id", "product", "product_name", "quantity", "price"]
+
+class OrderSummarySerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    # Annotated by OrderViewSet, so list screens get no item rows at all.
+    item_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Order
+        fields = ["id", "status", "total_amount", "payment_reference", "created_at", "item_count"]
 
-class OrderSerializer(serializers.ModelSerializer):
-    items = OrderItemSerializer(many=True, source="orderitem_set", read_only=True)
+class OrderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    items = OrderItemSerializer(many=True, read_only=True)
 
     class Meta:
         model = Order
-        fields = ["id", "buyer", "products", "total", "status", "created_at", "items"]
-        read_only_fields = ["buyer", "created_at", "items"]
+        fields = [
+            "id", "user", "delivery_address", "phone_number", "notes", "total_amount",
+            "status", "payment_reference", "created_at", "items",
+        ]
+        read_only_fields = ["user", "total_amount", "status", "payment_reference", "created_at", "items"]
 
 # =======================
 # Payment Serializer
 # =======================
-class PaymentSerializer(serializers.ModelSerializer):
+class PaymentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Payment
-        fields = ["id", "order", "checkout_id", "status"]
+        fields = ["id", "order", "reference", "amount", "status", "authorization_url", "created_at"]
 
 # =======================
 # Delivery Serializer
 # =======================
-class DeliverySerializer(serializers.ModelSerializer):
+class DeliverySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Delivery
         fields = ["id", "order", "status"]
@@ -88,7 +107,7 @@ class DeliverySerializer(serializers.ModelSerializer):
 # =======================
 # Review Serializer
 # =======================
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     buyer_username = serializers.CharField(source="buyer.username", read_only=True)
     product_name = serializers.CharField(source="product.name", read_only=True)
 
@@ -99,7 +118,7 @@ class ReviewSerializer(serializers.ModelSerializer):
 # =======================
 # Cart Serializer
 # =======================
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     product_name = serializers.CharField(source="product.name", read_only=True)
     product_price = serializers.DecimalField(source="product.price", max_digits=10, decimal_places=2, read_only=True)
     farmer_name = serializers.CharField(source="product.farmer.farm_name", read_only=True)
@@ -108,3 +127,25 @@ class CartSerializer(serializers.ModelSerializer):
         model = Cart
         fields = ["id", "user", "product", "product_name", "product_price", "farmer_name", "quantity", "added_at"]
         read_only_fields = ["user", "product_name", "product_price", "farmer_name", "added_at"]
+        expandable_fields = ["farmer_name"]
+
+
+class CartOperationSerializer(serializers.Serializer):
+    """
+    One step of a batch: ``add`` increases the quantity (creating the line
+    if needed), ``set`` replaces it and ``remove`` drops the line.
+    """
+    op = serializers.ChoiceField(choices=["add", "set", "remove"])
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(required=False, min_value=1, error_messages={
+        "min_value": "Quantity must be greater than zero",
+    })
+
+    def validate(self, attrs):
+        if attrs["op"] != "remove" and "quantity" not in attrs:
+            raise serializers.ValidationError({"quantity": "This field is required."})
+        return attrs
+
+
+class CartBatchSerializer(serializers.Serializer):
+    operations = CartOperationSerializer(many=True, allow_empty=False, max_length=100)
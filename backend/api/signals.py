@@ -0,0 +1,82 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .auth import forget_user, mark_claims_changed
+from .cache import bump_catalog_version
+from .models import CartSummary, Farmer, Product, User
+from .sales import apply_product_delta
+
+
+# ==========================
+# Catalog cache invalidation
+# ==========================
+# Bumped on commit so a concurrent reader can't cache pre-commit rows under
+# the new version. bulk_create()/update() don't send these signals; callers
+# using them must bump the version themselves.
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Farmer)
+@receiver(post_delete, sender=Farmer)
+def invalidate_catalog(sender, **kwargs):
+    transaction.on_commit(bump_catalog_version)
+
+
+# ==========================
+# Cart summaries
+# ==========================
+# Totals are kept as deltas of the price at the time of each cart write, so
+# a price change (or the product's cart lines cascading away) makes them
+# stale. Dropping the rows is one query; they are rebuilt on next read.
+
+@receiver(post_save, sender=Product)
+@receiver(pre_delete, sender=Product)
+def invalidate_cart_summaries(sender, instance, created=False, **kwargs):
+    if not created:
+        CartSummary.objects.filter(user__cart__product=instance).delete()
+
+
+# ==========================
+# Farmer counters
+# ==========================
+# FarmerStats.products follows creates and deletes. bulk_create() skips
+# these, so ProductImporter applies its own delta.
+
+@receiver(post_save, sender=Product)
+def count_created_product(sender, instance, created=False, **kwargs):
+    if created:
+        apply_product_delta(instance.farmer_id, 1)
+
+
+@receiver(post_delete, sender=Product)
+def count_deleted_product(sender, instance, **kwargs):
+    apply_product_delta(instance.farmer_id, -1)
+
+
+# ==========================
+# Token claims
+# ==========================
+# Any change to a user or their farm can change their claims (role,
+# is_staff, is_active, farmer, verified), so tokens issued before it stop
+# being trusted (see api.auth): recorded in the same transaction, and again
+# with the cache updated on commit. The id is read now because delete()
+# clears it.
+
+def claims_changed(user_id):
+    mark_claims_changed(user_id)
+    transaction.on_commit(lambda: forget_user(user_id))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_changed_user(sender, instance, created=False, update_fields=None, **kwargs):
+    # A new user has no tokens yet, and logging in changes no claim.
+    if not created and update_fields != frozenset(["last_login"]):
+        claims_changed(instance.pk)
+
+
+@receiver(post_save, sender=Farmer)
+@receiver(post_delete, sender=Farmer)
+def forget_changed_farmer(sender, instance, **kwargs):
+    claims_changed(instance.user_id)
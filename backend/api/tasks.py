@@ -0,0 +1,355 @@
+import logging
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import threading
+import time
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connection, connections, transaction
+from django.db.models import Exists, F, OuterRef, Subquery
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+# ==========================
+# Background tasks
+# ==========================
+# A small job queue kept in the Task table, so slow work (Paystack calls,
+# applying webhooks, admin emails) leaves the request without adding a
+# broker. Functions are registered with ``@task`` (see api.jobs) and queued
+# with ``enqueue`` inside the caller's transaction, so a job exists exactly
+# when the writes that asked for it committed.
+#
+# Workers claim a batch of due jobs, highest priority first. On PostgreSQL
+# the batch is selected ``FOR UPDATE SKIP LOCKED``, so concurrent workers
+# take disjoint batches without waiting on each other. SQLite has no row
+# locks; there the claim is a single ``UPDATE ... WHERE id IN (SELECT ...
+# LIMIT n)``, which the database write lock already serializes. A claimed
+# job is leased to its worker; jobs of a worker that died are queued again
+# once the lease runs out. Failed jobs are retried with exponential backoff
+# until ``max_attempts``; successful ones are deleted.
+
+_registry = {}
+
+
+class Retry(Exception):
+    """Raise from a task to run it again at ``run_at`` without counting a failure."""
+
+    def __init__(self, run_at=None, reason=""):
+        self.run_at = run_at
+        super().__init__(reason or "Retry requested")
+
+
+class TaskFunction:
+    def __init__(self, func, name, priority, max_attempts, every):
+        self.func = func
+        self.name = name
+        self.priority = priority
+        self.max_attempts = max_attempts
+        self.every = every
+        self.__doc__ = func.__doc__
+
+    def __call__(self, **kwargs):
+        return self.func(**kwargs)
+
+    def enqueue(self, priority=None, run_at=None, delay=None, unique_key=None, **kwargs):
+        return enqueue(self.name, kwargs, priority=priority, run_at=run_at, delay=delay, unique_key=unique_key)
+
+
+def task(name, priority=0, max_attempts=5, every=None):
+    """
+    Register a function as task ``name``. Tasks take keyword arguments that
+    survive a JSON round trip. ``every`` (seconds) makes the task periodic:
+    workers keep one run of it queued.
+    """
+    def decorator(func):
+        registered = TaskFunction(func, name, priority, max_attempts, every)
+        _registry[name] = registered
+        return registered
+    return decorator
+
+
+def registered_task(name):
+    return _registry.get(name)
+
+
+def enqueue(name, kwargs=None, priority=None, run_at=None, delay=None, unique_key=None):
+    """
+    Queue task ``name``. ``delay`` (seconds) or ``run_at`` schedule it for
+    later. With ``unique_key`` nothing is queued while another job with the
+    same key is still waiting. Returns the Task, unsaved if it was dropped.
+    """
+    registered = _registry.get(name)
+    if run_at is None:
+        run_at = timezone.now() + timedelta(seconds=delay or 0)
+    job = Task(
+        name=name,
+        kwargs=kwargs or {},
+        priority=priority if priority is not None else (registered.priority if registered else 0),
+        max_attempts=registered.max_attempts if registered else 5,
+        run_at=run_at,
+        unique_key=unique_key,
+    )
+    if unique_key:
+        # The partial unique constraint drops it if one is already queued.
+        Task.objects.bulk_create([job], ignore_conflicts=True)
+    else:
+        job.save()
+    if settings.TASKS_RUN_IN_PROCESS:
+        transaction.on_commit(wake_in_process_worker)
+    return job
+
+
+def backoff(attempts):
+    seconds = settings.TASK_BACKOFF * 2 ** max(attempts - 1, 0)
+    # Jitter so jobs that failed together don't all come back together.
+    return timedelta(seconds=min(seconds, 3600) * random.uniform(0.8, 1.2))
+
+
+# ==========================
+# Claiming and running
+# ==========================
+
+def claim(worker_id, limit=10, names=None, now=None):
+    """Lease up to ``limit`` due jobs to ``worker_id``. Returns them in run order."""
+    now = now or timezone.now()
+    due = Task.objects.filter(status="queued", run_at__lte=now)
+    if names:
+        due = due.filter(name__in=names)
+    due = due.order_by("-priority", "run_at", "id")
+    token = f"{worker_id}:{uuid.uuid4().hex[:12]}"
+    lease = {"status": "running", "locked_by": token, "locked_at": now, "attempts": F("attempts") + 1}
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(due.select_for_update(skip_locked=True).values_list("pk", flat=True)[:limit])
+            if not ids:
+                return []
+            Task.objects.filter(pk__in=ids).update(**lease)
+    else:
+        claimed = Task.objects.filter(pk__in=Subquery(due.values("pk")[:limit]), status="queued").update(**lease)
+        if not claimed:
+            return []
+    return list(Task.objects.filter(locked_by=token).order_by("-priority", "run_at", "id"))
+
+
+def requeue_stale(now=None):
+    """Queue again the jobs whose worker let the lease run out. Returns how many."""
+    now = now or timezone.now()
+    stale = Task.objects.filter(status="running", locked_at__lt=now - timedelta(seconds=settings.TASK_LEASE))
+    failed = {"status": "failed", "locked_by": "", "finished_at": now}
+    with transaction.atomic():
+        stale.filter(attempts__gte=F("max_attempts")).update(last_error="Lease expired", **failed)
+        # Only one job per unique_key may be queued. A replacement may already
+        # be (a restarted worker schedules the periodic jobs again), or two
+        # stale jobs may share a key; the extra ones are failed, not queued.
+        queued = Task.objects.filter(status="queued", unique_key=OuterRef("unique_key"))
+        earlier = Task.objects.filter(status="running", unique_key=OuterRef("unique_key"), pk__lt=OuterRef("pk"))
+        stale.filter(unique_key__isnull=False).filter(Exists(queued) | Exists(earlier)).update(
+            last_error="Lease expired; already queued again", **failed,
+        )
+        return stale.update(status="queued", locked_by="", last_error="Lease expired")
+
+
+def execute(job):
+    """Run one claimed job. Returns ``None`` on success, else the exception."""
+    registered = _registry.get(job.name)
+    if registered is None:
+        return LookupError(f"No task registered as {job.name!r}")
+    try:
+        registered(**job.kwargs)
+    except Exception as exc:
+        return exc
+    return None
+
+
+def finish(jobs, errors, now=None):
+    """Record the outcome of a batch: delete successes, retry or fail the rest."""
+    now = now or timezone.now()
+    succeeded = [job.pk for job, exc in zip(jobs, errors) if exc is None]
+    with transaction.atomic():
+        if succeeded:
+            Task.objects.filter(pk__in=succeeded).delete()
+        for job, exc in zip(jobs, errors):
+            if exc is None:
+                continue
+            error = "".join(traceback.format_exception(type(exc), exc, exc.__traceback__))[-4000:]
+            if isinstance(exc, Retry):
+                changes = {"status": "queued", "run_at": exc.run_at or now + backoff(job.attempts)}
+            elif job.attempts < job.max_attempts:
+                changes = {"status": "queued", "run_at": now + backoff(job.attempts)}
+            else:
+                changes = {"status": "failed", "finished_at": now}
+                logger.error("Task %s (%s) failed after %s attempts: %s", job.pk, job.name, job.attempts, exc)
+            Task.objects.filter(pk=job.pk, locked_by=job.locked_by).update(locked_by="", last_error=error, **changes)
+        for job in jobs:
+            registered = _registry.get(job.name)
+            if registered and registered.every and job.unique_key == periodic_key(job.name):
+                enqueue(job.name, unique_key=job.unique_key, delay=registered.every)
+
+
+def periodic_key(name):
+    return f"periodic:{name}"
+
+
+def schedule_periodic():
+    """Make sure each periodic task has a run queued."""
+    for registered in _registry.values():
+        if registered.every:
+            enqueue(registered.name, unique_key=periodic_key(registered.name))
+
+
+class Worker:
+    """
+    Claim and run jobs until ``stop`` is set. With ``burst`` it returns as
+    soon as nothing is due instead of polling every ``idle_sleep`` seconds.
+    """
+
+    def __init__(self, batch_size=10, idle_sleep=0.5, burst=False, names=None, stop=None, wake=None):
+        self.batch_size = batch_size
+        self.idle_sleep = idle_sleep
+        self.burst = burst
+        self.names = names
+        self.stop = stop or threading.Event()
+        self.wake = wake
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"[-80:]
+        self.processed = 0
+        self.failed = 0
+
+    def run(self):
+        last_requeue = 0.0
+        while not self.stop.is_set():
+            if time.monotonic() - last_requeue > settings.TASK_LEASE / 4:
+                self.attempt(requeue_stale)
+                last_requeue = time.monotonic()
+            jobs = self.attempt(claim, self.worker_id, self.batch_size, self.names)
+            if jobs:
+                errors = [execute(job) for job in jobs]
+                self.attempt(finish, jobs, errors, retries=5)
+                self.processed += len(jobs)
+                self.failed += sum(exc is not None for exc in errors)
+            elif self.burst and jobs is not None:
+                break
+            elif self.wake:
+                self.wake.wait(self.idle_sleep)
+                self.wake.clear()
+            else:
+                self.stop.wait(self.idle_sleep)
+        return self.processed
+
+    def attempt(self, func, *args, retries=1):
+        # SQLite answers a busy write lock with "database is locked"; back off
+        # and try again rather than dropping a batch's results.
+        for attempt in range(retries):
+            try:
+                return func(*args)
+            except DatabaseError:
+                if attempt == retries - 1:
+                    logger.exception("Task worker %s: %s failed", self.worker_id, func.__name__)
+                    return None
+                time.sleep(0.05 * 2 ** attempt)
+
+
+def run_pending(names=None, batch_size=100):
+    """Run every due job in this thread (tests, scripts). Returns how many ran."""
+    return Worker(batch_size=batch_size, burst=True, names=names).run()
+
+
+# ==========================
+# Worker processes
+# ==========================
+
+def serve(threads=1, **options):
+    """
+    Run ``threads`` workers in this process until SIGTERM or SIGINT; each
+    finishes its current batch first. Returns the number of jobs run.
+    """
+    stop = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *args: stop.set())
+    if not options.get("burst") and not options.get("names"):
+        schedule_periodic()
+    workers = [Worker(stop=stop, **options) for _ in range(threads)]
+
+    def run(worker):
+        try:
+            worker.run()
+        finally:
+            connection.close()
+
+    pool = [threading.Thread(target=run, args=(worker,), name=f"tasks-{n}") for n, worker in enumerate(workers)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return sum(worker.processed for worker in workers)
+
+
+def run_worker_processes(processes=1, threads=1, **options):
+    """
+    Fork ``processes`` children that each ``serve``; SIGTERM/SIGINT here is
+    passed on to them. Returns once they have all exited.
+    """
+    # Children must open their own connections, not share the parent's socket.
+    connections.close_all()
+    context = multiprocessing.get_context("fork")
+    children = [
+        context.Process(target=serve, kwargs={"threads": threads, **options}, name=f"task-worker-{n}")
+        for n in range(processes)
+    ]
+    for child in children:
+        child.start()
+
+    def forward(signum, frame):
+        for child in children:
+            if child.is_alive():
+                os.kill(child.pid, signum)
+
+    previous = {signum: signal.signal(signum, forward) for signum in (signal.SIGTERM, signal.SIGINT)}
+    try:
+        for child in children:
+            child.join()
+    finally:
+        for signum, handler in previous.items():
+            signal.signal(signum, handler)
+    return [child.exitcode for child in children]
+
+
+# ==========================
+# In-process worker
+# ==========================
+# With TASKS_RUN_IN_PROCESS each web process runs one worker thread, woken
+# as soon as a transaction that queued a job commits. Separate
+# ``run_workers`` processes can run alongside it.
+
+_in_process = None
+_in_process_lock = threading.Lock()
+_wake = threading.Event()
+
+
+def wake_in_process_worker():
+    global _in_process
+    with _in_process_lock:
+        if _in_process is None or _in_process[0] != os.getpid() or not _in_process[1].is_alive():
+            thread = threading.Thread(target=_run_in_process, daemon=True, name="tasks")
+            _in_process = (os.getpid(), thread)
+            thread.start()
+    _wake.set()
+
+
+def _run_in_process():
+    try:
+        schedule_periodic()
+        Worker(idle_sleep=settings.TASK_POLL_INTERVAL, wake=_wake).run()
+    except Exception:
+        logger.exception("In-process task worker stopped")
+    finally:
+        connection.close()
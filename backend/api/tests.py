@@ -1,3 +1,1850 @@
-from django.test import TestCase
+import csv
+import gzip
+import hashlib
+import hmac
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from base64 import urlsafe_b64encode
+from datetime import timedelta
+from decimal import Decimal
+from importlib import import_module
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlsplit
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.core import mail
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db import OperationalError, connection
+from django.db.migrations.recorder import MigrationRecorder
+from django.conf import settings
+from django.utils import timezone
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .auth import ClaimsRefreshToken
+from .fakepaystack import FakePaystack
+from .carts import cart_totals, rebuild_cart_summary
+from .log import QueuedAdminEmailHandler
+from .inventory import InsufficientStock, release_expired_reservations, release_reservations, reserve_stock
+from .models import (
+    Cart, CartSummary, Delivery, Farmer, FarmerDailySales, FarmerLedgerEntry, FarmerStats, Order, OrderItem, Payment,
+    PaymentOutbox, Product, StockReservation, Task, User, WebhookEvent,
+)
+from .outbox import dispatch_due
+from .exports import OrderExport
+from .payments import settle_payments
+from .reconcile import PaymentReconciler
+from .search import search_products
+from .sales import (
+    rebuild_farmer_ledger, rebuild_farmer_stats, rebuild_sales_rollup, reconcile_farmer_stats, record_paid_orders,
+)
+from .throttling import RateLimitStore, SharedIPThrottle, retry_after
+from .tasks import Retry, claim, enqueue, requeue_stale, run_pending, schedule_periodic, task
+from .webhooks import process_webhook_events
+from .querycount import QueryBudgetTestMixin, get_query_budget, record_queries
+from .queryplans import QueryPlanTestMixin, explain, full_scans
+
+
+def make_user(username, role="buyer", **extra):
+    return User.objects.create_user(username=username, password="pass1234", phone=username, role=role, **extra)
+
+
+def make_farmer(username, farm_name="Shamba"):
+    user = make_user(username, role="farmer")
+    return Farmer.objects.create(user=user, farm_name=farm_name, location="Nakuru")
+
+
+def jwt_client(user, **headers):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {ClaimsRefreshToken.for_user(user).access_token}", **headers)
+    return client
+
+
+# Rate limits would carry over between tests (and test runs) in the shared
+# store, so they are off except in ThrottleTests.
+_no_throttling = override_settings(THROTTLE_ENABLED=False)
+
+
+# Tokens are only trusted with a cache every process shares (api.auth).
+shared_cache = override_settings(AUTH_TRUST_TOKEN_CLAIMS=True, CACHES={"default": {
+    "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+    "LOCATION": os.path.join(tempfile.gettempdir(), "mkulima-hub-test-cache"),
+}})
+
+
+def setUpModule():
+    _no_throttling.enable()
+
+
+def tearDownModule():
+    _no_throttling.disable()
+
+
+# ==========================
+# Query budgets
+# ==========================
+
+class QueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    """Each endpoint stays within its api.urls.QUERY_BUDGETS entry with 10 rows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.farmers = [make_farmer(f"farmer{i}", f"Farm {i}") for i in range(3)]
+        cls.products = [
+            Product.objects.create(farmer=farmer, name=f"Produce {i}", price=Decimal("10.00") + i)
+            for i, farmer in enumerate(cls.farmers * 4)
+        ]
+        cls.buyer = make_user("buyer", email="buyer@example.com")
+        cls.others = [make_user(f"buyer{i}") for i in range(10)]
+        for product in cls.products[:10]:
+            Cart.objects.create(user=cls.buyer, product=product, quantity=2)
+        rebuild_cart_summary(cls.buyer.id)
+        for i, user in enumerate(cls.others):
+            order = Order.objects.create(user=user, total_amount=Decimal("20.00"), status="paid")
+            for product in cls.products[:3]:
+                OrderItem.objects.create(order=order, product=product, quantity=1, price=product.price)
+        rebuild_farmer_ledger([farmer.pk for farmer in cls.farmers])
+        for farmer in cls.farmers:
+            rebuild_farmer_stats(farmer.pk)
+
+    def setUp(self):
+        cache.clear()
+        self.buyer_client = jwt_client(self.buyer)
+        self.farmer_client = jwt_client(self.farmers[0].user)
+
+    def test_catalog(self):
+        self.assertWithinQueryBudget("product-list", self.client.get, "/api/products/")
+        self.assertWithinQueryBudget("product-list", self.farmer_client.get, "/api/products/")
+        self.assertWithinQueryBudget(
+            "product-detail", self.buyer_client.get, f"/api/products/{self.products[0].id}/"
+        )
+
+    def test_catalog_writes(self):
+        response = self.assertWithinQueryBudget(
+            "product-list", self.farmer_client.post, "/api/products/", {"name": "Beans", "price": "80.00"}, format="json"
+        )
+        url = f"/api/products/{response.json()['id']}/"
+        self.assertWithinQueryBudget("product-detail", self.farmer_client.patch, url, {"price": "85.00"}, format="json")
+        self.assertWithinQueryBudget(
+            "product-detail", self.farmer_client.put, url, {"name": "Beans", "price": "90.00"}, format="json"
+        )
+        # In carts and past orders, so the delete cascades.
+        self.assertWithinQueryBudget("product-detail", self.farmer_client.delete, f"/api/products/{self.products[0].id}/")
+
+    def test_farmers(self):
+        self.assertWithinQueryBudget("farmer-list", self.buyer_client.get, "/api/farmers/")
+        self.assertWithinQueryBudget(
+            "farmer-detail", self.farmer_client.patch, f"/api/farmers/{self.farmers[0].pk}/",
+            {"location": "Kitale"}, format="json",
+        )
+
+    def assertColdPathsWithinBudget(self, requests):
+        """Each request rebuilds what it normally reads, above its warm budget but within the cold one."""
+        with self.assertNoLogs("api.querycount", "WARNING"):
+            for name, request, url, *data in requests:
+                cache.clear()
+                CartSummary.objects.all().delete()
+                FarmerStats.objects.all().delete()
+                response = self.assertWithinQueryBudget(name, request, url, *data, format="json", cold=True)
+                warm = get_query_budget(name, response.request["REQUEST_METHOD"])
+                self.assertGreater(int(response["X-Query-Count"]), warm, f"{name} took no cold path")
+
+    @override_settings(QUERY_BUDGET_ENABLED=True)
+    def test_cold_paths(self):
+        item = Cart.objects.filter(user=self.buyer).first()
+        self.assertColdPathsWithinBudget([
+            ("cart_summary", self.buyer_client.get, "/api/cart/summary/"),
+            ("add_to_cart", self.buyer_client.post, "/api/cart/add/", {"product_id": self.products[11].id}),
+            ("update-cart-item", self.buyer_client.put, f"/api/cart/update/{item.id}/", {"quantity": 4}),
+            ("remove_from_cart", self.buyer_client.delete, f"/api/cart/remove/{item.id}/"),
+            ("farmer_dashboard", self.farmer_client.get, "/api/dashboard/farmer/"),
+            ("async_farmer_dashboard", self.farmer_client.get, "/api/async/dashboard/farmer/"),
+            ("dashboard", self.farmer_client.get, "/api/dashboard/"),
+            ("async_dashboard", self.farmer_client.get, "/api/async/dashboard/"),
+        ])
+
+    @shared_cache
+    @override_settings(QUERY_BUDGET_ENABLED=True)
+    def test_cold_paths_with_shared_cache(self):
+        # Token claims spare the user query, but the revocation marker is read first.
+        self.assertColdPathsWithinBudget([
+            ("user_info", self.buyer_client.get, "/api/user/info/"),
+            ("cart_summary", self.buyer_client.get, "/api/cart/summary/"),
+            ("farmer_dashboard", self.farmer_client.get, "/api/dashboard/farmer/"),
+            ("dashboard", self.farmer_client.get, "/api/dashboard/"),
+        ])
+
+    def test_user_info(self):
+        self.assertWithinQueryBudget("user_info", self.buyer_client.get, "/api/user/info/")
+
+    def test_cart(self):
+        item = Cart.objects.filter(user=self.buyer).first()
+        self.assertWithinQueryBudget("cart_items", self.buyer_client.get, "/api/cart/")
+        self.assertWithinQueryBudget("cart_summary", self.buyer_client.get, "/api/cart/summary/")
+        self.assertWithinQueryBudget(
+            "add_to_cart", self.buyer_client.post, "/api/cart/add/",
+            {"product_id": self.products[11].id, "quantity": 3}, format="json",
+        )
+        self.assertWithinQueryBudget(
+            "cart_batch", self.buyer_client.post, "/api/cart/batch/",
+            {"operations": [
+                {"op": "add", "product_id": product.id, "quantity": 1} for product in self.products[5:12]
+            ] + [{"op": "remove", "product_id": self.products[1].id}]},
+            format="json",
+        )
+        self.assertWithinQueryBudget(
+            "update-cart-item", self.buyer_client.put, f"/api/cart/update/{item.id}/",
+            {"quantity": 4}, format="json",
+        )
+        self.assertWithinQueryBudget(
+            "remove_from_cart", self.buyer_client.delete, f"/api/cart/remove/{item.id}/"
+        )
+
+    def test_checkout(self):
+        Product.objects.update(stock=100)
+        self.assertWithinQueryBudget(
+            "create_order_paystack", self.buyer_client.post, "/api/orders/create/",
+            {"delivery_address": "Eldoret", "phone_number": "0711000000"}, format="json",
+            HTTP_IDEMPOTENCY_KEY="budget-checkout",
+        )
+
+    def test_dashboards(self):
+        self.assertWithinQueryBudget("farmer_dashboard", self.farmer_client.get, "/api/dashboard/farmer/")
+        self.assertWithinQueryBudget("sales_trend", self.farmer_client.get, "/api/dashboard/sales/trend/")
+        self.assertWithinQueryBudget(
+            "sales_trend", self.farmer_client.get, "/api/dashboard/sales/trend/?days=365&bucket=month"
+        )
+        self.assertWithinQueryBudget("recent_orders", self.farmer_client.get, "/api/dashboard/orders/recent/")
+        self.assertWithinQueryBudget("recent_orders", jwt_client(self.others[0]).get, "/api/dashboard/orders/recent/")
+        self.assertWithinQueryBudget("buyer_dashboard", self.buyer_client.get, "/api/dashboard/buyer/")
+
+    def test_async_dashboards_match_sync(self):
+        for name, path, client in [
+            ("farmer_dashboard", "dashboard/farmer/", self.farmer_client),
+            ("sales_trend", "dashboard/sales/trend/", self.farmer_client),
+            ("recent_orders", "dashboard/orders/recent/", self.farmer_client),
+            ("recent_orders", "dashboard/orders/recent/", jwt_client(self.others[0])),
+            ("buyer_dashboard", "dashboard/buyer/", self.buyer_client),
+        ]:
+            response = self.assertWithinQueryBudget(f"async_{name}", client.get, f"/api/async/{path}")
+            self.assertEqual(response.json(), client.get(f"/api/{path}").json())
+        self.assertEqual(self.client.get("/api/async/dashboard/buyer/").status_code, 401)
+        self.assertEqual(self.farmer_client.get("/api/async/dashboard/buyer/").status_code, 403)
+
+    def test_composite_dashboard(self):
+        for client, summary in [(self.farmer_client, "farmer"), (self.buyer_client, "buyer")]:
+            response = self.assertWithinQueryBudget("dashboard", client.get, "/api/dashboard/?days=30&bucket=week")
+            self.assertEqual(response.json(), {
+                "user": client.get("/api/user/info/").json(),
+                "summary": client.get(f"/api/dashboard/{summary}/").json(),
+                "recent_orders": client.get("/api/dashboard/orders/recent/").json(),
+                "sales_trend": client.get("/api/dashboard/sales/trend/?days=30&bucket=week").json(),
+            })
+            # Cached per user: a matching ETag gets a 304 with no query but authentication's.
+            etag = response["ETag"]
+            repeat = self.assertWithinQueryBudget("dashboard", client.get, "/api/dashboard/?days=30&bucket=week")
+            self.assertEqual(repeat.content, response.content)
+            with record_queries() as recorder:
+                response = client.get("/api/dashboard/?days=30&bucket=week", HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(recorder.count, 1)
+
+            cache.clear()
+            response = self.assertWithinQueryBudget(
+                "async_dashboard", client.get, "/api/async/dashboard/?days=30&bucket=week"
+            )
+            self.assertEqual(response.content, repeat.content)
+            self.assertEqual(response["ETag"], etag)
+
+        response = self.farmer_client.get("/api/dashboard/?sections=sales_trend,summary")
+        self.assertEqual(list(response.json()), ["summary", "sales_trend"])
+        self.assertEqual(self.farmer_client.get("/api/dashboard/?sections=weather").status_code, 400)
+        self.assertEqual(self.client.get("/api/async/dashboard/").status_code, 401)
+
+
+# ==========================
+# Query plans
+# ==========================
+
+class QueryPlanTests(QueryPlanTestMixin, TestCase):
+    """Hot queries read through an index at catalog- and order-history-sized volumes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = [value for value, _ in Product.CATEGORY_CHOICES]
+        # Bulk-created, so without the password hashing make_user does.
+        users = User.objects.bulk_create(
+            [User(username=f"plan-farmer{i}", phone=f"plan-farmer{i}", role="farmer") for i in range(20)]
+            + [User(username=f"plan-buyer{i}", phone=f"plan-buyer{i}") for i in range(50)]
+        )
+        cls.farmers = Farmer.objects.bulk_create(
+            Farmer(user=user, farm_name=f"Farm {i}", location="Nakuru") for i, user in enumerate(users[:20])
+        )
+        cls.buyers = users[20:]
+        products = Product.objects.bulk_create(
+            Product(
+                farmer=cls.farmers[i % 20], name=f"Produce {i}", category=categories[i % len(categories)],
+                price=Decimal(10 + i % 500), stock=100,
+            )
+            for i in range(3000)
+        )
+        # Mostly paid, as in production; a few pending and cancelled.
+        statuses = ["paid"] * 17 + ["pending"] * 2 + ["cancelled"]
+        orders = Order.objects.bulk_create(
+            Order(user=cls.buyers[i % 50], total_amount=Decimal("30.00"), status=statuses[i % 20])
+            for i in range(2000)
+        )
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product=products[(i * 7 + n) % 3000], quantity=1, price=Decimal("15.00"))
+            for i, order in enumerate(orders) for n in range(2)
+        )
+        Payment.objects.bulk_create(
+            Payment(order=order, reference=f"PLAN-{order.pk}", amount=order.total_amount, status=order.status)
+            for order in orders
+        )
+        Cart.objects.bulk_create(Cart(user=cls.buyers[0], product=product, quantity=1) for product in products[:5])
+        rebuild_cart_summary(cls.buyers[0].pk)
+        rebuild_farmer_ledger([farmer.pk for farmer in cls.farmers])
+        for farmer in cls.farmers:
+            rebuild_farmer_stats(farmer.pk)
+        with connection.cursor() as cursor:
+            # Planner statistics, as a production database would have.
+            cursor.execute("ANALYZE")
+
+    def setUp(self):
+        cache.clear()
+        self.buyer_client = jwt_client(self.buyers[0])
+        self.farmer_client = jwt_client(self.farmers[0].user)
+
+    def test_full_scans_are_detected(self):
+        sql, params = 'SELECT "id" FROM "api_order" WHERE "total_amount" = %s', [Decimal("30.00")]
+        self.assertEqual(full_scans(sql, explain(sql, params), connection.vendor), {"api_order"})
+        sql = 'SELECT "id" FROM "api_order" U0 WHERE U0."status" = %s'
+        self.assertEqual(full_scans(sql, explain(sql, ["paid"]), connection.vendor), set())
+
+    def test_catalog(self):
+        for query in ["", "?ordering=price", "?ordering=-created_at", "?category=fruits&ordering=price",
+                      "?category=legumes"]:
+            response = self.assertNoFullScans("product-list", self.client.get, f"/api/products/{query}")
+            self.assertNoFullScans("product-list", self.client.get, response.json()["next"])
+        # A farmer's own products, newest first.
+        farmer_get = self.farmer_client.get
+        response = self.assertNoFullScans("product-list", farmer_get, "/api/products/?ordering=-created_at")
+        self.assertNoFullScans("product-list", farmer_get, response.json()["next"])
+        product = Product.objects.filter(farmer=self.farmers[1]).first()
+        self.assertNoFullScans("product-detail", self.client.get, f"/api/products/{product.pk}/")
+        self.assertNoFullScans("product-facets", self.client.get, "/api/products/facets/?category=fruits")
+
+    def test_orders_and_dashboards(self):
+        response = self.assertNoFullScans("order-list", self.buyer_client.get, "/api/orders/")
+        self.assertNoFullScans("order-list", self.buyer_client.get, response.json()["next"])
+        for path in ["/api/cart/", "/api/dashboard/buyer/", "/api/dashboard/orders/recent/"]:
+            self.assertNoFullScans(path, self.buyer_client.get, path)
+        for path in ["/api/dashboard/farmer/", "/api/dashboard/orders/recent/", "/api/dashboard/sales/trend/"]:
+            self.assertNoFullScans(path, self.farmer_client.get, path)
+
+    def test_background_sweeps(self):
+        cutoff = timezone.now() + timedelta(minutes=1)
+        reconciler = PaymentReconciler()
+        self.assertNoFullScans("stale payments", lambda: list(reconciler.stale_payments(cutoff)))
+        self.assertNoFullScans("pending export", lambda: b"".join(OrderExport(status="pending").chunks()))
+        self.assertNoFullScans("farmer ledger", rebuild_farmer_ledger, [self.farmers[0].pk])
+
+
+# ==========================
+# Keyset pagination
+# ==========================
+
+class KeysetPaginationTests(TestCase):
+    """Cursor pages cover every row once, in order, across ties in the ordering field."""
+
+    @classmethod
+    def setUpTestData(cls):
+        farmer = make_farmer("pages-farmer")
+        cls.products = [
+            Product.objects.create(farmer=farmer, name=f"Crop {i:02}", price=Decimal(10 + i % 3)) for i in range(11)
+        ]
+        # Every product shares one created_at, and groups of them a price.
+        Product.objects.update(created_at=timezone.now())
+
+    def setUp(self):
+        cache.clear()
+
+    def walk(self, url, link):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([row["id"] for row in response.json()["results"]])
+            url = response.json()[link]
+        return pages
+
+    def test_pages_forward_and_back_over_ties(self):
+        for ordering, key in [("-price", lambda p: (-p.price, -p.id)), ("created_at", lambda p: p.id)]:
+            expected = [product.id for product in sorted(self.products, key=key)]
+            forward = self.walk(f"/api/products/?ordering={ordering}&page_size=3", "next")
+            self.assertEqual([len(page) for page in forward], [3, 3, 3, 2])
+            self.assertEqual(sum(forward, []), expected, ordering)
+
+            last = self.client.get(f"/api/products/?ordering={ordering}&page_size=3").json()
+            while last["next"]:
+                last = self.client.get(last["next"]).json()
+            backward = self.walk(last["previous"], "previous")
+            self.assertEqual(sum(reversed(backward), []), expected[:-2], ordering)
+
+    def test_bad_cursors_are_rejected(self):
+        page = self.client.get("/api/products/?ordering=-price&page_size=3").json()
+        cursor = parse_qs(urlsplit(page["next"]).query)["cursor"][0]
+        for bad in ["not-base64!", "e30", cursor[:-4]]:
+            self.assertEqual(self.client.get(f"/api/products/?ordering=-price&cursor={bad}").status_code, 404, bad)
+        # Issued for -price, used with another ordering.
+        self.assertEqual(self.client.get(f"/api/products/?ordering=name&cursor={cursor}").status_code, 404)
+        # Well-formed JSON with a value of the wrong type for the field.
+        for value in ['"cheap"', "[1]", "{}"]:
+            tampered = urlsafe_b64encode(f'{{"o":"-price","v":{value},"id":1}}'.encode()).decode()
+            self.assertEqual(self.client.get(f"/api/products/?ordering=-price&cursor={tampered}").status_code, 404)
+
+
+# ==========================
+# Full-text search
+# ==========================
+
+class ProductSearchTests(TestCase):
+    """Ranking and prefix matching through the API; index upkeep through ``search_products``."""
+
+    @classmethod
+    def setUpTestData(cls):
+        farmer = make_farmer("search-farmer")
+        cls.sauce = Product.objects.create(
+            farmer=farmer, name="Chilli sauce", category="others", description="Made with ripe tomatoes"
+        )
+        cls.tomatoes = Product.objects.create(farmer=farmer, name="Tomatoes", category="vegetables")
+        cls.onions = Product.objects.create(farmer=farmer, name="Onions", category="vegetables")
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, query):
+        response = self.client.get("/api/products/", {"search": query})
+        self.assertEqual(response.status_code, 200)
+        return [row["id"] for row in response.json()["results"]]
+
+    def test_name_matches_rank_above_description_matches(self):
+        self.assertEqual(self.search("tomatoes"), [self.tomatoes.id, self.sauce.id])
+
+    def test_last_token_matches_as_a_prefix(self):
+        self.assertEqual(self.search("toma"), [self.tomatoes.id, self.sauce.id])
+        self.assertEqual(self.search("red toma"), [])
+        self.assertCountEqual(self.search("veg"), [self.tomatoes.id, self.onions.id])
+
+    def test_index_follows_inserts_updates_and_deletes(self):
+        def matches(query):
+            return set(search_products(Product.objects.all(), query).values_list("id", flat=True))
+
+        kale = Product.objects.create(farmer=self.onions.farmer, name="Kale", category="vegetables")
+        self.assertEqual(matches("kale"), {kale.id})
+
+        kale.name = "Sukuma wiki"
+        kale.save()
+        self.assertEqual(matches("kale"), set())
+        self.assertEqual(matches("sukuma"), {kale.id})
+
+        # Stock changes don't touch the indexed columns.
+        Product.objects.filter(pk=kale.pk).update(stock=5)
+        self.assertEqual(matches("sukuma"), {kale.id})
+
+        kale.delete()
+        self.assertEqual(matches("sukuma"), set())
+
+
+# ==========================
+# Catalog cache
+# ==========================
+
+class CatalogCacheTests(TestCase):
+    """Cached catalog responses carry an ETag, answer 304s, and go stale on product writes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.farmer = make_farmer("cache-farmer")
+        cls.mangoes = Product.objects.create(farmer=cls.farmer, name="Mangoes", price=Decimal("30.00"))
+        cls.beans = Product.objects.create(farmer=cls.farmer, name="Beans", price=Decimal("90.00"))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_etag_is_stable_and_if_none_match_is_a_304(self):
+        for url in ["/api/products/", f"/api/products/{self.mangoes.pk}/"]:
+            first = self.client.get(url)
+            self.assertEqual(first.status_code, 200)
+            etag = first["ETag"]
+            self.assertRegex(etag, r'^"[0-9a-f]{32}"$')
+            self.assertEqual(self.client.get(url)["ETag"], etag)
+
+            with self.assertNumQueries(0):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response["ETag"], etag)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=f'"stale", {etag}').status_code, 304)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH="*").status_code, 304)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+    def test_product_save_invalidates_cached_pages(self):
+        url = f"/api/products/{self.mangoes.pk}/"
+        list_etag = self.client.get("/api/products/")["ETag"]
+        detail_etag = self.client.get(url)["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.mangoes.price = Decimal("35.00")
+            self.mangoes.save()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Decimal(response.json()["price"]), Decimal("35.00"))
+        self.assertNotEqual(response["ETag"], detail_etag)
+        self.assertEqual(self.client.get("/api/products/", HTTP_IF_NONE_MATCH=list_etag).status_code, 200)
+
+    def test_product_delete_invalidates_cached_pages(self):
+        url = f"/api/products/{self.beans.pk}/"
+        self.assertEqual(self.client.get(url).status_code, 200)
+        listed = self.client.get("/api/products/")
+        self.assertIn(self.beans.pk, [row["id"] for row in listed.json()["results"]])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.beans.delete()
+
+        self.assertEqual(self.client.get(url).status_code, 404)
+        response = self.client.get("/api/products/", HTTP_IF_NONE_MATCH=listed["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(self.beans.pk, [row["id"] for row in response.json()["results"]])
+
+
+# ==========================
+# Catalog facets
+# ==========================
+
+class FacetTests(TestCase):
+    """Facet counts for the whole catalog and for the filters the product list takes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.green = make_farmer("facet-green", "Green Acres")
+        cls.hill = make_farmer("facet-hill", "Hill Farm")
+        for farmer, name, category, price in [
+            (cls.green, "Mangoes", "fruits", "49.99"),
+            (cls.green, "Passion fruit", "fruits", "50.00"),
+            (cls.green, "Kale", "vegetables", "20.00"),
+            (cls.green, "Tomatoes", "vegetables", "120.00"),
+            (cls.hill, "Avocado", "fruits", "250.00"),
+            (cls.hill, "Maize", "cereals", "999.99"),
+            (cls.hill, "Honey", "others", "5000.00"),
+        ]:
+            Product.objects.create(farmer=farmer, name=name, category=category, price=Decimal(price))
+
+    def setUp(self):
+        cache.clear()
+
+    def facets(self, client=None, **params):
+        response = (client or self.client).get("/api/products/facets/", params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def counts(self, facets):
+        return (
+            facets["total"],
+            {c["value"]: c["count"] for c in facets["categories"] if c["count"]},
+            [b["count"] for b in facets["price"]],
+            {f["farm_name"]: f["count"] for f in facets["farmers"]},
+        )
+
+    def test_unfiltered_catalog(self):
+        facets = self.facets()
+        self.assertEqual(self.counts(facets), (
+            7,
+            {"fruits": 3, "vegetables": 2, "cereals": 1, "others": 1},
+            [2, 1, 1, 1, 1, 0, 1],
+            {"Green Acres": 4, "Hill Farm": 3},
+        ))
+        self.assertEqual([c["value"] for c in facets["categories"]], [v for v, _ in Product.CATEGORY_CHOICES])
+        self.assertEqual([(b["min"], b["max"]) for b in facets["price"][-2:]], [("1000", "5000"), ("5000", None)])
+        self.assertEqual(facets["farmer_count"], 2)
+
+    def test_filters_narrow_every_facet(self):
+        self.assertEqual(self.counts(self.facets(category="fruits")), (
+            3, {"fruits": 3}, [1, 1, 0, 1, 0, 0, 0], {"Green Acres": 2, "Hill Farm": 1},
+        ))
+        self.assertEqual(self.counts(self.facets(search="toma")), (
+            1, {"vegetables": 1}, [0, 0, 1, 0, 0, 0, 0], {"Green Acres": 1},
+        ))
+        self.assertEqual(self.counts(self.facets(category="tubers"))[:3], (0, {}, [0] * 7))
+
+    def test_farmers_see_facets_of_their_own_products(self):
+        facets = self.facets(jwt_client(self.hill.user))
+        self.assertEqual(self.counts(facets), (
+            3, {"fruits": 1, "cereals": 1, "others": 1}, [0, 0, 0, 1, 1, 0, 1], {"Hill Farm": 3},
+        ))
+
+
+# ==========================
+# Bulk product import
+# ==========================
+
+class ProductImportTests(TestCase):
+    """``POST /api/products/import/`` with CSV uploads, checked against the rows and counters it writes."""
+
+    def setUp(self):
+        self.farmer = make_farmer("import-farmer")
+        rebuild_farmer_stats(self.farmer.pk)
+        self.client = jwt_client(self.farmer.user)
+
+    def upload(self, text, **data):
+        upload = io.BytesIO(text.encode())
+        upload.name = "catalog.csv"
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post("/api/products/import/", {"file": upload, **data}, format="multipart")
+
+    def test_mixed_rows_report_each_failure(self):
+        response = self.upload(
+            "name,price,category,stock\n"
+            "Maize,50.00,cereals,10\n"
+            "Beans,cheap,legumes,5\n"
+            "Kale,20.00,weeds,3\n"
+            "Onions,30.00,vegetables,-1\n"
+            "Cassava,15.00,tubers,7\n"
+        )
+        self.assertEqual(response.status_code, 201)
+        report = response.json()
+        self.assertEqual((report["created"], report["updated"], report["failed"]), (2, 0, 3))
+        self.assertFalse(report["errors_truncated"])
+        self.assertEqual([(e["row"], sorted(e["errors"])) for e in report["errors"]],
+                         [(2, ["price"]), (3, ["category"]), (4, ["stock"])])
+        self.assertEqual(sorted(Product.objects.filter(farmer=self.farmer).values_list("name", flat=True)),
+                         ["Cassava", "Maize"])
+        self.assertEqual(FarmerStats.objects.get(farmer=self.farmer).products, 2)
+
+    def test_second_import_updates_instead_of_duplicating(self):
+        self.upload("name,price,stock\nMaize,50.00,10\nBeans,80.00,4\n")
+        first = dict(Product.objects.filter(farmer=self.farmer).values_list("name", "pk"))
+        catalog_etag = APIClient().get("/api/products/")["ETag"]
+
+        response = self.upload("name,price,stock\nMaize,55.00,12\nRice,120.00,3\nRice,125.00,6\n")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.json()["created"], response.json()["updated"]), (1, 1))
+
+        products = {p.name: p for p in Product.objects.filter(farmer=self.farmer)}
+        self.assertEqual(sorted(products), ["Beans", "Maize", "Rice"])
+        self.assertEqual(products["Maize"].pk, first["Maize"])
+        self.assertEqual((products["Maize"].price, products["Maize"].stock), (Decimal("55.00"), 12))
+        self.assertEqual((products["Rice"].price, products["Rice"].stock), (Decimal("125.00"), 6))
+        self.assertEqual(FarmerStats.objects.get(farmer=self.farmer).products, 3)
+        self.assertNotEqual(APIClient().get("/api/products/")["ETag"], catalog_etag)
+
+    def test_dry_run_writes_nothing(self):
+        response = self.upload("name,price\nMaize,50.00\n", dry_run="true")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["created"], 1)
+        self.assertFalse(Product.objects.filter(farmer=self.farmer).exists())
+        self.assertEqual(FarmerStats.objects.get(farmer=self.farmer).products, 0)
+
+
+# ==========================
+# Token claims
+# ==========================
+
+@shared_cache
+class TokenClaimsTests(TestCase):
+    """request.user and its farmer come from the token until either changes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.farmer = make_farmer("claims-farmer")
+        cls.buyer = make_user("claims-buyer")
+
+    def setUp(self):
+        cache.clear()
+
+    def login(self, username):
+        response = self.client.post("/api/token/", {"username": username, "password": "pass1234"}, format="json")
+        return response.json()
+
+    def test_requests_resolve_the_user_without_queries(self):
+        tokens = self.login("claims-farmer")
+        claims = AccessToken(tokens["access"])
+        self.assertEqual((claims["role"], claims["farmer"], claims["verified"]), ("farmer", self.farmer.pk, False))
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        # The user's last claims change is read once, then cached.
+        self.assertEqual(client.get("/api/user/info/").status_code, 200)
+        for path in ["/api/dashboard/farmer/", "/api/async/dashboard/farmer/", "/api/products/"]:
+            with record_queries() as recorder:
+                self.assertEqual(client.get(path).status_code, 200)
+            tables = " ".join(sql for sql, _ in recorder.queries)
+            self.assertNotIn('FROM "api_user"', tables, path)
+            self.assertNotIn('FROM "api_farmer"', tables, path)
+        self.assertEqual(client.get("/api/user/info/").json()["username"], "claims-farmer")
+
+    def test_changes_invalidate_claims(self):
+        tokens = self.login("claims-farmer")
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        with self.captureOnCommitCallbacks(execute=True):
+            Farmer.objects.filter(pk=self.farmer.pk).delete()
+        # Older tokens fall back to the user as it is now, for sync and async views alike.
+        self.assertEqual(client.get("/api/dashboard/farmer/").status_code, 403)
+        self.assertEqual(client.get("/api/async/dashboard/farmer/").status_code, 403)
+
+        refreshed = self.client.post("/api/token/refresh/", {"refresh": tokens["refresh"]}, format="json").json()
+        self.assertIsNone(AccessToken(refreshed["access"])["farmer"])
+
+        user = User.objects.get(pk=self.farmer.pk)
+        user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+        self.assertEqual(client.get("/api/dashboard/buyer/").status_code, 401)
+        self.assertEqual(client.get("/api/async/dashboard/buyer/").status_code, 401)
+
+    def test_revocation_survives_cache_churn(self):
+        buyer = make_user("claims-revoked")
+        client = jwt_client(buyer)
+        self.assertEqual(client.get("/api/dashboard/buyer/").status_code, 200)
+        buyer.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            buyer.save()
+        # The change outlives the cache entries recording it: evicted, or
+        # never seen by another worker process.
+        cache.clear()
+        self.assertEqual(client.get("/api/dashboard/buyer/").status_code, 401)
+        self.assertEqual(client.get("/api/async/dashboard/buyer/").status_code, 401)
+
+    def test_untrusted_claims_load_the_user(self):
+        client = jwt_client(self.buyer)
+        with self.settings(AUTH_TRUST_TOKEN_CLAIMS=False):
+            self.assertEqual(client.get("/api/dashboard/buyer/").status_code, 200)
+            # Deactivated in another process: no signal here, nothing cached.
+            User.objects.filter(pk=self.buyer.pk).update(is_active=False)
+            self.assertEqual(client.get("/api/dashboard/buyer/").status_code, 401)
+
+
+# ==========================
+# Request throttling
+# ==========================
+
+class ThrottleTests(TestCase):
+    """Per user, per IP and per endpoint class limits, counted in a shared SQLite file."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = make_user("throttle-alice")
+        cls.bob = make_user("throttle-bob")
+
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.db = os.path.join(directory.name, "throttle.sqlite3")
+
+    def limits(self, **rates):
+        framework = dict(settings.REST_FRAMEWORK)
+        framework["DEFAULT_THROTTLE_RATES"] = {**framework["DEFAULT_THROTTLE_RATES"], **rates}
+        override = override_settings(THROTTLE_ENABLED=True, THROTTLE_DB=self.db, REST_FRAMEWORK=framework)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_catalog_reads_are_limited_per_user(self):
+        self.limits(catalog="2/min")
+        alice = jwt_client(self.alice)
+        self.assertEqual([alice.get("/api/products/").status_code for _ in range(2)], [200, 200])
+        response = alice.get("/api/products/")
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(1 <= int(response["Retry-After"]) <= 120)
+        # Other users, and endpoints outside the scope, are unaffected.
+        self.assertEqual(jwt_client(self.bob).get("/api/products/").status_code, 200)
+        self.assertEqual(alice.get("/api/cart/").status_code, 200)
+
+    def test_ip_limit_applies_across_users(self):
+        self.limits(catalog_ip="2/min")
+        self.assertEqual(jwt_client(self.alice).get("/api/products/").status_code, 200)
+        self.assertEqual(self.client.get("/api/products/").status_code, 200)
+        self.assertEqual(jwt_client(self.bob).get("/api/products/").status_code, 429)
+        self.assertEqual(jwt_client(self.bob, REMOTE_ADDR="10.0.0.2").get("/api/products/").status_code, 200)
+
+    def test_forwarded_for_does_not_reset_the_ip_limit(self):
+        self.limits(catalog_ip="2/min")
+        statuses = [
+            self.client.get("/api/products/", HTTP_X_FORWARDED_FOR=f"203.0.113.{i}").status_code
+            for i in range(3)
+        ]
+        self.assertEqual(statuses, [200, 200, 429])
+
+    def test_retry_after_is_at_least_a_second(self):
+        throttle = SharedIPThrottle()
+        throttle.wait_seconds = 0.0
+        self.assertEqual(throttle.wait(), 1)
+
+    def test_token_and_async_checkout_endpoints_are_limited(self):
+        self.limits(token="1/min", checkout="1/min")
+        credentials = {"username": "throttle-alice", "password": "pass1234"}
+        self.assertEqual(self.client.post("/api/token/", credentials, format="json").status_code, 200)
+        self.assertEqual(self.client.post("/api/token/", credentials, format="json").status_code, 429)
+
+        alice = jwt_client(self.alice)
+        self.assertEqual(alice.get("/api/async/payments/missing/verify/").status_code, 404)
+        response = alice.get("/api/async/payments/missing/verify/")
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response)
+
+    def test_stores_share_counts_and_slide(self):
+        # Two stores on one file stand in for two worker processes.
+        first, second = RateLimitStore(self.db), RateLimitStore(self.db)
+        start = 600.0
+        self.assertIsNone(first.hit("k", 2, 60, now=start))
+        self.assertIsNone(second.hit("k", 2, 60, now=start + 1))
+        self.assertAlmostEqual(first.hit("k", 2, 60, now=start + 2), 58)
+        # A quarter into the next window, three quarters of the previous one count.
+        self.assertIsNone(second.hit("k", 2, 60, now=start + 75))
+        self.assertAlmostEqual(first.hit("k", 2, 60, now=start + 75), 15)
+
+    def test_retry_after(self):
+        # Full current window: wait for it to become the previous one and fade.
+        self.assertAlmostEqual(retry_after(0, 4, 4, 0.25), 0.75)
+        self.assertAlmostEqual(retry_after(0, 8, 4, 0.25), 1.25)
+        # Previous window still weighing in: wait until it fades enough.
+        self.assertAlmostEqual(retry_after(4, 2, 4, 0.25), 0.25)
+
+
+# ==========================
+# Sales records
+# ==========================
+
+class SalesRecordTests(TestCase):
+    """Settled orders land in the ledger, daily rollup and counters the dashboards read."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.farmer = make_farmer("rollup-farmer")
+        cls.other = make_farmer("rollup-other")
+        cls.maize = Product.objects.create(farmer=cls.farmer, name="Maize", price=Decimal("50.00"))
+        cls.kale = Product.objects.create(farmer=cls.other, name="Kale", price=Decimal("20.00"))
+        cls.buyer = make_user("rollup-buyer")
+
+    def place_order(self, days_ago=0, maize=1, kale=0):
+        order = Order.objects.create(user=self.buyer, total_amount=self.maize.price * maize + self.kale.price * kale)
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+        for product, quantity in [(self.maize, maize), (self.kale, kale)]:
+            if quantity:
+                OrderItem.objects.create(order=order, product=product, quantity=quantity, price=product.price)
+        return Payment.objects.create(order=order, reference=f"ROLLUP-{order.id}", amount=order.total_amount)
+
+    def rollup(self):
+        return list(FarmerDailySales.objects.order_by("farmer_id", "day").values_list(
+            "farmer_id", "day", "orders", "units", "revenue"
+        ))
+
+    def test_settled_orders_are_rolled_up(self):
+        payments = [self.place_order(maize=2, kale=3), self.place_order(maize=1), self.place_order(days_ago=40)]
+        unpaid = self.place_order(maize=7)
+        settle_payments([payment.pk for payment in payments])
+        # A replayed settlement adds nothing.
+        settle_payments([payments[0].pk])
+
+        today = timezone.localdate()
+        rows = FarmerDailySales.objects.filter(farmer=self.farmer)
+        self.assertEqual(
+            list(rows.order_by("day").values_list("day", "orders", "units", "revenue")),
+            [(today - timedelta(days=40), 1, 1, Decimal("50.00")), (today, 2, 3, Decimal("150.00"))],
+        )
+        # Other farmers' lines count towards their own row only.
+        self.assertEqual(FarmerDailySales.objects.get(farmer=self.other).revenue, Decimal("60.00"))
+
+        rolled_up = self.rollup()
+        self.assertEqual(rebuild_sales_rollup(), 3)
+        self.assertEqual(self.rollup(), rolled_up)
+        settle_payments([unpaid.pk])
+        self.assertEqual(FarmerDailySales.objects.get(farmer=self.farmer, day=today).units, 10)
+
+    def test_recording_an_order_twice_counts_it_once(self):
+        payment = self.place_order(maize=2, kale=3)
+        settle_payments([payment.pk])
+        rolled_up = self.rollup()
+        stats = list(FarmerStats.objects.order_by("farmer_id").values_list("orders", "units", "revenue"))
+
+        record_paid_orders([payment.order_id])
+        self.assertEqual(self.rollup(), rolled_up)
+        self.assertEqual(
+            list(FarmerStats.objects.order_by("farmer_id").values_list("orders", "units", "revenue")), stats
+        )
+        self.assertEqual(FarmerLedgerEntry.objects.filter(order_id=payment.order_id).count(), 2)
+
+    def test_trend_ranges_and_buckets(self):
+        settle_payments([self.place_order(maize=2).pk, self.place_order(days_ago=40).pk])
+        client = jwt_client(self.farmer.user)
+
+        week = client.get("/api/dashboard/sales/trend/").json()
+        self.assertEqual(len(week), 7)
+        self.assertEqual(week[-1], {
+            "date": timezone.localdate().strftime("%b %d"), "start": timezone.localdate().isoformat(),
+            "orders": 1, "units": 2, "sales": 100.0,
+        })
+        self.assertEqual(sum(row["sales"] for row in week), 100.0)
+
+        quarter = client.get("/api/dashboard/sales/trend/?days=90&bucket=month").json()
+        self.assertIn(len(quarter), (3, 4))
+        self.assertEqual(sum(row["orders"] for row in quarter), 2)
+        weeks = client.get("/api/dashboard/sales/trend/?days=30&bucket=week").json()
+        self.assertEqual(sum(row["units"] for row in weeks), 2)
+        self.assertEqual(weeks, client.get("/api/async/dashboard/sales/trend/?days=30&bucket=week").json())
+
+        self.assertEqual(client.get("/api/dashboard/sales/trend/?days=1000").status_code, 400)
+        self.assertEqual(client.get("/api/async/dashboard/sales/trend/?bucket=year").status_code, 400)
+
+    def test_summary_counts_own_lines(self):
+        farmer_client, other_client = jwt_client(self.farmer.user), jwt_client(self.other.user)
+        self.assertEqual(farmer_client.get("/api/dashboard/farmer/").json(),
+                         {"products": 1, "orders": 0, "units": 0, "sales": 0.0})
+        settle_payments([self.place_order(maize=2, kale=3).pk, self.place_order(kale=1, maize=0).pk])
+        farmer_client.post("/api/products/", {"name": "Beans", "price": "80.00"}, format="json")
+
+        summary = {"products": 2, "orders": 1, "units": 2, "sales": 100.0}
+        self.assertEqual(farmer_client.get("/api/dashboard/farmer/").json(), summary)
+        self.assertEqual(farmer_client.get("/api/async/dashboard/farmer/").json(), summary)
+        self.assertEqual(other_client.get("/api/dashboard/farmer/").json(),
+                         {"products": 1, "orders": 2, "units": 4, "sales": 80.0})
+        Product.objects.get(name="Beans").delete()
+        self.assertEqual(FarmerStats.objects.get(farmer=self.farmer).products, 1)
+
+    def test_reconcile_finds_and_fixes_drift(self):
+        settle_payments([self.place_order(maize=2, kale=3).pk])
+        for farmer in (self.farmer, self.other):
+            rebuild_farmer_stats(farmer.pk)
+        self.assertEqual(list(reconcile_farmer_stats()), [])
+
+        FarmerStats.objects.filter(farmer=self.farmer).update(revenue=Decimal("1.00"))
+        self.other.ledger.all().delete()
+        # Paid without going through settle_payments.
+        order = self.place_order(maize=1).order
+        Order.objects.filter(pk=order.pk).update(status="paid")
+
+        discrepancies = {row["farmer_id"]: row for row in reconcile_farmer_stats(chunk_size=1, fix=True)}
+        drift = discrepancies[self.farmer.pk]
+        self.assertEqual(drift["expected"], {"products": 1, "orders": 2, "units": 3, "revenue": Decimal("150.00")})
+        self.assertEqual(drift["stats"], {"orders": 1, "units": 2, "revenue": Decimal("1.00")})
+        self.assertEqual(drift["ledger"], {"orders": 1, "units": 2, "revenue": Decimal("100.00")})
+        self.assertEqual(discrepancies[self.other.pk]["ledger"], {"orders": 0, "units": 0, "revenue": Decimal("0.00")})
+        self.assertEqual(list(reconcile_farmer_stats()), [])
+        self.assertEqual(FarmerStats.objects.get(farmer=self.farmer).revenue, Decimal("150.00"))
+
+
+# ==========================
+# Order export
+# ==========================
+
+class OrderExportTests(QueryBudgetTestMixin, TestCase):
+    """Order lines stream as CSV or NDJSON, filtered by farmer, date and status."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.farmer = make_farmer("export-farmer")
+        other = make_farmer("export-other")
+        cls.maize = Product.objects.create(farmer=cls.farmer, name="Maize, white", price=Decimal("50.00"))
+        kale = Product.objects.create(farmer=other, name="Kale", price=Decimal("20.00"))
+        cls.buyer = make_user("export-buyer")
+        cls.orders = []
+        for days_ago, status in [(0, "paid"), (3, "pending"), (40, "paid")]:
+            order = Order.objects.create(user=cls.buyer, total_amount=Decimal("120.00"), status=status)
+            Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+            OrderItem.objects.create(order=order, product=cls.maize, quantity=2, price=Decimal("50.00"))
+            OrderItem.objects.create(order=order, product=kale, quantity=1, price=Decimal("20.00"))
+            cls.orders.append(order)
+
+    def test_farmer_csv(self):
+        client = jwt_client(self.farmer.user)
+        response = self.assertWithinQueryBudget("export_orders", client.get, "/api/orders/export/csv/")
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertIn('filename="orders-farmer-', response["Content-Disposition"])
+        rows = list(csv.DictReader(io.StringIO(b"".join(response.streaming_content).decode())))
+        self.assertEqual([row["order_id"] for row in rows], [str(order.id) for order in self.orders])
+        self.assertEqual(rows[0]["product"], "Maize, white")
+        self.assertEqual((rows[0]["quantity"], rows[0]["line_total"]), ("2", "100.00"))
+        # Their own lines of the order, not the 120.00 it came to with the kale.
+        self.assertNotIn("order_total", rows[0])
+        self.assertEqual(rows[0]["farmer_subtotal"], "100.00")
+
+        since = (timezone.localdate() - timedelta(days=7)).isoformat()
+        response = client.get(f"/api/orders/export/csv/?since={since}&status=paid")
+        rows = list(csv.DictReader(io.StringIO(b"".join(response.streaming_content).decode())))
+        self.assertEqual([row["order_id"] for row in rows], [str(self.orders[0].id)])
+
+    def test_admin_ndjson_gzip(self):
+        admin = make_user("export-admin", is_staff=True)
+        response = jwt_client(admin).get("/api/orders/export/ndjson/?compress=gzip")
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        lines = gzip.decompress(b"".join(response.streaming_content)).decode().splitlines()
+        self.assertEqual(len(lines), 6)
+        self.assertEqual(json.loads(lines[1])["product"], "Kale")
+        self.assertEqual(json.loads(lines[1])["order_total"], "120.00")
+
+        response = jwt_client(admin).get(f"/api/orders/export/ndjson/?farmer={self.farmer.pk}")
+        self.assertEqual(len(b"".join(response.streaming_content).splitlines()), 3)
+
+    def test_csv_cells_are_not_formulas(self):
+        self.maize.name = '=HYPERLINK("http://example.com")'
+        self.maize.save()
+        self.buyer.username = "@buyer"
+        self.buyer.save()
+        response = jwt_client(self.farmer.user).get("/api/orders/export/csv/")
+        rows = list(csv.DictReader(io.StringIO(b"".join(response.streaming_content).decode())))
+        self.assertEqual(rows[0]["product"], '\'=HYPERLINK("http://example.com")')
+        self.assertEqual(rows[0]["buyer"], "'@buyer")
+        # NDJSON isn't opened by spreadsheets and keeps the values as they are.
+        response = jwt_client(self.farmer.user).get("/api/orders/export/ndjson/")
+        self.assertEqual(json.loads(next(iter(response.streaming_content)))["buyer"], "@buyer")
+
+    def test_rejected_requests(self):
+        client = jwt_client(self.farmer.user)
+        self.assertEqual(jwt_client(self.buyer).get("/api/orders/export/csv/").status_code, 403)
+        self.assertEqual(client.get("/api/orders/export/xlsx/").status_code, 400)
+        self.assertEqual(client.get("/api/orders/export/csv/?since=last-week").status_code, 400)
+        self.assertEqual(client.get("/api/orders/export/csv/?status=shipped").status_code, 400)
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "orders.csv.gz")
+            call_command("export_orders", "--gzip", "--output", path, "--farmer", str(self.farmer.pk),
+                         "--status", "paid", stderr=io.StringIO())
+            with gzip.open(path, "rt") as fileobj:
+                self.assertEqual(len(list(csv.DictReader(fileobj))), 2)
+
+
+class OrderHistoryTests(QueryBudgetTestMixin, TestCase):
+    """A buyer's orders page newest first, with items prefetched or summarised."""
+
+    @classmethod
+    def setUpTestData(cls):
+        farmer = make_farmer("history-farmer")
+        cls.products = [
+            Product.objects.create(farmer=farmer, name=f"Produce {i}", price=Decimal("10.00") + i) for i in range(3)
+        ]
+        cls.buyer = make_user("history-buyer")
+        # Created in one statement, so most share a created_at and page on the id.
+        cls.orders = Order.objects.bulk_create(
+            [Order(user=cls.buyer, total_amount=Decimal("33.00")) for _ in range(25)]
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=2, price=product.price)
+            for order in cls.orders for product in cls.products
+        ])
+        other = Order.objects.create(user=make_user("history-other"), total_amount=Decimal("10.00"))
+        OrderItem.objects.create(order=other, product=cls.products[0], quantity=1, price=Decimal("10.00"))
+
+    def setUp(self):
+        self.buyer_client = jwt_client(self.buyer)
+
+    def test_pages_with_prefetched_items(self):
+        first = self.assertWithinQueryBudget("order-list", self.buyer_client.get, "/api/orders/").json()
+        self.assertEqual(len(first["results"]), 20)
+        self.assertIsNone(first["previous"])
+        self.assertEqual(
+            [item["product_name"] for item in first["results"][0]["items"]],
+            [product.name for product in self.products],
+        )
+        second = self.assertWithinQueryBudget("order-list", self.buyer_client.get, first["next"]).json()
+        self.assertIsNone(second["next"])
+        self.assertEqual(
+            [order["id"] for order in first["results"] + second["results"]],
+            [order.id for order in sorted(self.orders, key=lambda order: (order.created_at, order.id), reverse=True)],
+        )
+
+        detail = self.assertWithinQueryBudget(
+            "order-detail", self.buyer_client.get, f"/api/orders/{self.orders[0].id}/"
+        )
+        self.assertEqual(detail.json()["items"][1]["price"], "11.00")
+        other = Order.objects.exclude(user=self.buyer).get()
+        self.assertEqual(self.buyer_client.get(f"/api/orders/{other.id}/").status_code, 404)
+
+    def test_summary_mode(self):
+        response = self.assertWithinQueryBudget("order-list", self.buyer_client.get, "/api/orders/?summary=true")
+        order = response.json()["results"][0]
+        self.assertNotIn("items", order)
+        self.assertEqual((order["item_count"], order["total_amount"]), (3, "33.00"))
+
+
+# ==========================
+# Cart summary
+# ==========================
+
+class CartSummaryTests(TestCase):
+    """The denormalized summary tracks the cart through every mutation."""
+
+    @classmethod
+    def setUpTestData(cls):
+        farmer = make_farmer("summary-farmer")
+        cls.products = [
+            Product.objects.create(farmer=farmer, name=f"Item {i}", price=Decimal("7.25") * (i + 1))
+            for i in range(4)
+        ]
+        cls.buyer = make_user("summary-buyer")
+
+    def test_cross_origin_cart_writes_pass_preflight(self):
+        response = self.client.options(
+            "/api/cart/add/", HTTP_ORIGIN="http://localhost:5173",
+            HTTP_ACCESS_CONTROL_REQUEST_METHOD="POST",
+            HTTP_ACCESS_CONTROL_REQUEST_HEADERS="authorization,content-type,prefer,idempotency-key",
+        )
+        allowed = response["Access-Control-Allow-Headers"].split(", ")
+        self.assertIn("prefer", allowed)
+        self.assertIn("idempotency-key", allowed)
+
+    def assertSummaryMatches(self, summary):
+        item_count, total = cart_totals(self.buyer.id)
+        self.assertEqual(summary["item_count"], item_count)
+        self.assertEqual(Decimal(str(summary["total"])), total)
+
+    def test_minimal_mutations(self):
+        client = jwt_client(self.buyer, HTTP_PREFER="return=minimal")
+        for product in self.products:
+            response = client.post("/api/cart/add/", {"product_id": product.id, "quantity": 2}, format="json")
+            self.assertSummaryMatches(response.data["summary"])
+        item_id = response.data["item"]["id"]
+
+        response = client.put(f"/api/cart/update/{item_id}/", {"quantity": 5}, format="json")
+        self.assertEqual(response.data["item"]["quantity"], 5)
+        self.assertSummaryMatches(response.data["summary"])
+
+        response = client.delete(f"/api/cart/remove/{item_id}/")
+        self.assertTrue(response.data["item"]["removed"])
+        self.assertSummaryMatches(response.data["summary"])
+        self.assertEqual(response.data["summary"]["item_count"], 3)
+
+    def test_batch_operations(self):
+        client = jwt_client(self.buyer)
+        first, second, third, fourth = [product.id for product in self.products]
+        client.post("/api/cart/add/", {"product_id": first, "quantity": 2}, format="json")
+        client.post("/api/cart/add/", {"product_id": fourth, "quantity": 1}, format="json")
+
+        response = client.post("/api/cart/batch/", {"operations": [
+            {"op": "add", "product_id": first, "quantity": 3},
+            {"op": "set", "product_id": second, "quantity": 4},
+            {"op": "add", "product_id": third, "quantity": 1},
+            {"op": "remove", "product_id": third},
+            {"op": "remove", "product_id": fourth},
+        ]}, format="json")
+        self.assertEqual(response.status_code, 200)
+        quantities = {item["product"]: item["quantity"] for item in response.data["items"]}
+        self.assertEqual(quantities, {first: 5, second: 4})
+        self.assertSummaryMatches(client.get("/api/cart/summary/").data)
+
+    def test_batch_rejects_invalid_operations(self):
+        client = jwt_client(self.buyer)
+        for operations in [
+            [{"op": "set", "product_id": self.products[0].id, "quantity": 0}],
+            [{"op": "add", "product_id": self.products[0].id}],
+            [{"op": "add", "product_id": self.products[0].id, "quantity": 1}, {"op": "add", "product_id": 0, "quantity": 1}],
+            [],
+        ]:
+            response = client.post("/api/cart/batch/", {"operations": operations}, format="json")
+            self.assertEqual(response.status_code, 400, operations)
+        self.assertFalse(Cart.objects.filter(user=self.buyer).exists())
+
+    def test_price_change_rebuilds_summary(self):
+        client = jwt_client(self.buyer)
+        client.post("/api/cart/add/", {"product_id": self.products[0].id, "quantity": 3}, format="json")
+        product = self.products[0]
+        product.price = Decimal("100.00")
+        product.save()
+        response = client.get("/api/cart/summary/")
+        self.assertEqual(Decimal(str(response.data["total"])), Decimal("300.00"))
+
+
+# ==========================
+# Serializer-free fast path
+# ==========================
+
+class FastPathTests(TestCase):
+    """The fast path must render the same bytes as the serializer path."""
+
+    @classmethod
+    def setUpTestData(cls):
+        farmers = [make_farmer("farmer-a", "Shamba   Bora"), make_farmer("farmer-b", "Kilimo 🌽")]
+        cls.buyer = make_user("buyer")
+        for i in range(30):
+            product = Product.objects.create(
+                farmer=farmers[i % 2], name=f"Sukuma {i}", description="Fresh \"greens\"\n",
+                price=Decimal("12.5") * i, category="vegetables",
+            )
+            if i % 3 == 0:
+                Cart.objects.create(user=cls.buyer, product=product, quantity=i + 1)
+
+    def setUp(self):
+        cache.clear()
+
+    def fetch_both(self, client, url):
+        with self.settings(API_FAST_PATH=True):
+            fast = client.get(url)
+        cache.clear()
+        with self.settings(API_FAST_PATH=False):
+            slow = client.get(url)
+        self.assertEqual(fast.status_code, 200)
+        self.assertEqual(fast["Content-Type"], slow["Content-Type"])
+        return fast.content, slow.content
+
+    def test_product_list_matches_serializer(self):
+        for url in ["/api/products/", "/api/products/?ordering=-price&page_size=7", "/api/products/?search=sukuma"]:
+            fast, slow = self.fetch_both(self.client, url)
+            self.assertEqual(fast, slow, url)
+
+    def test_cart_matches_serializer(self):
+        fast, slow = self.fetch_both(jwt_client(self.buyer), "/api/cart/")
+        self.assertEqual(fast, slow)
+
+
+# ==========================
+# Sparse fieldsets
+# ==========================
+
+@shared_cache
+class SparseFieldsTests(TestCase):
+    """?fields= and ?expand= shape the response and the SQL behind it."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.farmer = make_farmer("sparse-farmer", "Shamba Bora")
+        cls.buyer = make_user("sparse-buyer")
+        for i in range(3):
+            product = Product.objects.create(
+                farmer=cls.farmer, name=f"Kale {i}", description="Long " * 50, price=Decimal("20.00") + i
+            )
+            Cart.objects.create(user=cls.buyer, product=product, quantity=i + 1)
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, client, url):
+        with record_queries() as recorder:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json(), " ".join(sql for sql, _ in recorder.queries)
+
+    def test_fields_narrow_the_select(self):
+        for fast in (True, False):
+            with self.settings(API_FAST_PATH=fast):
+                cache.clear()
+                data, sql = self.get(self.client, "/api/products/?fields=id,name,price&ordering=-price")
+            self.assertEqual(list(data["results"][0]), ["id", "name", "price"])
+            self.assertEqual(data["results"][0]["price"], "22.00")
+            self.assertNotIn('"description"', sql)
+            self.assertNotIn('"api_farmer"', sql)
+
+        data, sql = self.get(self.client, f"/api/products/{Product.objects.first().id}/?fields=name,farmer_name")
+        self.assertEqual(data, {"farmer_name": "Shamba Bora", "name": "Kale 0"})
+        self.assertIn('"api_farmer"', sql)
+        self.assertNotIn('"description"', sql)
+
+    def test_expand_is_opt_in(self):
+        client = jwt_client(self.buyer)
+        data, sql = self.get(client, "/api/farmers/")
+        self.assertNotIn("user_detail", data[0])
+        self.assertNotIn("JOIN", sql)
+        data, sql = self.get(client, "/api/farmers/?expand=user_detail")
+        self.assertEqual(data[0]["user_detail"]["username"], "sparse-farmer")
+        self.assertIn('INNER JOIN "api_user"', sql)
+
+        for fast in (True, False):
+            with self.settings(API_FAST_PATH=fast):
+                data, sql = self.get(client, "/api/cart/")
+                self.assertNotIn("farmer_name", data["items"][0])
+                self.assertNotIn('"api_farmer"', sql)
+                data, sql = self.get(client, "/api/cart/?fields=product,quantity&expand=farmer_name")
+                self.assertEqual(
+                    data["items"][0],
+                    {"product": data["items"][0]["product"], "farmer_name": "Shamba Bora", "quantity": 1},
+                )
+                self.assertEqual(data["total"], 128.0)
+
+    def test_unknown_fields_are_rejected(self):
+        self.assertEqual(self.client.get("/api/products/?fields=id,secret").status_code, 400)
+        self.assertEqual(self.client.get("/api/products/?expand=description").status_code, 400)
+        self.assertEqual(jwt_client(self.buyer).get("/api/cart/?fields=colour").status_code, 400)
+
+
+# ==========================
+# Checkout payment outbox
+# ==========================
+
+@override_settings(
+    PAYSTACK_SECRET_KEY="sk_test_outbox",
+    PAYMENT_OUTBOX_DISPATCH_ON_COMMIT=False,
+    PAYSTACK_MAX_RETRIES=0,
+)
+class CheckoutOutboxTests(QueryBudgetTestMixin, TestCase):
+    """Checkout answers without Paystack; the outbox initializes the payment."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.paystack = FakePaystack(secret_key="sk_test_outbox").start()
+        cls.addClassCleanup(cls.paystack.stop)
+
+    @classmethod
+    def setUpTestData(cls):
+        farmer = make_farmer("outbox-farmer")
+        cls.product = Product.objects.create(farmer=farmer, name="Mango", price=Decimal("15.00"), stock=10)
+        cls.buyer = make_user("outbox-buyer", email="buyer@example.com")
+
+    def setUp(self):
+        self.paystack.failure_rate = self.paystack.decline_rate = 0.0
+        self.client = jwt_client(self.buyer)
+        self.client.post("/api/cart/add/", {"product_id": self.product.id, "quantity": 4}, format="json")
+
+    def checkout(self):
+        with self.settings(PAYSTACK_BASE_URL=self.paystack.base_url):
+            response = self.client.post("/api/orders/create/", {"delivery_address": "Kisumu", "phone_number": "0700000000"}, format="json")
+        self.assertEqual(response.status_code, 202)
+        return response
+
+    def poll(self, response):
+        return self.client.get(response.data["status_url"]).data
+
+    def test_checkout_returns_before_paystack(self):
+        requests_before = self.paystack.request_count
+        response = self.checkout()
+        self.assertEqual(self.paystack.request_count, requests_before)
+        self.assertEqual(self.poll(response)["status"], "initializing")
+        self.assertFalse(Cart.objects.filter(user=self.buyer).exists())
+
+        with self.settings(PAYSTACK_BASE_URL=self.paystack.base_url):
+            self.assertEqual(dispatch_due()["sent"], 1)
+        status = self.poll(response)
+        self.assertEqual(status["status"], "ready")
+        self.assertTrue(status["authorization_url"].startswith(self.paystack.base_url))
+        self.assertIn(response.data["payment_reference"], self.paystack.transactions)
+        self.assertEqual(self.paystack.transactions[response.data["payment_reference"]]["amount"], 6000)
+
+    def test_idempotency_key_replays_checkout(self):
+        body = {"delivery_address": "Kisumu", "phone_number": "0700000000"}
+        first = self.client.post("/api/orders/create/", body, format="json", HTTP_IDEMPOTENCY_KEY="checkout-1")
+        self.assertEqual(first.status_code, 202)
+
+        with record_queries() as recorder:
+            repeat = self.client.post("/api/orders/create/", body, format="json", HTTP_IDEMPOTENCY_KEY="checkout-1")
+        self.assertEqual(repeat.status_code, 202)
+        self.assertEqual(repeat["Idempotent-Replayed"], "true")
+        self.assertEqual(repeat.json(), first.json())
+        self.assertEqual(repeat["Location"], first["Location"])
+        self.assertLessEqual(recorder.count, 2)  # the user and the key
+        self.assertEqual(Order.objects.filter(user=self.buyer).count(), 1)
+        self.assertEqual(OrderItem.objects.filter(order__user=self.buyer).count(), 1)
+
+        reused = self.client.post(
+            "/api/orders/create/", {**body, "notes": "changed"}, format="json", HTTP_IDEMPOTENCY_KEY="checkout-1"
+        )
+        self.assertEqual(reused.status_code, 422)
+
+    def test_failed_checkout_does_not_store_key(self):
+        body = {"delivery_address": "Kisumu", "phone_number": "0700000000"}
+        Product.objects.filter(pk=self.product.pk).update(stock=1)
+        response = self.client.post("/api/orders/create/", body, format="json", HTTP_IDEMPOTENCY_KEY="checkout-2")
+        self.assertEqual(response.status_code, 409)
+        Product.objects.filter(pk=self.product.pk).update(stock=10)
+        response = self.client.post("/api/orders/create/", body, format="json", HTTP_IDEMPOTENCY_KEY="checkout-2")
+        self.assertEqual(response.status_code, 202)
+
+    def test_products_listed_before_stock_tracking_can_be_bought(self):
+        untrack = import_module("api.migrations.0015_untracked_stock").untrack_unset_stock
+        farmer = self.product.farmer
+        old = Product.objects.create(farmer=farmer, name="Old maize", price=Decimal("5.00"))
+        sold_out = Product.objects.create(farmer=farmer, name="Old beans", price=Decimal("5.00"))
+        Product.objects.filter(pk__in=[old.pk, sold_out.pk]).update(stock=0)
+        StockReservation.objects.create(
+            order=Order.objects.create(user=self.buyer, total_amount=Decimal("5.00"), phone_number="0700000000"),
+            product=sold_out, quantity=1,
+            status="committed", expires_at=timezone.now(),
+        )
+        MigrationRecorder.Migration.objects.filter(app="api", name="0004_stock_reservations").update(
+            applied=timezone.now() + timedelta(minutes=1)
+        )
+        untrack(django_apps, SimpleNamespace(connection=connection))
+        self.assertEqual(dict(Product.objects.filter(farmer=farmer).values_list("name", "stock")),
+                         {"Mango": 10, "Old maize": None, "Old beans": 0})
+
+        for _ in range(2):
+            self.client.post("/api/cart/add/", {"product_id": old.pk, "quantity": 500}, format="json")
+            self.checkout()
+        old.refresh_from_db()
+        self.assertIsNone(old.stock)
+        self.assertEqual(StockReservation.objects.filter(product=old, status="held").count(), 2)
+        release_reservations(Order.objects.filter(items__product=old).first())
+        old.refresh_from_db()
+        self.assertIsNone(old.stock)
+
+        self.client.post("/api/cart/add/", {"product_id": sold_out.pk, "quantity": 1}, format="json")
+        response = self.client.post(
+            "/api/orders/create/", {"delivery_address": "Kisumu", "phone_number": "0700000000"}, format="json"
+        )
+        self.assertEqual((response.status_code, response.json()["product_id"]), (409, sold_out.pk))
+
+    def test_unavailable_paystack_is_retried(self):
+        response = self.checkout()
+        self.paystack.failure_rate = 1.0
+        with self.settings(PAYSTACK_BASE_URL=self.paystack.base_url):
+            self.assertEqual(dispatch_due()["pending"], 1)
+            # Backed off: nothing is due straight away.
+            self.assertEqual(dispatch_due(), {})
+            self.paystack.failure_rate = 0.0
+            later = timezone.now() + timedelta(minutes=5)
+            self.assertEqual(dispatch_due(now=later)["sent"], 1)
+        entry = PaymentOutbox.objects.get(payment__reference=response.data["payment_reference"])
+        self.assertEqual(entry.attempts, 2)
+        self.assertEqual(self.poll(response)["status"], "ready")
+
+    def test_initialize_is_not_resent_and_a_taken_reference_is_reused(self):
+        response = self.checkout()
+        reference = response.data["payment_reference"]
+        self.paystack.failure_rate = 1.0
+        requests_before = self.paystack.request_count
+        with self.settings(PAYSTACK_BASE_URL=self.paystack.base_url, PAYSTACK_MAX_RETRIES=2):
+            self.assertEqual(dispatch_due()["pending"], 1)
+        # A 503 to a POST isn't retried by the client: it may have been applied.
+        self.assertEqual(self.paystack.request_count, requests_before + 1)
+
+        # Say it was: the next attempt finds the reference taken and uses it.
+        self.paystack.failure_rate = 0.0
+        self.paystack.add_transaction(reference, 6000, status="abandoned")
+        access_code = self.paystack.transactions[reference]["access_code"]
+        with self.settings(PAYSTACK_BASE_URL=self.paystack.base_url, PAYSTACK_CHECKOUT_URL="https://pay.test"):
+            self.assertEqual(dispatch_due(now=timezone.now() + timedelta(minutes=5))["sent"], 1)
+        status = self.poll(response)
+        self.assertEqual(status["status"], "ready")
+        self.assertEqual(status["authorization_url"], f"https://pay.test/{access_code}")
+
+    def test_task_worker_initializes_payment(self):
+        response = self.checkout()
+        job = Task.objects.get(name="payments.initialize")
+        self.assertEqual(job.kwargs, {"entry_id": PaymentOutbox.objects.get().pk})
+
+        self.paystack.failure_rate = 1.0
+        with self.settings(PAYSTACK_BASE_URL=self.paystack.base_url):
+            self.assertEqual(run_pending(names=["payments.initialize"]), 1)
+            # Requeued for the outbox's own backoff, not failed.
+            job.refresh_from_db()
+            self.assertEqual(job.status, "queued")
+            self.assertEqual(job.run_at, PaymentOutbox.objects.get().next_attempt_at)
+            self.paystack.failure_rate = 0.0
+            Task.objects.filter(pk=job.pk).update(run_at=timezone.now())
+            PaymentOutbox.objects.update(next_attempt_at=timezone.now())
+            self.assertEqual(run_pending(names=["payments.initialize"]), 1)
+        self.assertEqual(self.poll(response)["status"], "ready")
+        self.assertFalse(Task.objects.filter(name="payments.initialize").exists())
+
+    def test_async_status_matches_sync(self):
+        response = self.checkout()
+        url = f"/api/async/orders/{response.data['order_id']}/payment/"
+        waiting = self.client.get(url)
+        self.assertEqual(waiting.json()["status"], "initializing")
+        self.assertEqual(waiting["Retry-After"], "1")
+        with self.settings(PAYSTACK_BASE_URL=self.paystack.base_url):
+            dispatch_due()
+        self.assertEqual(self.client.get(f"{url}?wait=5").json(), self.poll(response))
+        self.assertEqual(jwt_client(make_user("outbox-other")).get(url).status_code, 404)
+
+    def test_verify_payment(self):
+        reference = self.checkout().data["payment_reference"]
+        with self.settings(PAYSTACK_BASE_URL=self.paystack.base_url):
+            dispatch_due()
+            for prefix in ("/api/", "/api/async/"):
+                # Initialized but not paid yet: stays pending.
+                response = self.client.get(f"{prefix}payments/{reference}/verify/")
+                self.assertEqual(response.json()["payment_status"], "pending")
+
+            self.paystack.settle(reference)
+            response = self.assertWithinQueryBudget(
+                "async_verify_payment", self.client.get, f"/api/async/payments/{reference}/verify/"
+            )
+        self.assertEqual(response.json(), {"payment_reference": reference, "payment_status": "success"})
+        self.assertEqual(Order.objects.get(payment_reference=reference).status, "paid")
+        self.assertTrue(Delivery.objects.filter(order__payment_reference=reference).exists())
+
+    def test_declined_initialization_restores_cart(self):
+        response = self.checkout()
+        self.paystack.decline_rate = 1.0
+        with self.settings(PAYSTACK_BASE_URL=self.paystack.base_url):
+            self.assertEqual(dispatch_due()["failed"], 1)
+        status = self.poll(response)
+        self.assertEqual(status["status"], "failed")
+        self.assertEqual(status["order_status"], "cancelled")
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 10)
+        self.assertEqual(Cart.objects.get(user=self.buyer).quantity, 4)
+
+
+# ==========================
+# Paystack webhooks
+# ==========================
+
+@override_settings(PAYSTACK_SECRET_KEY="sk_test_webhooks", WEBHOOK_PROCESS_ON_RECEIPT=False)
+class PaystackWebhookTests(QueryBudgetTestMixin, TestCase):
+    """Events are stored once on receipt and applied in batches."""
+
+    @classmethod
+    def setUpTestData(cls):
+        farmer = make_farmer("webhook-farmer")
+        cls.product = Product.objects.create(farmer=farmer, name="Beans", price=Decimal("30.00"), stock=20)
+        cls.buyer = make_user("webhook-buyer")
+
+    def place_order(self, quantity=2):
+        order = Order.objects.create(
+            user=self.buyer, total_amount=self.product.price * quantity, delivery_address="Thika"
+        )
+        OrderItem.objects.create(order=order, product=self.product, quantity=quantity, price=self.product.price)
+        reserve_stock(order, [(self.product.id, quantity)])
+        return Payment.objects.create(order=order, reference=f"REF-{order.id}", amount=order.total_amount)
+
+    def deliver(self, event, payment, amount=None, signature=None):
+        body = json.dumps({"event": event, "data": {
+            "id": payment.pk * 1000, "reference": payment.reference,
+            "amount": amount if amount is not None else int(payment.amount * 100),
+        }}).encode()
+        signature = signature or hmac.new(b"sk_test_webhooks", body, hashlib.sha512).hexdigest()
+        return self.client.post(
+            "/api/payments/webhook/paystack/", body, content_type="application/json",
+            HTTP_X_PAYSTACK_SIGNATURE=signature,
+        )
+
+    def test_signature_is_checked(self):
+        payment = self.place_order()
+        self.assertEqual(self.deliver("charge.success", payment, signature="0" * 128).status_code, 401)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    def test_receipt_is_one_insert_and_redeliveries_are_dropped(self):
+        payment = self.place_order()
+        self.assertWithinQueryBudget("paystack_webhook", self.deliver, "charge.success", payment)
+        self.assertEqual(self.deliver("charge.success", payment).status_code, 200)
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+
+    def test_batch_applies_transitions(self):
+        paid = [self.place_order() for _ in range(3)]
+        declined = self.place_order(quantity=5)
+        short = self.place_order()
+        for payment in paid:
+            self.deliver("charge.success", payment)
+        self.deliver("charge.failed", declined)
+        self.deliver("charge.success", short, amount=100)
+
+        with record_queries() as recorder:
+            outcomes = process_webhook_events()
+        self.assertEqual(outcomes, {"processed": 4, "failed": 1})
+        # A bigger batch of successes costs no extra queries.
+        self.assertLess(recorder.count, 30)
+
+        for payment in paid:
+            payment.refresh_from_db()
+            self.assertEqual(payment.status, "success")
+            self.assertEqual(payment.order.status, "paid")
+            self.assertEqual(payment.order.reservations.get().status, "committed")
+            self.assertEqual(Delivery.objects.get(order=payment.order).address, "Thika")
+        # A declined attempt can be retried: everything stays as it was.
+        declined.refresh_from_db()
+        self.assertEqual((declined.status, declined.order.status), ("pending", "pending"))
+        self.assertEqual(declined.order.reservations.get().status, "held")
+        self.assertFalse(Cart.objects.filter(user=self.buyer).exists())
+        self.assertIn("retry", WebhookEvent.objects.get(event="charge.failed").error)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 20 - 2 * 4 - 5)
+        short.refresh_from_db()
+        self.assertEqual(short.status, "pending")
+
+        # Replaying a success after processing changes nothing.
+        WebhookEvent.objects.all().delete()
+        self.deliver("charge.success", paid[0])
+        self.deliver("charge.failed", paid[0])
+        self.assertEqual(process_webhook_events(), {"processed": 2})
+        paid[0].refresh_from_db()
+        self.assertEqual(paid[0].status, "success")
+
+    def test_retry_after_a_declined_attempt_is_paid(self):
+        payment = self.place_order()
+        self.deliver("charge.failed", payment)
+        process_webhook_events()
+        paystack = FakePaystack(secret_key="sk_test_webhooks").start()
+        self.addCleanup(paystack.stop)
+        paystack.add_transaction(payment.reference, int(payment.amount * 100), status="failed")
+        with self.settings(PAYSTACK_BASE_URL=paystack.base_url):
+            response = jwt_client(self.buyer).get(f"/api/payments/{payment.reference}/verify/")
+        self.assertEqual(response.json()["payment_status"], "pending")
+
+        self.deliver("charge.success", payment)
+        with self.assertNoLogs("api.payments", "ERROR"):
+            self.assertEqual(process_webhook_events(), {"processed": 1})
+        payment.refresh_from_db()
+        self.assertEqual((payment.status, payment.order.status), ("success", "paid"))
+        self.assertEqual(payment.order.reservations.get().status, "committed")
+        self.assertEqual(WebhookEvent.objects.get(event="charge.success").error, "")
+
+    def test_charge_after_the_reservation_expired_is_reported(self):
+        payment = self.place_order()
+        release_expired_reservations(now=timezone.now() + timedelta(days=1))
+        self.deliver("charge.success", payment)
+        with self.assertLogs("api.payments", "ERROR") as logs:
+            self.assertEqual(process_webhook_events(), {"processed": 1})
+
+        payment.refresh_from_db()
+        # The money was taken; the order, whose stock went back, stays cancelled.
+        self.assertEqual(payment.status, "success")
+        self.assertEqual(payment.order.status, "cancelled")
+        self.assertIn(str(payment.order_id), logs.output[0])
+        self.assertIn("needs a refund", WebhookEvent.objects.get(event="charge.success").error)
+
+
+# ==========================
+# Payment reconciliation
+# ==========================
+
+@override_settings(PAYSTACK_SECRET_KEY="sk_test_reconcile", PAYSTACK_MAX_RETRIES=0)
+class PaymentReconciliationTests(TestCase):
+    """Stale pending payments are corrected from Paystack's verify API."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.paystack = FakePaystack(secret_key="sk_test_reconcile").start()
+        cls.addClassCleanup(cls.paystack.stop)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.buyer = make_user("reconcile-buyer")
+        states = ["success", "abandoned", "ongoing", "missing", "amount"]
+        cls.payments = {}
+        for state in states:
+            order = Order.objects.create(user=cls.buyer, total_amount=Decimal("40.00"))
+            cls.payments[state] = Payment.objects.create(
+                order=order, reference=f"RECON-{state}-{order.pk}", amount=order.total_amount
+            )
+        fresh = Order.objects.create(user=cls.buyer, total_amount=Decimal("40.00"))
+        cls.fresh = Payment.objects.create(order=fresh, reference=f"RECON-fresh-{fresh.pk}", amount=fresh.total_amount)
+        Payment.objects.exclude(pk=cls.fresh.pk).update(created_at=timezone.now() - timedelta(hours=1))
+
+    def setUp(self):
+        for state, payment in self.payments.items():
+            if state == "amount":
+                self.paystack.add_transaction(payment.reference, 100, status="success")
+            elif state != "missing":
+                self.paystack.add_transaction(payment.reference, 4000, status=state)
+        self.paystack.add_transaction(self.fresh.reference, 4000, status="success")
+        handle, self.checkpoint = tempfile.mkstemp(suffix=".json")
+        os.close(handle)
+        os.unlink(self.checkpoint)
+        self.addCleanup(lambda: os.path.exists(self.checkpoint) and os.unlink(self.checkpoint))
+
+    def reconciler(self, **kwargs):
+        return PaymentReconciler(workers=4, rate=0, batch_size=2, checkpoint=self.checkpoint, **kwargs)
+
+    def test_corrections_and_discrepancies(self):
+        with self.settings(PAYSTACK_BASE_URL=self.paystack.base_url):
+            report = self.reconciler().run()
+        self.assertEqual(
+            {key: report[key] for key in ("checked", "settled", "failed", "unchanged", "discrepancies")},
+            {"checked": 5, "settled": 1, "failed": 1, "unchanged": 1, "discrepancies": 2},
+        )
+        self.assertEqual(report["discrepancy_kinds"], {"missing": 1, "amount": 1})
+        statuses = dict(Payment.objects.values_list("reference", "status"))
+        self.assertEqual(statuses[self.payments["success"].reference], "success")
+        self.assertEqual(statuses[self.payments["abandoned"].reference], "failed")
+        self.assertEqual(statuses[self.payments["amount"].reference], "pending")
+        self.assertEqual(statuses[self.fresh.reference], "pending")
+
+    def test_resume_from_checkpoint(self):
+        with self.settings(PAYSTACK_BASE_URL=self.paystack.base_url):
+            first = self.reconciler(dry_run=True).run(limit=3)
+            self.assertEqual(first["checked"], 3)
+            resumed = self.reconciler(dry_run=True).run(resume=True)
+        self.assertEqual(resumed["checked"], 5)
+        self.assertEqual(resumed["last_id"], self.payments["amount"].pk)
+
+
+# ==========================
+# Background tasks
+# ==========================
+
+calls = []
+
+
+@task("tests.record")
+def record_call(label):
+    calls.append(label)
+
+
+@task("tests.flaky", max_attempts=2)
+def flaky_call():
+    raise ValueError("Flaky")
+
+
+@task("tests.later")
+def later_call():
+    raise Retry(run_at=timezone.now() + timedelta(hours=1))
+
+
+class TaskQueueTests(TestCase):
+    """Jobs are claimed by priority once due, retried with backoff and leased."""
+
+    def setUp(self):
+        calls.clear()
+
+    def test_priority_and_schedule(self):
+        enqueue("tests.record", {"label": "low"}, priority=-1)
+        enqueue("tests.record", {"label": "high"}, priority=5)
+        enqueue("tests.record", {"label": "later"}, delay=3600)
+        enqueue("tests.record", {"label": "normal"})
+        self.assertEqual(run_pending(batch_size=2), 3)
+        self.assertEqual(calls, ["high", "normal", "low"])
+        self.assertEqual(Task.objects.get().kwargs, {"label": "later"})
+
+    def test_failures_back_off_then_fail(self):
+        job = enqueue("tests.flaky")
+        self.assertEqual(run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ("queued", 1))
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIn("ValueError: Flaky", job.last_error)
+
+        Task.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        self.assertEqual(run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ("failed", 2))
+
+    def test_retry_reschedules_without_failing(self):
+        job = enqueue("tests.later")
+        run_pending()
+        job.refresh_from_db()
+        self.assertEqual(job.status, "queued")
+        self.assertGreater(job.run_at, timezone.now() + timedelta(minutes=59))
+
+    def test_unique_key_queues_once(self):
+        for _ in range(3):
+            enqueue("tests.record", {"label": "once"}, unique_key="once")
+        self.assertEqual(Task.objects.count(), 1)
+        run_pending()
+        enqueue("tests.record", {"label": "again"}, unique_key="once")
+        self.assertEqual(Task.objects.count(), 1)
+
+    def test_claims_do_not_overlap_and_stale_leases_requeue(self):
+        for label in range(5):
+            enqueue("tests.record", {"label": label})
+        first = claim("worker-a", limit=3)
+        second = claim("worker-b", limit=3)
+        self.assertEqual(len(first), 3)
+        self.assertEqual(len(second), 2)
+        self.assertFalse({job.pk for job in first} & {job.pk for job in second})
+        self.assertEqual(claim("worker-c"), [])
+
+        self.assertEqual(requeue_stale(), 0)
+        self.assertEqual(requeue_stale(now=timezone.now() + timedelta(hours=1)), 5)
+        self.assertEqual(run_pending(), 5)
+        self.assertEqual(sorted(calls), [0, 1, 2, 3, 4])
+
+    def test_stale_periodic_jobs_do_not_block_requeueing(self):
+        schedule_periodic()
+        enqueue("tests.record", {"label": "orphan"})
+        # A worker claims everything and dies; its replacement schedules
+        # the periodic jobs again while the old rows are still running.
+        dead = claim("dead-worker", limit=100)
+        schedule_periodic()
+        periodic = [job for job in dead if job.unique_key]
+        self.assertTrue(periodic)
+
+        self.assertEqual(requeue_stale(now=timezone.now() + timedelta(hours=1)), 1)
+        self.assertEqual(Task.objects.get(name="tests.record").status, "queued")
+        for job in periodic:
+            self.assertEqual(Task.objects.filter(unique_key=job.unique_key, status="queued").count(), 1)
+            job.refresh_from_db()
+            self.assertEqual(job.status, "failed")
+
+    def test_admin_email_is_queued(self):
+        handler = QueuedAdminEmailHandler()
+        with self.settings(ADMINS=[("Ops", "ops@example.com")]):
+            handler.send_mail("Server error", "Traceback ...")
+            self.assertEqual(len(mail.outbox), 0)
+            self.assertEqual(run_pending(names=["mail.admins"]), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn("Server error", mail.outbox[0].subject)
+
+
+# ==========================
+# Stock reservations
+# ==========================
+
+class StockReservationStressTests(TransactionTestCase):
+    """Many parallel checkouts against a small stock pool never oversell."""
+
+    buyers = 40
+
+    def setUp(self):
+        farmer = make_farmer("stress-farmer")
+        self.scarce = Product.objects.create(farmer=farmer, name="Avocado", price=Decimal("20.00"), stock=5)
+        self.plenty = Product.objects.create(farmer=farmer, name="Kale", price=Decimal("10.00"), stock=8)
+        buyer = make_user("stress-buyer")
+        self.orders = [Order.objects.create(user=buyer) for _ in range(self.buyers)]
+
+    def checkout(self, order, lines, results):
+        try:
+            for _ in range(200):
+                try:
+                    reserve_stock(order, lines)
+                    results.append("ok")
+                    return
+                except InsufficientStock:
+                    results.append("sold out")
+                    return
+                except OperationalError:
+                    # SQLite serializes writers with "database is locked";
+                    # Postgres would queue on the row lock instead.
+                    time.sleep(0.005)
+            results.append("gave up")
+        finally:
+            connection.close()
+
+    def test_parallel_checkouts(self):
+        results = []
+        threads = []
+        for i, order in enumerate(self.orders):
+            # Half the carts list the products in the opposite order.
+            lines = [(self.scarce.id, 1), (self.plenty.id, 1)]
+            if i % 2:
+                lines.reverse()
+            threads.append(threading.Thread(target=self.checkout, args=(order, lines, results)))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results.count("ok"), 5)
+        self.assertEqual(results.count("sold out"), self.buyers - 5)
+        self.scarce.refresh_from_db()
+        self.plenty.refresh_from_db()
+        self.assertEqual(self.scarce.stock, 0)
+        self.assertEqual(self.plenty.stock, 3)
+        self.assertEqual(StockReservation.objects.filter(status="held").count(), 10)
+
+    def test_cached_catalog_shows_current_stock(self):
+        url = f"/api/products/{self.scarce.id}/"
+        self.assertEqual(self.client.get(url).json()["stock"], 5)
+        reserve_stock(self.orders[0], [(self.scarce.id, 2)])
+        self.assertEqual(self.client.get(url).json()["stock"], 3)
+        release_reservations(self.orders[0])
+        self.assertEqual(self.client.get(url).json()["stock"], 5)
+
+    def test_expired_reservations_return_stock(self):
+        order = self.orders[0]
+        reserve_stock(order, [(self.scarce.id, 2)], ttl=timedelta(seconds=-1))
+        self.assertEqual(release_expired_reservations(), 1)
+        self.assertEqual(release_expired_reservations(), 0)
+        self.scarce.refresh_from_db()
+        order.refresh_from_db()
+        self.assertEqual(self.scarce.stock, 5)
+        self.assertEqual(order.status, "cancelled")
@@ -0,0 +1,192 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+logger = logging.getLogger(__name__)
+
+# ==========================
+# Shared rate-limit store
+# ==========================
+# Request counts live in a SQLite file on local disk (THROTTLE_DB), so
+# every worker process on the host counts against the same limits, which
+# the per-process locmem cache can't do. Each key has a counter for the
+# current and the previous fixed window. A request is measured against
+# ``previous * (share of the window still to come) + current``: the usual
+# sliding-window estimate, two rows per key whatever the rate. A check is
+# one short IMMEDIATE transaction on a WAL database with synchronous=OFF.
+# Losing the counts in a crash is harmless, so none of it is fsynced.
+# If the file can't be used the request is let through and logged.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hits (
+    key TEXT NOT NULL,
+    window INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    expires REAL NOT NULL,
+    PRIMARY KEY (key, window)
+) WITHOUT ROWID
+"""
+# How long a check waits for another process's transaction.
+LOCK_TIMEOUT = 0.1
+# Expired windows are deleted every this many checks per process.
+PRUNE_EVERY = 1000
+
+
+class RateLimitStore:
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self.checks = 0
+
+    def connection(self):
+        # One connection per thread, and never one inherited across a fork.
+        conn = getattr(self.local, "conn", None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=LOCK_TIMEOUT, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute(SCHEMA)
+            self.local.conn, self.local.pid = conn, os.getpid()
+        return conn
+
+    def hit(self, key, limit, duration, now=None):
+        """
+        Count a request for ``key`` against ``limit`` per ``duration``
+        seconds. Returns None when it is allowed, else the seconds until it
+        would be; refused requests aren't counted.
+        """
+        now = time.time() if now is None else now
+        window, elapsed = divmod(now / duration, 1)
+        window = int(window)
+        conn = self.connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            counts = dict(conn.execute(
+                "SELECT window, count FROM hits WHERE key = ? AND window >= ?", (key, window - 1)
+            ))
+            previous, current = counts.get(window - 1, 0), counts.get(window, 0)
+            if previous * (1 - elapsed) + current >= limit:
+                return retry_after(previous, current, limit, elapsed) * duration
+            conn.execute(
+                "INSERT INTO hits (key, window, count, expires) VALUES (?, ?, 1, ?) "
+                "ON CONFLICT (key, window) DO UPDATE SET count = count + 1",
+                (key, window, (window + 2) * duration),
+            )
+        self.checks += 1
+        if self.checks % PRUNE_EVERY == 0:
+            conn.execute("DELETE FROM hits WHERE expires < ?", (now,))
+        return None
+
+    def clear(self):
+        self.connection().execute("DELETE FROM hits")
+
+
+def retry_after(previous, current, limit, elapsed):
+    """Windows to wait until ``previous * (1 - elapsed) + current`` drops below ``limit``."""
+    if current < limit:
+        # Later in this window, as the previous one's share shrinks.
+        return 1 - (limit - current) / previous - elapsed
+    # In the next window, as this one becomes the previous.
+    return 1 - elapsed + 1 - limit / current
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store():
+    path = settings.THROTTLE_DB
+    if path not in _stores:
+        with _stores_lock:
+            _stores.setdefault(path, RateLimitStore(path))
+    return _stores[path]
+
+
+# ==========================
+# Throttles
+# ==========================
+# Each endpoint class (catalog reads, cart writes, checkout, token issue)
+# is a scope with two limits, both in REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"]:
+# ``<scope>`` per user (per IP for anonymous requests) and ``<scope>_ip``
+# per client IP, whoever is logged in. Endpoints get a scope from
+# api.urls.THROTTLE_SCOPES by URL name, or a view's ``throttle_scope``;
+# the rest aren't throttled. Refusals answer 429 with a Retry-After header.
+
+
+def get_throttle_scope(request, view=None):
+    from .urls import THROTTLE_SCOPES
+    scope = getattr(view, "throttle_scope", None)
+    if scope is None and request.resolver_match is not None:
+        scope = THROTTLE_SCOPES.get(request.resolver_match.url_name)
+    return scope
+
+
+class SharedRateThrottle(SimpleRateThrottle):
+    """SimpleRateThrottle counted in the shared store, for the endpoint's scope."""
+    scope_suffix = ""
+
+    def __init__(self):
+        # The rate depends on the endpoint; see allow_request().
+        self.wait_seconds = None
+
+    def allow_request(self, request, view):
+        scope = get_throttle_scope(request, view)
+        if not settings.THROTTLE_ENABLED or scope is None:
+            return True
+        self.scope = scope + self.scope_suffix
+        # Read per request rather than from the class, so settings changes apply.
+        self.rate = api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+        if self.rate is None:
+            return True
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        key = self.get_cache_key(request, view)
+        try:
+            self.wait_seconds = get_store().hit(key, self.num_requests, self.duration)
+        except sqlite3.Error:
+            logger.warning("Rate limit store %s unavailable, not throttling", settings.THROTTLE_DB, exc_info=True)
+            return True
+        return self.wait_seconds is None
+
+    def wait(self):
+        # At a window's edge the estimate can round to nothing; never answer
+        # Retry-After: 0 to a refused request.
+        return None if self.wait_seconds is None else max(self.wait_seconds, 1)
+
+
+class SharedUserThrottle(SharedRateThrottle):
+    """``<scope>`` per user, or per IP for anonymous requests."""
+
+    def get_cache_key(self, request, view):
+        user = getattr(request, "user", None)
+        if user is not None and user.is_authenticated:
+            return f"{self.scope}:user:{user.pk}"
+        return f"{self.scope}:anon:{self.get_ident(request)}"
+
+
+class SharedIPThrottle(SharedRateThrottle):
+    """
+    ``<scope>_ip`` per client IP: REMOTE_ADDR, or X-Forwarded-For as far as
+    REST_FRAMEWORK["NUM_PROXIES"] trusted proxies vouch for it.
+    """
+    scope_suffix = "_ip"
+
+    def get_cache_key(self, request, view):
+        return f"{self.scope}:ip:{self.get_ident(request)}"
+
+
+def throttle_wait(request):
+    """
+    For views outside DRF (api.async_views): the seconds to wait if any
+    default throttle refuses ``request``, else None.
+    """
+    waits = [
+        throttle.wait() for throttle in (cls() for cls in api_settings.DEFAULT_THROTTLE_CLASSES)
+        if not throttle.allow_request(request, None)
+    ]
+    return max(waits) if waits else None
@@ -1,7 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from . import views
+from . import async_views, views
 
 # ====================
 # Router endpoints
@@ -10,6 +10,91 @@ router = DefaultRouter()
 router.register(r'farmers', views.FarmerViewSet, basename='farmer')
 router.register(r'products', views.ProductViewSet, basename='product')
 router.register(r'orders', views.OrderViewSet, basename='order')
+
+# ====================
+# Query budgets
+# ====================
+# Max SQL queries per request, keyed by URL name, and by method where
+# writes cost more than reads (a method left out has no budget). With a
+# shared cache the JWT user and farmer come from the token's claims; budgets
+# leave one query for loading the user instead, as with a process-local
+# cache or a token issued before a change (api.auth).
+# Enforced by QueryBudgetTestMixin in tests and logged by
+# QueryCountMiddleware when QUERY_BUDGET_ENABLED is set.
+QUERY_BUDGETS = {
+    "user_info": 1,
+    "farmer-list": 2,
+    "farmer-detail": {"GET": 2, "PUT": 4, "PATCH": 4},
+    # Product writes also adjust FarmerStats and drop cart summaries; a
+    # delete clears the product's rows in five tables.
+    "product-list": {"GET": 2, "POST": 3},
+    "product-detail": {"GET": 2, "PUT": 4, "PATCH": 4, "DELETE": 9},
+    "product-facets": 3,
+    "order-list": 3,
+    "order-detail": 3,
+    "cart_items": 2,
+    "cart_summary": 2,
+    "cart_batch": 9,
+    "add_to_cart": 6,
+    "remove_from_cart": 5,
+    "update-cart-item": 5,
+    "create_order_paystack": 15,
+    "order_payment_status": 2,
+    "export_orders": 1,
+    "paystack_webhook": 2,
+    "verify_payment": 14,
+    "dashboard": 5,
+    "farmer_dashboard": 2,
+    "buyer_dashboard": 2,
+    "recent_orders": 2,
+    "sales_trend": 2,
+    "async_dashboard": 5,
+    "async_farmer_dashboard": 2,
+    "async_buyer_dashboard": 2,
+    "async_recent_orders": 2,
+    "async_sales_trend": 2,
+    "async_order_payment_status": 2,
+    "async_verify_payment": 14,
+}
+
+# The budgets above are for warm paths. The first request after a cache
+# eviction may also read the token-revocation marker (api.auth), and views
+# reading a derived row rebuild it when it is missing: a CartSummary is an
+# aggregate and an upsert (3), FarmerStats two aggregates and an upsert (4).
+# These are added on top for cold requests.
+COLD_AUTH_QUERIES = 1
+COLD_PATH_QUERIES = {
+    "cart_summary": 3,
+    "add_to_cart": 3,
+    "remove_from_cart": 3,
+    "update-cart-item": 3,
+    "dashboard": 4,
+    "farmer_dashboard": 4,
+    "async_dashboard": 4,
+    "async_farmer_dashboard": 4,
+}
+
+# ====================
+# Throttle scopes
+# ====================
+# Rate-limited endpoint classes, keyed by URL name; the limits per scope
+# are REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"] (see api.throttling).
+THROTTLE_SCOPES = {
+    "farmer-list": "catalog",
+    "farmer-detail": "catalog",
+    "product-list": "catalog",
+    "product-detail": "catalog",
+    "product-facets": "catalog",
+    "cart_batch": "cart",
+    "add_to_cart": "cart",
+    "remove_from_cart": "cart",
+    "update-cart-item": "cart",
+    "create_order_paystack": "checkout",
+    "verify_payment": "checkout",
+    "async_verify_payment": "checkout",
+    "token_obtain_pair": "token",
+    "token_refresh": "token",
+}
 # ====================
 # URL patterns
 # ====================
@@ -28,6 +113,8 @@ urlpatterns = [
     # Cart Endpoints (Buyers only)
     # --------------------
     path("cart/", views.cart_items, name="cart_items"),
+    path("cart/summary/", views.cart_summary, name="cart_summary"),
+    path("cart/batch/", views.cart_batch, name="cart_batch"),
     path("cart/add/", views.add_to_cart, name="add_to_cart"),
     path("cart/remove/<int:item_id>/", views.remove_from_cart, name="remove_from_cart"),
     path("cart/update/<int:item_id>/", views.update_cart_item, name="update-cart-item"),
@@ -36,17 +123,33 @@ urlpatterns = [
     # Paystack
     # --------------------
     path("orders/create/", views.create_order_paystack, name="create_order_paystack"),
+    path("orders/<int:order_id>/payment/", views.order_payment_status, name="order_payment_status"),
+    path("orders/export/<str:fmt>/", views.export_orders, name="export_orders"),
+    path("payments/<str:reference>/verify/", views.verify_payment, name="verify_payment"),
+    path("payments/webhook/paystack/", views.paystack_webhook, name="paystack_webhook"),
    
 
    
    
     # Dashboard
     # --------------------
+    path("dashboard/", views.dashboard, name="dashboard"),
     path("dashboard/farmer/", views.farmer_dashboard_summary, name="farmer_dashboard"),
     path("dashboard/buyer/", views.buyer_dashboard_summary, name="buyer_dashboard"),
     path("dashboard/orders/recent/", views.recent_orders, name="recent_orders"),
     path("dashboard/sales/trend/", views.sales_trend, name="sales_trend"),
 
+    # --------------------
+    # Async twins (api.async_views), for uvicorn
+    # --------------------
+    path("async/dashboard/", async_views.dashboard, name="async_dashboard"),
+    path("async/dashboard/farmer/", async_views.farmer_dashboard_summary, name="async_farmer_dashboard"),
+    path("async/dashboard/buyer/", async_views.buyer_dashboard_summary, name="async_buyer_dashboard"),
+    path("async/dashboard/orders/recent/", async_views.recent_orders, name="async_recent_orders"),
+    path("async/dashboard/sales/trend/", async_views.sales_trend, name="async_sales_trend"),
+    path("async/orders/<int:order_id>/payment/", async_views.order_payment_status, name="async_order_payment_status"),
+    path("async/payments/<str:reference>/verify/", async_views.verify_payment, name="async_verify_payment"),
+
     # --------------------
     # Include router endpoints
     # --------------------
@@ -1,18 +1,45 @@
 from rest_framework import generics, viewsets, filters
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import action, api_view, authentication_classes, permission_classes
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import BasePermission, AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.exceptions import PermissionDenied
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from datetime import datetime, timedelta
+import secrets
 from django.conf import settings
-import requests
-
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Prefetch
+from django.http import StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+
+from .auth import full_user
+from .cache import CatalogCacheMixin, cache_entry, entry_response
+from .carts import apply_cart_delta, apply_cart_operations, clear_cart_summary, get_cart_summary, summary_data, wants_minimal
+from .dashboard import (
+    ORDER_TOTALS, buyer_summary, dashboard_cache_key, dashboard_params, dashboard_queries, farmer_order_ids,
+    farmer_summary, recent_order_row, recent_orders_query, run_dashboard_queries, sales_trend_query,
+    sales_trend_rows, trend_params, user_data,
+)
+from .exports import OrderExport, export_options
+from .facets import compute_facets
+from .fieldsets import SparseFieldsViewMixin, field_selection, narrow_queryset
+from .fastpath import FastListMixin, fast_path_enabled, get_values_spec, json_response, render_json
+from .idempotency import idempotent
+from .importers import ProductImporter, detect_format, iter_rows
+from .inventory import InsufficientStock, reserve_stock
+from .outbox import enqueue_initialization
+from .pagination import OrderHistoryPagination, ProductCursorPagination
+from .payments import apply_verification, payment_status_data
+from .sales import get_farmer_stats
+from .paystack import PaystackError, PaystackUnavailable, verify_transaction
+from .search import ProductSearchFilter
 from .models import Farmer, Product, Order, OrderItem, Payment, Cart
+from .webhooks import parse_event, record_event, schedule_processing, verify_signature
 from .serializers import (
     UserSerializer, FarmerSerializer, ProductSerializer,
-    OrderSerializer, PaymentSerializer, CartSerializer
+    OrderSerializer, OrderSummarySerializer, PaymentSerializer, CartSerializer, CartBatchSerializer
 )
 
 User = get_user_model()
@@ -30,15 +57,7 @@ class RegisterView(generics.CreateAPIView):
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def user_info(request):
-    user = request.user
-    return Response({
-        "id": user.id,
-        "username": user.username,
-        "email": user.email,
-        "first_name": user.first_name,
-        "last_name": user.last_name,
-        "role": user.role
-    })
+    return Response(user_data(full_user(request.user)))
 
 
 # ==========================
@@ -58,36 +77,59 @@ def is_buyer(user):
 # Helper Functions
 # ==========================
 
-def calculate_cart_total(user):
-    items = Cart.objects.filter(user=user)
+def calculate_cart_total(user, fields=None):
+    # The lines are fetched anyway for the response, so summing them here
+    # costs no query; cart_totals() is the aggregate when only totals matter.
+    lines = Cart.objects.filter(user=user).order_by("id")
+    items = list(narrow_queryset(lines, CartSerializer, fields, extra=["product__price", "quantity"]))
     total = sum(item.product.price * item.quantity for item in items)
     return items, total
 
 
+def cart_response(request, item=None, removed_id=None):
+    """
+    The full cart after a mutation, or with ``Prefer: return=minimal`` just
+    the changed line and the new summary.
+    """
+    if wants_minimal(request):
+        line = CartSerializer(item).data if item is not None else {"id": removed_id, "removed": True}
+        return Response({"item": line, "summary": summary_data(get_cart_summary(request.user.id))})
+    items, total = calculate_cart_total(request.user)
+    return Response({"items": CartSerializer(items, many=True).data, "total": total})
+
+
 # ==========================
 # CRUD ViewSets
 # ==========================
 
-class FarmerViewSet(viewsets.ModelViewSet):
-    queryset = Farmer.objects.all()
+class FarmerViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
+    queryset = Farmer.objects.select_related("user")
     serializer_class = FarmerSerializer
     permission_classes = [IsAuthenticated]
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(CatalogCacheMixin, SparseFieldsViewMixin, FastListMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [AllowAny]
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    # ProductSearchFilter runs last so it can rank results by relevance
+    # when no explicit ?ordering= was requested.
+    filter_backends = [filters.OrderingFilter, ProductSearchFilter]
     search_fields = ["name", "description", "category"]
     ordering_fields = ["name", "price", "created_at"]
     ordering = ["name"]
+    cursor_extra_fields = ["search_rank"]
+    pagination_class = ProductCursorPagination
 
     def get_queryset(self):
         user = self.request.user
+        queryset = Product.objects.select_related("farmer")
+        category = self.request.query_params.get("category")
+        if category:
+            queryset = queryset.filter(category=category)
         if hasattr(user, "farmer"):
-            return Product.objects.filter(farmer=user.farmer)
-        return Product.objects.all()
+            return queryset.filter(farmer=user.farmer)
+        return queryset
 
     def perform_create(self, serializer):
         if hasattr(self.request.user, "farmer"):
@@ -105,80 +147,215 @@ class ProductViewSet(viewsets.ModelViewSet):
             raise PermissionDenied("You can only delete your own products")
         instance.delete()
 
+    @action(detail=False, methods=["get"])
+    def facets(self, request):
+        # Cached and ETagged under the same version/filter key as list().
+        return self.cached_response(self.get_facets, request)
+
+    def get_facets(self, request):
+        return Response(compute_facets(self.filter_queryset(self.get_queryset())))
+
+    @action(detail=False, methods=["post"], url_path="import",
+            permission_classes=[IsFarmer], parser_classes=[MultiPartParser])
+    def bulk_import(self, request):
+        upload = request.FILES.get("file")
+        if upload is None:
+            return Response({"error": "Upload a CSV or NDJSON file as 'file'"}, status=400)
+        fmt = detect_format(upload.name, request.data.get("format"))
+        importer = ProductImporter(
+            request.user.farmer,
+            dry_run=request.data.get("dry_run", "").lower() in ("1", "true"),
+        )
+        report = importer.run(iter_rows(upload.file, fmt))
+        return Response(report, status=201 if report["created"] and not report["dry_run"] else 200)
+
 
 # ==========================
 # Orders
 # ==========================
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
+    """
+    Order history, newest first and keyset-paginated. Items and their
+    products come in one prefetch query per page; ``?summary=true`` drops
+    the items for list screens and returns an ``item_count`` instead.
+    """
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = OrderHistoryPagination
+    ordering = ["-created_at"]
+    ordering_fields = ["created_at"]
 
     def get_queryset(self):
         user = self.request.user
         if hasattr(user, "farmer"):
-            return Order.objects.filter(items_product_farmer=user.farmer).distinct()
-        return Order.objects.filter(user=user)
+            orders = Order.objects.filter(pk__in=farmer_order_ids(user.farmer))
+        else:
+            orders = Order.objects.filter(user=user)
+        if self.is_summary():
+            return orders.annotate(item_count=Count("items"))
+        fields = self.get_field_selection()
+        if fields is not None and "items" not in fields:
+            return orders
+        return orders.prefetch_related(
+            Prefetch("items", queryset=OrderItem.objects.select_related("product").order_by("id"))
+        )
+
+    def get_serializer_class(self):
+        return OrderSummarySerializer if self.is_summary() else OrderSerializer
+
+    def is_summary(self):
+        return self.action == "list" and self.request.query_params.get("summary", "").lower() in ("1", "true")
 
 
 @api_view(["POST"])
 @permission_classes([AllowAny])
+@idempotent
 def create_order_paystack(request):
     if not is_buyer(request.user):
         return Response({"error": "Only buyers can create orders"}, status=403)
 
     user = request.user
-    items, total_amount = calculate_cart_total(user)
-    if not items.exists():
-        return Response({"error": "Cart is empty"}, status=400)
-
     delivery_address = request.data.get("delivery_address")
     phone_number = request.data.get("phone_number")
     notes = request.data.get("notes", "")
+    # Our own reference, so the payment exists before Paystack is contacted;
+    # the outbox initializes it after commit.
+    reference = f"ORDER-{user.id}-{secrets.token_hex(6)}"
 
-    order = Order.objects.create(
-        user=user,
-        delivery_address=delivery_address,
-        phone_number=phone_number,
-        notes=notes,
-        total_amount=total_amount,
-        status="pending"
-    )
-
-    for item in items:
-        OrderItem.objects.create(
-            order=order,
-            product=item.product,
-            quantity=item.quantity,
-            price=item.product.price
-        )
-    items.delete()
-
-    payload = {
-        "amount": int(total_amount * 100),
-        "email": user.email,
-        "callback_url": f"{settings.FRONTEND_URL}/payment-callback/",
-        "reference": f"ORDER-{order.id}-{int(datetime.now().timestamp())}"
-    }
-    headers = {
-        "Authorization": f"Bearer {settings.PAYSTACK_SECRET_KEY}",
-        "Content-Type": "application/json"
-    }
-    response = requests.post("https://api.paystack.co/transaction/initialize", json=payload, headers=headers)
-    data = response.json()
-
-    if not data.get("status"):
-        return Response({"error": "Payment initialization failed"}, status=400)
-
-    Payment.objects.create(order=order, reference=data["data"]["reference"], amount=total_amount, status="pending")
-
-    return Response({
-        "message": "Order created, proceed to STK payment",
+    try:
+        with transaction.atomic():
+            # Lines and prices in one query, inside the transaction so the
+            # order is priced from the same snapshot it is built from.
+            items = list(Cart.objects.filter(user=user).select_related("product").order_by("id"))
+            if not items:
+                return Response({"error": "Cart is empty"}, status=400)
+            total_amount = sum(item.product.price * item.quantity for item in items)
+
+            order = Order.objects.create(
+                user=user,
+                delivery_address=delivery_address,
+                phone_number=phone_number,
+                notes=notes,
+                total_amount=total_amount,
+                status="pending",
+                payment_reference=reference,
+            )
+            reserve_stock(order, [(item.product_id, item.quantity) for item in items])
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product_id=item.product_id, quantity=item.quantity, price=item.product.price)
+                for item in items
+            ])
+            Cart.objects.filter(user=user).delete()
+            clear_cart_summary(user.id)
+
+            payment = Payment.objects.create(order=order, reference=reference, amount=total_amount, status="pending")
+            enqueue_initialization(payment)
+    except InsufficientStock as exc:
+        return Response({"error": "Not enough stock", "product_id": exc.product_id}, status=409)
+
+    status_url = reverse("order_payment_status", args=[order.id])
+    response = Response({
+        "message": "Order created, payment is being initialized",
         "order_id": order.id,
-        "authorization_url": data["data"]["authorization_url"],
-        "payment_reference": data["data"]["reference"]
-    }, status=201)
+        "payment_reference": reference,
+        "status_url": status_url,
+    }, status=202)
+    response["Location"] = status_url
+    return response
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def order_payment_status(request, order_id):
+    """
+    Poll after checkout until ``status`` is ``ready`` (redirect the buyer to
+    ``authorization_url``) or ``failed`` (the items are back in the cart).
+    """
+    try:
+        payment = Payment.objects.select_related("order", "outbox").get(order_id=order_id, order__user=request.user)
+    except Payment.DoesNotExist:
+        return Response({"error": "Order not found"}, status=404)
+
+    response = Response(payment_status_data(payment))
+    if response.data["status"] == "initializing":
+        response["Retry-After"] = "1"
+    return response
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def verify_payment(request, reference):
+    """
+    Ask Paystack about a pending payment when the buyer returns from
+    checkout, instead of waiting for the webhook.
+    """
+    try:
+        payment = Payment.objects.get(reference=reference, order__user=request.user)
+    except Payment.DoesNotExist:
+        return Response({"error": "Payment not found"}, status=404)
+
+    if payment.status == "pending":
+        try:
+            data = verify_transaction(reference)
+        except PaystackUnavailable:
+            response = Response({"error": "Paystack is unavailable, try again shortly"}, status=503)
+            response["Retry-After"] = "5"
+            return response
+        except PaystackError:
+            # Not initialized at Paystack yet: still pending.
+            data = {}
+        payment.status = apply_verification(payment.pk, payment.amount, data)
+    return Response({"payment_reference": payment.reference, "payment_status": payment.status})
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def export_orders(request, fmt):
+    """
+    Stream order lines as CSV or NDJSON (see api.exports): a farmer's own
+    lines, or every farmer's (``?farmer=`` to narrow) for admins. Filters:
+    ``since``/``until`` (order dates, inclusive), ``status``; and
+    ``compress=gzip``.
+    """
+    user = request.user
+    if user.is_staff:
+        farmer_id = request.query_params.get("farmer")
+        if farmer_id and not farmer_id.isdigit():
+            return Response({"error": "farmer must be a user id"}, status=400)
+        farmer_id = int(farmer_id) if farmer_id else None
+    elif hasattr(user, "farmer"):
+        farmer_id = user.pk
+    else:
+        return Response({"error": "Only farmers and admins can export orders"}, status=403)
+
+    try:
+        export = OrderExport(fmt, farmer_id=farmer_id, **export_options(request.query_params))
+    except ValueError as exc:
+        return Response({"error": str(exc)}, status=400)
+    response = StreamingHttpResponse(export.chunks(), content_type=export.content_type)
+    response["Content-Disposition"] = f'attachment; filename="{export.filename}"'
+    return response
+
+
+@api_view(["POST"])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def paystack_webhook(request):
+    """
+    Paystack event callback. Verifies ``X-Paystack-Signature``, stores the
+    event and acknowledges; api.webhooks applies it off the request.
+    """
+    body = request.body
+    if not verify_signature(body, request.headers.get("X-Paystack-Signature", "")):
+        return Response({"error": "Invalid signature"}, status=401)
+    payload = parse_event(body)
+    if payload is None:
+        return Response({"error": "Invalid JSON"}, status=400)
+    if record_event(payload) and settings.WEBHOOK_PROCESS_ON_RECEIPT:
+        schedule_processing()
+    return Response({"status": "ok"})
 
 
 # ==========================
@@ -190,8 +367,17 @@ def create_order_paystack(request):
 def cart_items(request):
     if not is_buyer(request.user):
         return Response({"error": "Only buyers can access the cart"}, status=403)
-    items, total = calculate_cart_total(request.user)
-    return Response({"items": CartSerializer(items, many=True).data, "total": total})
+    try:
+        fields = field_selection(CartSerializer, request.query_params)
+    except ValueError as exc:
+        return Response({"error": str(exc)}, status=400)
+    if fast_path_enabled(request):
+        spec = get_values_spec(CartSerializer, fields)
+        rows = list(spec.values(Cart.objects.filter(user=request.user).order_by("id"), "product__price", "quantity"))
+        total = sum(row["product__price"] * row["quantity"] for row in rows)
+        return json_response({"items": spec.to_dicts(rows), "total": total})
+    items, total = calculate_cart_total(request.user, fields)
+    return Response({"items": CartSerializer(items, many=True, fields=fields).data, "total": total})
 
 
 @api_view(["POST"])
@@ -208,15 +394,17 @@ def add_to_cart(request):
     except Product.DoesNotExist:
         return Response({"error": "Product not found"}, status=404)
 
-    cart_item, created = Cart.objects.get_or_create(
-        user=request.user, product=product, defaults={"quantity": quantity}
-    )
-    if not created:
-        cart_item.quantity = quantity
-        cart_item.save()
+    with transaction.atomic():
+        cart_item, created = Cart.objects.get_or_create(
+            user=request.user, product=product, defaults={"quantity": quantity}
+        )
+        previous = 0 if created else cart_item.quantity
+        if not created:
+            cart_item.quantity = quantity
+            cart_item.save()
+        apply_cart_delta(request.user.id, lines=int(created), amount=product.price * (quantity - previous))
 
-    items, total = calculate_cart_total(request.user)
-    return Response({"items": CartSerializer(items, many=True).data, "total": total})
+    return cart_response(request, item=cart_item)
 
 
 @api_view(["DELETE"])
@@ -226,36 +414,83 @@ def remove_from_cart(request, item_id):
         return Response({"error": "Only buyers can remove items"}, status=403)
 
     try:
-        Cart.objects.get(id=item_id, user=request.user).delete()
+        item = Cart.objects.select_related("product").get(id=item_id, user=request.user)
     except Cart.DoesNotExist:
         return Response({"error": "Item not found"}, status=404)
 
+    with transaction.atomic():
+        item.delete()
+        apply_cart_delta(request.user.id, lines=-1, amount=-item.product.price * item.quantity)
+
+    return cart_response(request, removed_id=item_id)
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def cart_batch(request):
+    """
+    Apply a list of ``add``/``set``/``remove`` operations in one transaction
+    and return the resulting cart::
+
+        {"operations": [{"op": "add", "product_id": 3, "quantity": 2},
+                        {"op": "remove", "product_id": 7}]}
+    """
+    if not is_buyer(request.user):
+        return Response({"error": "Only buyers can modify the cart"}, status=403)
+
+    serializer = CartBatchSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    with transaction.atomic():
+        apply_cart_operations(request.user.id, serializer.validated_data["operations"])
+
     items, total = calculate_cart_total(request.user)
     return Response({"items": CartSerializer(items, many=True).data, "total": total})
 
 
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def cart_summary(request):
+    if not is_buyer(request.user):
+        return Response({"error": "Only buyers can access the cart"}, status=403)
+    return Response(summary_data(get_cart_summary(request.user.id)))
+
+
 # ==========================
 # Dashboard / Analytics
 # ==========================
 
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def dashboard(request):
+    """
+    Every dashboard section in one response (see api.dashboard). Pick some
+    with ``?sections=summary,recent_orders``; ``days``/``bucket`` apply to
+    the sales trend.
+    """
+    try:
+        sections, days, bucket = dashboard_params(request.query_params)
+    except ValueError as exc:
+        return Response({"error": str(exc)}, status=400)
+
+    key = dashboard_cache_key(request.user, sections, days, bucket)
+    entry = cache.get(key)
+    if entry is None:
+        user = request.user
+        farmer = user.farmer if hasattr(user, "farmer") else None
+        queries = dashboard_queries(user, farmer, sections, days, bucket, timezone.localdate())
+        entry = cache_entry(render_json(run_dashboard_queries(queries)))
+        cache.set(key, entry, timeout=settings.DASHBOARD_CACHE_TIMEOUT)
+    response = entry_response(request, entry)
+    response["Cache-Control"] = "private, max-age=0"
+    return response
+
+
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def recent_orders(request):
     user = request.user
-    if hasattr(user, "farmer"):
-        orders = Order.objects.filter(items_product_farmer=user.farmer).distinct().order_by("-created_at")[:5]
-    else:
-        orders = Order.objects.filter(user=user).order_by("-created_at")[:5]
-
-    return Response([
-        {
-            "id": o.id,
-            "buyer": o.user.username if o.user else "N/A",
-            "total": o.total_amount,
-            "status": o.status,
-            "date": o.created_at.strftime("%Y-%m-%d"),
-        } for o in orders
-    ])
+    farmer = user.farmer if hasattr(user, "farmer") else None
+    return Response([recent_order_row(order) for order in recent_orders_query(user, farmer)])
 
 
 @api_view(["GET"])
@@ -264,16 +499,13 @@ def sales_trend(request):
     if not hasattr(request.user, "farmer"):
         return Response([])
 
-    today = datetime.now()
-    data = []
-    for i in range(6, -1, -1):
-        day = today - timedelta(days=i)
-        total = Order.objects.filter(
-            items_product_farmer=request.user.farmer,
-            created_at__date=day.date()
-        ).aggregate(total=Sum("total_amount"))["total"] or 0
-        data.append({"date": day.strftime("%b %d"), "sales": total})
-    return Response(data)
+    try:
+        days, bucket = trend_params(request.query_params)
+    except ValueError as exc:
+        return Response({"error": str(exc)}, status=400)
+    today = timezone.localdate()
+    rows = sales_trend_query(request.user.farmer, today, days)
+    return Response(sales_trend_rows(rows, today, days, bucket))
 
 
 @api_view(["GET"])
@@ -282,12 +514,7 @@ def farmer_dashboard_summary(request):
     if not hasattr(request.user, "farmer"):
         return Response({"error": "Not a farmer"}, status=403)
 
-    farmer = request.user.farmer
-    return Response({
-        "products": Product.objects.filter(farmer=farmer).count(),
-        "orders": Order.objects.filter(items_product_farmer=farmer).count(),
-        "sales": Order.objects.filter(items_product_farmer=farmer).aggregate(total=Sum("total_amount"))["total"] or 0
-    })
+    return Response(farmer_summary(get_farmer_stats(request.user.farmer.pk)))
 
 
 @api_view(["GET"])
@@ -296,10 +523,9 @@ def buyer_dashboard_summary(request):
     if hasattr(request.user, "farmer"):
         return Response({"error": "Farmers not allowed"}, status=403)
 
-    return Response({
-        "orders": Order.objects.filter(user=request.user).count(),
-        "spent": Order.objects.filter(user=request.user).aggregate(total=Sum("total_amount"))["total"] or 0
-    })
+    return Response(buyer_summary(Order.objects.filter(user=request.user).aggregate(**ORDER_TOTALS)))
+
+
 @api_view(["PUT"])
 @permission_classes([IsAuthenticated])
 def update_cart_item(request, item_id):
@@ -307,7 +533,7 @@ def update_cart_item(request, item_id):
         return Response({"error": "Only buyers can update the cart"}, status=403)
 
     try:
-        item = Cart.objects.get(id=item_id, user=request.user)
+        item = Cart.objects.select_related("product").get(id=item_id, user=request.user)
     except Cart.DoesNotExist:
         return Response({"error": "Item not found"}, status=404)
 
@@ -315,11 +541,10 @@ def update_cart_item(request, item_id):
     if quantity is None or int(quantity) <= 0:
         return Response({"error": "Quantity must be greater than zero"}, status=400)
 
-    item.quantity = int(quantity)
-    item.save()
-
-    items = Cart.objects.filter(user=request.user)
-    serializer = CartSerializer(items, many=True)
-    total = sum(i.product.price * i.quantity for i in items)
+    with transaction.atomic():
+        previous = item.quantity
+        item.quantity = int(quantity)
+        item.save()
+        apply_cart_delta(request.user.id, amount=item.product.price * (item.quantity - previous))
 
-    return Response({"items": serializer.data, "total": total})
+    return cart_response(request, item=item)
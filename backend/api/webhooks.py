@@ -0,0 +1,141 @@
+import hashlib
+import hmac
+import json
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Payment, WebhookEvent
+from .payments import settle_payments
+from .tasks import enqueue
+
+# ==========================
+# Paystack webhooks
+# ==========================
+# Receiving an event is a signature check and one INSERT into WebhookEvent,
+# so the endpoint answers in constant time however busy the rest of the
+# pipeline is; redeliveries hit the unique ``dedupe_key`` and are dropped by
+# the same INSERT. A ``webhooks.process`` task (or the process_webhooks
+# command) applies stored events in batches: one lookup of their payments
+# by reference and one transaction per batch. ``charge.failed`` is stored
+# for the record only: the buyer may retry the reference (see api.payments).
+
+HANDLED_EVENTS = ("charge.success", "charge.failed")
+
+
+def verify_signature(body, signature):
+    if not settings.PAYSTACK_SECRET_KEY or not signature:
+        return False
+    expected = hmac.new(settings.PAYSTACK_SECRET_KEY.encode(), body, hashlib.sha512).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def parse_event(body):
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return None
+    return payload if isinstance(payload, dict) else None
+
+
+def record_event(payload):
+    """
+    Store a verified event for processing. Returns False for events we don't
+    handle or that can't be matched to a payment reference.
+    """
+    event = payload.get("event")
+    data = payload.get("data") or {}
+    reference = data.get("reference")
+    if event not in HANDLED_EVENTS or not reference:
+        return False
+    WebhookEvent.objects.bulk_create(
+        [WebhookEvent(
+            dedupe_key=f"{event}:{data.get('id') or reference}"[:150],
+            event=event,
+            reference=str(reference)[:100],
+            payload=payload,
+        )],
+        ignore_conflicts=True,
+    )
+    return True
+
+
+# ==========================
+# Processing
+# ==========================
+
+def classify(event, payment):
+    """
+    ``(payment id to settle, None)``, or with a ``("processed", note)`` to
+    record, or ``(None, (status, error))`` for ``event``.
+    """
+    if payment is None:
+        return None, ("ignored", "Unknown payment reference")
+    pk, amount, status, order_status = payment
+    if event.event == "charge.failed":
+        if status == "pending":
+            return None, ("processed", "Attempt declined; the payment stays open for a retry")
+        return None, ("processed", "")
+    charged = (event.payload.get("data") or {}).get("amount")
+    if charged != int(amount * 100):
+        return None, ("failed", f"Charged {charged}, expected {int(amount * 100)}")
+    if status != "success" and order_status == "cancelled":
+        # Settled anyway (see api.payments), but the order stays cancelled.
+        return pk, ("processed", "Charged after the order was cancelled: needs a refund")
+    return pk, None
+
+
+def process_webhook_events(limit=None):
+    """
+    Apply up to ``limit`` received events in one transaction. Returns a
+    Counter of event outcomes.
+    """
+    limit = limit or settings.WEBHOOK_BATCH_SIZE
+    events = list(WebhookEvent.objects.filter(status="received").order_by("id")[:limit])
+    if not events:
+        return Counter()
+    payments = {
+        reference: (pk, amount, status, order_status)
+        for reference, pk, amount, status, order_status in Payment.objects.filter(
+            reference__in={event.reference for event in events}
+        ).values_list("reference", "pk", "amount", "status", "order__status")
+    }
+
+    settle = []
+    outcomes = defaultdict(list)
+    for event in events:
+        payment_id, outcome = classify(event, payments.get(event.reference))
+        if payment_id is not None:
+            settle.append(payment_id)
+            outcome = outcome or ("processed", "")
+        outcomes[outcome].append(event.pk)
+
+    with transaction.atomic():
+        if settle:
+            settle_payments(settle)
+        now = timezone.now()
+        for (status, error), ids in outcomes.items():
+            WebhookEvent.objects.filter(pk__in=ids, status="received").update(
+                status=status, error=error, processed_at=now
+            )
+    counts = Counter()
+    for (status, _), ids in outcomes.items():
+        counts[status] += len(ids)
+    return counts
+
+
+def drain_webhook_events():
+    """Process batches until the queue is empty. Returns a Counter of outcomes."""
+    total = Counter()
+    while True:
+        outcomes = process_webhook_events()
+        total.update(outcomes)
+        if sum(outcomes.values()) < settings.WEBHOOK_BATCH_SIZE:
+            return total
+
+
+def schedule_processing():
+    """Queue a drain; at most one waits behind the one running."""
+    enqueue("webhooks.process", unique_key="webhooks.process")
@@ -7,6 +7,10 @@ ALLOWED_HOSTS = [os.environ.get('RENDER_EXTERNAL_HOSTNAME')]
 CSRF_TRUSTED_ORIGINS = ['https://'+os.environ.get('RENDER_EXTERNAL_HOSTNAME')]
 
 DEBUG = False
+
+# Render's load balancer appends the client's address to X-Forwarded-For;
+# per-IP throttles read that entry and nothing the client put before it.
+REST_FRAMEWORK = {**REST_FRAMEWORK, "NUM_PROXIES": int(os.environ.get("NUM_PROXIES", 1))}
 SECRET_KEY = os.environ.get('SECRET_KEY')
 
 MIDDLEWARE = [
@@ -42,6 +46,23 @@ DATABASES = {
     )
 }
 
+# Shared between gunicorn workers so a catalog write invalidates every worker.
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get("CACHE_BACKEND", "django.core.cache.backends.filebased.FileBasedCache"),
+        "LOCATION": os.environ.get("CACHE_LOCATION", "/tmp/mkulima-hub-cache"),
+    }
+}
+# Every worker reads the cache above, so a change to a user reaches them all
+# and tokens' claims can stand in for the user query. Turn this off if
+# CACHE_BACKEND points at a per-process cache.
+AUTH_TRUST_TOKEN_CLAIMS = os.environ.get("AUTH_TRUST_TOKEN_CLAIMS", "True") == "True"
+
+# Tasks aren't run by the gunicorn workers: start a Render background worker
+# with the same environment running
+#     python manage.py run_workers --settings=backend.deployment_settings
+# so sweeps and retries keep going however many web workers there are.
+TASKS_RUN_IN_PROCESS = False
 
 LOGGING = {
     'version': 1,
@@ -49,7 +70,7 @@ LOGGING = {
     'handlers': {
         'mail_admins': {
             'level': 'ERROR',
-            'class': 'django.utils.log.AdminEmailHandler',
+            'class': 'api.log.QueuedAdminEmailHandler',
         },
     },
     'loggers': {
@@ -2,6 +2,7 @@ from pathlib import Path
 import os
 from datetime import timedelta
 import dj_database_url
+from corsheaders.defaults import default_headers
 from dotenv import load_dotenv
 import cloudinary
 import cloudinary.uploader
@@ -58,9 +59,17 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
-     "corsheaders.middleware.CorsMiddleware",
+    "api.querycount.QueryCountMiddleware",
 ]
 
+# Serve read-only JSON lists through api.fastpath instead of the serializers.
+API_FAST_PATH = os.getenv("API_FAST_PATH", "True").lower() == "true"
+
+# Query budgets (see api/urls.py QUERY_BUDGETS)
+QUERY_BUDGET_ENABLED = os.getenv("QUERY_BUDGET_ENABLED", str(DEBUG)).lower() == "true"
+# A query shape repeated this many times in one request is reported as N+1.
+QUERY_REPEAT_THRESHOLD = int(os.getenv("QUERY_REPEAT_THRESHOLD", 3))
+
 # URLs & Templates
 ROOT_URLCONF = "backend.urls"
 
@@ -90,20 +99,72 @@ DATABASES = {
     )
 }
 
+# Cache
+# locmem is per-process; point CACHE_BACKEND at a shared backend (file-based,
+# memcached, redis) when running several workers so catalog invalidation is
+# seen by all of them.
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", "mkulima-hub"),
+    }
+}
+# Entries are invalidated by the catalog version counter; this TTL only
+# bounds how long orphaned entries occupy the cache.
+CATALOG_CACHE_TIMEOUT = int(os.getenv("CATALOG_CACHE_TIMEOUT", 3600))
+# The composite dashboard is cached per user and not invalidated, so keep
+# this short. Its sections query concurrently on up to this many threads
+# (PostgreSQL only; 1 turns it off).
+DASHBOARD_CACHE_TIMEOUT = int(os.getenv("DASHBOARD_CACHE_TIMEOUT", 30))
+DASHBOARD_QUERY_THREADS = int(os.getenv("DASHBOARD_QUERY_THREADS", 4))
+# Build request.user from access tokens' claims instead of a query (see
+# api.auth). Only turn this on when CACHES is shared by every worker process:
+# a change to a user made in one worker must reach the others.
+AUTH_TRUST_TOKEN_CLAIMS = os.getenv("AUTH_TRUST_TOKEN_CLAIMS", "False") == "True"
+# How long api.auth.get_cached_user keeps a user; changes drop it sooner.
+AUTH_USER_CACHE_TIMEOUT = int(os.getenv("AUTH_USER_CACHE_TIMEOUT", 60))
+# Request rate limits are counted in this SQLite file, shared by every
+# worker process on the host, so keep it on local disk (see api.throttling).
+THROTTLE_ENABLED = os.getenv("THROTTLE_ENABLED", "True").lower() == "true"
+THROTTLE_DB = os.getenv("THROTTLE_DB", str(BASE_DIR / "throttle.sqlite3"))
+
 # Authentication & Permissions
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "api.auth.ClaimsJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": (
         "rest_framework.permissions.AllowAny",
     ),
+    # Per endpoint class: "<scope>" per user (per IP when anonymous) and
+    # "<scope>_ip" per client IP. Endpoints are assigned in api.urls.
+    "DEFAULT_THROTTLE_CLASSES": (
+        "api.throttling.SharedUserThrottle",
+        "api.throttling.SharedIPThrottle",
+    ),
+    "DEFAULT_THROTTLE_RATES": {
+        "catalog": os.getenv("THROTTLE_CATALOG", "120/min"),
+        "catalog_ip": os.getenv("THROTTLE_CATALOG_IP", "600/min"),
+        "cart": os.getenv("THROTTLE_CART", "60/min"),
+        "cart_ip": os.getenv("THROTTLE_CART_IP", "300/min"),
+        "checkout": os.getenv("THROTTLE_CHECKOUT", "10/min"),
+        "checkout_ip": os.getenv("THROTTLE_CHECKOUT_IP", "60/min"),
+        "token": os.getenv("THROTTLE_TOKEN", "10/min"),
+        "token_ip": os.getenv("THROTTLE_TOKEN_IP", "30/min"),
+    },
+    # Proxies in front of the app whose X-Forwarded-For entries are trusted.
+    # 0 keys per-IP limits on REMOTE_ADDR; anything the client sends in the
+    # header is ignored, so it can't pick a fresh IP for each request.
+    "NUM_PROXIES": int(os.getenv("NUM_PROXIES", 0)),
 }
 
 
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=30),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
+    # Tokens carry the user's role and farm (see api.auth).
+    "TOKEN_OBTAIN_SERIALIZER": "api.auth.ClaimsTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "api.auth.ClaimsTokenRefreshSerializer",
 }
 
 # Password Validation
@@ -129,5 +190,41 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # CORS Settings
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
+# Cart writes send "Prefer: return=minimal" and checkout an Idempotency-Key.
+CORS_ALLOW_HEADERS = (*default_headers, "prefer", "idempotency-key")
 PAYSTACK_SECRET_KEY = os.getenv("PAYSTACK_SECRET_KEY")
+PAYSTACK_BASE_URL = os.getenv("PAYSTACK_BASE_URL", "https://api.paystack.co")
+# Where a transaction's access code is paid, for ones found already created.
+PAYSTACK_CHECKOUT_URL = os.getenv("PAYSTACK_CHECKOUT_URL", "https://checkout.paystack.com")
+PAYSTACK_CONNECT_TIMEOUT = float(os.getenv("PAYSTACK_CONNECT_TIMEOUT", 3.05))
+PAYSTACK_READ_TIMEOUT = float(os.getenv("PAYSTACK_READ_TIMEOUT", 10))
+PAYSTACK_MAX_RETRIES = int(os.getenv("PAYSTACK_MAX_RETRIES", 3))
+PAYSTACK_POOL_SIZE = int(os.getenv("PAYSTACK_POOL_SIZE", 10))
+# Async views share one client per event loop, so it may open more.
+PAYSTACK_ASYNC_MAX_CONNECTIONS = int(os.getenv("PAYSTACK_ASYNC_MAX_CONNECTIONS", 100))
+# Checkout queues Paystack initialization in api.outbox and a
+# payments.initialize task to send it; failed sends are retried backing off
+# from PAYMENT_OUTBOX_BACKOFF seconds, until PAYMENT_OUTBOX_MAX_ATTEMPTS.
+PAYMENT_OUTBOX_BACKOFF = float(os.getenv("PAYMENT_OUTBOX_BACKOFF", 2))
+PAYMENT_OUTBOX_MAX_ATTEMPTS = int(os.getenv("PAYMENT_OUTBOX_MAX_ATTEMPTS", 8))
+# Paystack webhooks are stored on receipt and applied in batches of
+# WEBHOOK_BATCH_SIZE by a webhooks.process task, queued on receipt and
+# every minute.
+WEBHOOK_PROCESS_ON_RECEIPT = os.getenv("WEBHOOK_PROCESS_ON_RECEIPT", "True").lower() == "true"
+WEBHOOK_BATCH_SIZE = int(os.getenv("WEBHOOK_BATCH_SIZE", 500))
+# Background tasks (api.tasks). ``manage.py run_workers`` runs them in
+# separate processes, which have to be started alongside the web server.
+# TASKS_RUN_IN_PROCESS instead runs a worker thread in each web process, for
+# a single-process dev server where nothing else is running. Failed tasks retry
+# backing off from TASK_BACKOFF seconds; a task running longer than
+# TASK_LEASE seconds is assumed lost with its worker and queued again.
+TASKS_RUN_IN_PROCESS = os.getenv("TASKS_RUN_IN_PROCESS", "False").lower() == "true"
+TASK_BACKOFF = float(os.getenv("TASK_BACKOFF", 5))
+TASK_LEASE = int(os.getenv("TASK_LEASE", 300))
+TASK_POLL_INTERVAL = float(os.getenv("TASK_POLL_INTERVAL", 1))
+# Seconds a stored Idempotency-Key response is replayed for.
+IDEMPOTENCY_KEY_TTL = int(os.getenv("IDEMPOTENCY_KEY_TTL", 24 * 3600))
+# Seconds checkout holds stock for an unpaid order before
+# release_expired_reservations gives it back.
+STOCK_RESERVATION_TTL = int(os.getenv("STOCK_RESERVATION_TTL", 900))
 FRONTEND_URL = "http://localhost:"
\ No newline at end of file
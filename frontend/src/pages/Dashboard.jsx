@@ -29,47 +29,19 @@ function Dashboard() {
 
   const navigate = useNavigate();
 
-  // Fetch user info
+  // Fetch everything the dashboard shows in one request
   useEffect(() => {
-    const fetchUser = async () => {
-      try {
-        const res = await api.get("/api/user/info/", {
-          headers: { Authorization: `Bearer ${token}` },
-        });
-        setUser(res.data);
-      } catch (err) {
-        console.error("Error fetching user info:", err);
-      }
-    };
-    if (token) fetchUser();
-  }, [token]);
+    if (!token) return;
 
-  // Fetch dashboard data
-  useEffect(() => {
-    if (!user) return;
-
-    const fetchData = async () => {
+    const fetchDashboard = async () => {
       try {
-        const endpoint =
-          user.role === "farmer" ? "/api/dashboard/farmer/" : "/api/dashboard/buyer/";
-        const res = await api.get(endpoint, {
+        const res = await api.get("/api/dashboard/", {
           headers: { Authorization: `Bearer ${token}` },
         });
-        setData(res.data);
-
-        // Recent Orders
-        const ordersRes = await api.get("/dashboard/orders/recent/", {
-          headers: { Authorization: `Bearer ${token}` },
-        });
-        setOrders(ordersRes.data);
-
-        // Sales Trend (only for farmers)
-        if (user.role === "farmer") {
-          const salesRes = await api.get("/dashboard/sales/trend/", {
-            headers: { Authorization: `Bearer ${token}` },
-          });
-          setSalesTrend(salesRes.data);
-        }
+        setUser(res.data.user);
+        setData(res.data.summary);
+        setOrders(res.data.recent_orders);
+        setSalesTrend(res.data.sales_trend);
       } catch (err) {
         console.error("Error fetching dashboard data:", err);
       } finally {
@@ -77,8 +49,8 @@ function Dashboard() {
       }
     };
 
-    fetchData();
-  }, [user, token]);
+    fetchDashboard();
+  }, [token]);
 
   // Handle product form submit
   const handleAddProduct = async (e) => {
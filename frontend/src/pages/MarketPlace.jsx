@@ -6,18 +6,25 @@ import ProductCard from "../components/ProductCard";
 
 function MarketPlace() {
   const [products, setProducts] = useState([]);
+  const [nextPage, setNextPage] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
+  const [categoryCounts, setCategoryCounts] = useState({});
   const [searchQuery, setSearchQuery] = useState("");
   const [filterType, setFilterType] = useState("all");
   const [sortBy, setSortBy] = useState("name");
-  const [cartItems, setCartItems] = useState([]);
+  const [cartCount, setCartCount] = useState(0);
   const navigate = useNavigate();
   const { user } = useContext(AuthContext);
 
+  useEffect(() => {
+    fetchFacets();
+  }, [searchQuery]);
+
   useEffect(() => {
     fetchProducts();
     if (user) {
-      fetchCartItems();
+      fetchCartSummary();
     }
   }, [searchQuery, filterType, sortBy]);
 
@@ -32,11 +39,12 @@ function MarketPlace() {
         params.category = filterType;
       }
       if (sortBy) {
-        params.sort = sortBy;
+        params.ordering = orderingFor[sortBy] || "name";
       }
 
       const res = await api.get("/api/products/", { params });
-      setProducts(res.data);
+      setProducts(res.data.results);
+      setNextPage(res.data.next);
     } catch (error) {
       console.error("Failed to fetch products:", error);
     } finally {
@@ -44,12 +52,41 @@ function MarketPlace() {
     }
   };
 
-  const fetchCartItems = async () => {
+  const fetchFacets = async () => {
+    try {
+      const params = searchQuery ? { search: searchQuery } : {};
+      const res = await api.get("/api/products/facets/", { params });
+      const counts = { all: res.data.total };
+      res.data.categories.forEach((c) => {
+        counts[c.value] = c.count;
+      });
+      setCategoryCounts(counts);
+    } catch (error) {
+      console.error("Failed to fetch facets:", error);
+    }
+  };
+
+  // The API pages with an opaque cursor; `next` is a ready-to-use URL.
+  const fetchMoreProducts = async () => {
+    if (!nextPage) return;
+    setLoadingMore(true);
+    try {
+      const res = await api.get(nextPage);
+      setProducts((prev) => [...prev, ...res.data.results]);
+      setNextPage(res.data.next);
+    } catch (error) {
+      console.error("Failed to fetch more products:", error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  const fetchCartSummary = async () => {
     try {
-      const res = await api.get("/api/cart/");
-      setCartItems(res.data.items);
+      const res = await api.get("/api/cart/summary/");
+      setCartCount(res.data.item_count);
     } catch (error) {
-      console.error("Failed to fetch cart items:", error);
+      console.error("Failed to fetch cart summary:", error);
     }
   };
 
@@ -61,15 +98,26 @@ function MarketPlace() {
     }
 
     try {
-      await api.post("/api/cart/add/", { product_id: productId, quantity: 1 });
+      const res = await api.post(
+        "/api/cart/add/",
+        { product_id: productId, quantity: 1 },
+        { headers: { Prefer: "return=minimal" } }
+      );
+      setCartCount(res.data.summary.item_count);
       alert("Item added to cart successfully!");
-      fetchCartItems(); 
     } catch (error) {
       console.error("Failed to add to cart:", error);
       alert("Failed to add item to cart. Please try again.");
     }
   };
 
+  const orderingFor = {
+    name: "name",
+    price_low: "price",
+    price_high: "-price",
+    newest: "-created_at",
+  };
+
   const productCategories = ["all", "fruits", "vegetables", "cereals", "legumes", "tubers", "others"];
   const sortOptions = [
     { value: "name", label: "Name" },
@@ -85,7 +133,7 @@ function MarketPlace() {
         {user && (
           <div className="flex items-center space-x-4">
             <span className="text-gray-600">
-              Cart: {cartItems.length} items
+              Cart: {cartCount} items
             </span>
             <button
               onClick={() => navigate("/cart")}
@@ -125,6 +173,7 @@ function MarketPlace() {
               {productCategories.map(category => (
                 <option key={category} value={category}>
                   {category.charAt(0).toUpperCase() + category.slice(1)}
+                  {categoryCounts[category] !== undefined && ` (${categoryCounts[category]})`}
                 </option>
               ))}
             </select>
@@ -199,6 +248,18 @@ function MarketPlace() {
               </div>
             )}
           </div>
+
+          {nextPage && (
+            <div className="text-center mt-8">
+              <button
+                onClick={fetchMoreProducts}
+                disabled={loadingMore}
+                className="bg-green-600 text-white px-6 py-2 rounded-md hover:bg-green-700 transition disabled:opacity-50"
+              >
+                {loadingMore ? "Loading..." : "Load More"}
+              </button>
+            </div>
+          )}
         </>
       )}
     </div>